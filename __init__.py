@@ -1,3 +1,6 @@
-from .chat_bubble_nodes import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS
+from .chat_bubble_nodes import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS, PREWARM_ENABLED, start_prewarm
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
+
+if PREWARM_ENABLED:
+    start_prewarm()
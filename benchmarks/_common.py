@@ -0,0 +1,46 @@
+import os
+import sys
+import importlib.util
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_PATH = os.path.join(REPO_DIR, "test_languages.txt")
+
+# test_languages.txt中的章节标题与font_config.json语言名称的对应关系
+SAMPLE_LANGUAGES = {
+    "English": "英文",
+    "Simplified Chinese": "简体中文",
+    "Traditional Chinese": "繁体中文",
+    "Japanese": "日文",
+    "Korean": "韩文",
+    "Russian": "俄文",
+    "Arabic": "阿拉伯文",
+    "Hindi": "印地文",
+    "Thai": "泰文",
+}
+
+
+def load_package(name="chat_bubbles"):
+    """不依赖ComfyUI，直接以包的形式导入本仓库（节点模块使用相对导入）"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(REPO_DIR, "__init__.py"), submodule_search_locations=[REPO_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_samples(path=SAMPLES_PATH):
+    """读取test_languages.txt，返回[(语言名称, 文本)]列表"""
+    samples = []
+    language = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("## "):
+                heading = line[3:].split(" (")[0]
+                language = SAMPLE_LANGUAGES.get(heading)
+            elif line and language:
+                samples.append((language, line))
+    return samples
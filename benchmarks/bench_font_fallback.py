@@ -0,0 +1,56 @@
+"""
+字体回退基准：字体覆盖索引的建立/加载耗时，以及长篇混排消息的字体片段切分与渲染耗时。
+
+用法: python benchmarks/bench_font_fallback.py [--repeat 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from _common import load_package
+
+MIXED = "Hello Привет สวัสดี नमस्ते مرحبا 123! "
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode
+    from chat_bubbles.font_fallback import CoverageIndex, resolve_font
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_path = os.path.join(temp_dir, "font_coverage.json")
+        start = time.perf_counter()
+        index = CoverageIndex(cache_path=cache_path)
+        index.fallback_paths(index.font_files()[0])
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = CoverageIndex(cache_path=cache_path)
+        index.fallback_paths(index.font_files()[0])
+        loaded = time.perf_counter() - start
+    print(f"字体数: {len(index.font_files())}，建立索引 {built * 1000:.1f}ms，从缓存文件加载 {loaded * 1000:.1f}ms")
+
+    node = TextBubbleNode()
+    font = node._load_font("英文", 48)
+    print(f"{'消息字符数':>10}{'片段数':>8}{'切分毫秒':>10}{'每千字符微秒':>14}")
+    for count in (1, 10, 100, 1000):
+        text = MIXED * count
+        chain = resolve_font(font, text)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            runs = chain.runs(text)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{len(text):>10}{len(runs):>8}{elapsed * 1000:>10.3f}{elapsed * 1e6 * 1000 / len(text):>14.1f}")
+
+    start = time.perf_counter()
+    node.create_bubble(MIXED * 4, "普通", "#B19CD9", "#000000", "右侧", "是", 24, 400, 20, 2, "英文")
+    print(f"混排气泡渲染: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+字体内存基准：模拟多进程部署，每个工作进程渲染全部语言的气泡，报告每个进程的字体内存（Linux）。
+
+用法: python benchmarks/bench_font_memory.py [--workers 16] [--scales 1,2] [--subset]
+"""
+import os
+import argparse
+import multiprocessing
+
+from _common import load_package, load_samples
+
+_FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+
+def read_memory():
+    """
+    读取当前进程的内存（KB）：rss/pss/private来自smaps_rollup；
+    font_rss/font_pss为映射的字体文件页面，同一文件的页面由所有进程共享，pss按共享进程数均分。
+    """
+    memory = {"rss": 0, "pss": 0, "private": 0, "font_rss": 0, "font_pss": 0, "font_maps": 0}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] == "Rss:":
+                memory["rss"] = int(parts[1])
+            elif parts[0] == "Pss:":
+                memory["pss"] = int(parts[1])
+            elif parts[0] in ("Private_Clean:", "Private_Dirty:"):
+                memory["private"] += int(parts[1])
+    in_font = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            parts = line.split()
+            if "-" in parts[0] and len(parts) >= 5:
+                # 映射的标题行：地址范围、权限、偏移、设备、inode[、路径]
+                in_font = len(parts) >= 6 and parts[5].lower().endswith(_FONT_EXTENSIONS)
+                memory["font_maps"] += in_font
+            elif in_font and parts[0] == "Rss:":
+                memory["font_rss"] += int(parts[1])
+            elif in_font and parts[0] == "Pss:":
+                memory["font_pss"] += int(parts[1])
+    return memory
+
+
+def _worker(args):
+    """渲染每种语言的样例文本，返回渲染前后的内存"""
+    index, scales, subset, barrier, queue = args
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode, TextBubbleBatchNode
+
+    node = TextBubbleNode()
+    samples = dict(load_samples())
+    before = read_memory()
+    languages = node._get_language_options()
+    for scale in scales:
+        if subset:
+            # 批量节点按批次生成只含用到字符的子集字体
+            messages = [{"text": samples.get(language, samples["英文"]), "language": language} for language in languages]
+            TextBubbleBatchNode()._render_messages(messages, "普通", "#B19CD9", "#E8E8E8", "#000000", "是", 24, 400, 20,
+                                                   scale, languages[0], 字体子集="按批次")
+        else:
+            for language in languages:
+                node._render_image(samples.get(language, samples["英文"]), "普通", "#B19CD9", "#000000", "右侧", "是",
+                                   24, 400, 20, scale, language)
+    # 所有进程都完成渲染后再读取，pss才能反映共享的字体页面
+    barrier.wait()
+    after = read_memory()
+    queue.put((index, before, after))
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--scales", default="1,2", help="图像分辨率列表，字号24乘以分辨率")
+    parser.add_argument("--subset", action="store_true", help="使用按批次生成的子集字体（需要fontTools）")
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.font_cache import get_font_cache
+    # 在fork之前导入依赖，子进程共享这部分内存，差值只包含字体与渲染
+    from chat_bubbles.lazy_import import load_all
+    load_all()
+    scales = [int(value) for value in args.scales.split(",")]
+
+    config = get_font_cache().get_config() or {}
+    missing = [lang["font"] for lang in config.get("languages", [])
+               if not os.path.exists(os.path.join(os.path.dirname(get_font_cache().config_path), lang["font"]))]
+    print(f"工作进程: {args.workers}，语言: {len(config.get('languages', []))}，字号: {[24 * s for s in scales]}"
+          f"{'，子集字体' if args.subset else ''}")
+    if missing:
+        print(f"缺少的字体文件（这些语言改用回退字体）: {', '.join(sorted(set(missing)))}")
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(args.workers)
+    queue = context.Queue()
+    processes = [context.Process(target=_worker, args=((i, scales, args.subset, barrier, queue),))
+                 for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    results = sorted(queue.get() for _ in processes)
+    for process in processes:
+        process.join()
+
+    print(f"{'进程':>4}{'RSS增量':>10}{'私有增量':>10}{'字体映射':>10}{'字体RSS':>10}{'字体PSS':>10}")
+    totals = {"rss": 0, "private": 0, "font_pss": 0}
+    for index, before, after in results:
+        rss = after["rss"] - before["rss"]
+        private = after["private"] - before["private"]
+        totals["rss"] += rss
+        totals["private"] += private
+        totals["font_pss"] += after["font_pss"]
+        print(f"{index:>4}{rss:>10}{private:>10}{after['font_maps']:>10}{after['font_rss']:>10}{after['font_pss']:>10}")
+    count = len(results)
+    print(f"\n平均每进程: RSS增量 {totals['rss'] / count / 1024:.1f}MB，私有内存增量 {totals['private'] / count / 1024:.1f}MB，"
+          f"字体文件PSS {totals['font_pss'] / count / 1024:.2f}MB")
+    print(f"{count}个进程合计私有内存增量: {totals['private'] / 1024:.1f}MB")
+    print("字体映射 = 映射的字体文件区域数（FreeType按路径打开时每个字体对象映射一次文件，页面由所有进程共享）。")
+
+
+if __name__ == "__main__":
+    main()
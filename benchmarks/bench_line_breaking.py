@@ -0,0 +1,60 @@
+"""
+断行测量基准：对比旧的textwrap字符数估算与按像素断行的测量调用次数。
+
+用法: python benchmarks/bench_line_breaking.py [--size 24] [--width 400] [--scale 1]
+"""
+import argparse
+import textwrap
+
+from _common import load_package, load_samples
+
+
+def legacy_layout(text, font, font_size, width):
+    """旧实现：按字符数估算断行，测量与绘制时各调用一次getbbox"""
+    lines = textwrap.wrap(text, width=int(width / (font_size * 0.6)))
+    widest = max((font.getbbox(line)[2] - font.getbbox(line)[0] for line in lines), default=0)
+    return lines, len(lines) * 2, widest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=24)
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    package = load_package()
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode
+    from chat_bubbles.font_cache import get_font_cache
+    from chat_bubbles import text_layout
+
+    node = TextBubbleNode()
+    font_size = args.size * args.scale
+    width = args.width * args.scale
+
+    print(f"{'语言':<8}{'旧:行数':>8}{'旧:测量':>8}{'旧:最宽':>8}"
+          f"{'新:行数':>8}{'新:首次测量':>12}{'新:再次测量':>12}{'新:最宽':>8}")
+    for language, text in load_samples():
+        font = get_font_cache().get_font(node._get_font_for_language(language), font_size)
+        old_lines, old_calls, old_widest = legacy_layout(text, font, font_size, width)
+
+        text_layout.clear_layout_cache()
+        lines = text_layout.wrap_text(text, font, width)
+        boxes = text_layout.measure_lines(lines, font)
+        cold = text_layout.layout_stats()
+        text_layout.wrap_text(text, font, width)
+        text_layout.measure_lines(lines, font)
+        warm = text_layout.layout_stats()
+
+        cold_calls = cold["advance_calls"] + cold["bbox_calls"]
+        warm_calls = (warm["advance_calls"] - cold["advance_calls"]) + (warm["bbox_calls"] - cold["bbox_calls"])
+        widest = max((box[2] - box[0] for box in boxes), default=0)
+        print(f"{language:<8}{len(old_lines):>8}{old_calls:>8}{old_widest:>8}"
+              f"{len(lines):>8}{cold_calls:>12}{warm_calls:>12}{widest:>8}")
+
+    print(f"\n最大文本宽度: {width}px。旧实现按字符数估算，行宽与目标偏差较大（宽字形会溢出）；新实现保证不超过。")
+    print("新:再次测量 = 片段宽度缓存命中后每个气泡剩余的测量调用（每行一次getbbox）。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+渲染基准矩阵：不启动ComfyUI，直接调用TextBubbleNode.create_bubble，遍历全部气泡样式、左右位置、
+是否显示尾巴、分辨率1~4以及font_config.json中的所有语言，输出JSON格式的延迟(p50/p99)、吞吐量、
+峰值RSS和tracemalloc峰值，并将每个组合的输出与golden.json中的像素哈希比对。
+
+用法: python benchmarks/bench_matrix.py [--repeat 3] [--output result.json] [--baseline old.json]
+                                        [--update-golden] [--resolutions 1 2] [--languages 英文 简体中文]
+"""
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from _common import load_package, load_samples
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+
+STYLES = ["普通", "特殊一", "特殊二", "特殊三"]
+SIDES = ["右侧", "左侧"]
+TAILS = ["是", "否"]
+RESOLUTIONS = [1, 2, 3, 4]
+
+# test_languages.txt中没有样例的语言使用的文本
+EXTRA_SAMPLES = {
+    "西班牙语": "¡Hola! ¿Cómo estás hoy? Este es un texto de ejemplo en español.",
+}
+
+
+def peak_rss_bytes():
+    """进程的峰值常驻内存，不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def summarize(timings):
+    """timings为毫秒列表，返回p50/p99/平均值与每秒渲染数"""
+    total = sum(timings)
+    return {
+        "renders": len(timings),
+        "p50_ms": percentile(timings, 50),
+        "p99_ms": percentile(timings, 99),
+        "mean_ms": total / len(timings) if timings else None,
+        "throughput_per_s": len(timings) / (total / 1000) if total else None,
+    }
+
+
+def pixel_hash(tensor):
+    """输出张量的形状与像素内容的哈希"""
+    array = np.ascontiguousarray(tensor.numpy())
+    digest = hashlib.sha256(str(array.shape).encode("ascii"))
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def library_versions():
+    import PIL
+    import torch
+    from PIL import features
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "freetype": features.version("freetype2"),
+        "raqm": features.version("raqm"),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合计时的次数")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=RESOLUTIONS)
+    parser.add_argument("--languages", nargs="+", default=None, help="默认使用font_config.json中的全部语言")
+    parser.add_argument("--output", default=None, help="结果JSON的保存路径，默认输出到标准输出")
+    parser.add_argument("--baseline", default=None, help="之前保存的结果JSON，打印p50/p99的变化")
+    parser.add_argument("--update-golden", action="store_true", help="用本次输出重写golden.json")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.bubble_logging import set_log_level
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode
+
+    # 缺失字体等警告会在每个组合重复出现，基准运行时只保留错误输出
+    set_log_level("error")
+    node = TextBubbleNode()
+    languages = args.languages or node._get_language_options()
+    samples = dict(EXTRA_SAMPLES)
+    for language, text in load_samples():
+        samples.setdefault(language, text)
+    default_text = samples.get("英文", "Hello! How are you today?")
+
+    golden = {}
+    if os.path.exists(args.golden) and not args.update_golden:
+        with open(args.golden, "r", encoding="utf-8") as f:
+            golden = json.load(f)
+    expected_hashes = golden.get("hashes", {})
+    if golden and golden.get("versions") != library_versions():
+        print("警告: golden.json生成时的库版本与当前环境不同，像素比对可能失败", file=sys.stderr)
+
+    groups = {"resolution": {}, "style": {}, "language": {}}
+    timings = []
+    hashes = {}
+    mismatches = []
+    alloc_peak = 0
+
+    combos = list(itertools.product(STYLES, SIDES, TAILS, args.resolutions, languages))
+    start_all = time.perf_counter()
+    for style, side, tail, scale, language in combos:
+        params = dict(文本内容=samples.get(language, default_text), 气泡样式=style, 气泡背景颜色="#B19CD9",
+                      文本颜色="#000000", 发送者位置=side, 显示尾巴=tail, 字体大小=24, 气泡宽度=400,
+                      内边距=20, 图像分辨率=scale, 语言=language)
+        key = f"{style}|{side}|{tail}|{scale}|{language}"
+
+        # 第一次调用预热字体与形状缓存，同时用tracemalloc统计分配峰值并检查像素
+        tracemalloc.start()
+        outputs = node.create_bubble(**params)
+        alloc_peak = max(alloc_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        hashes[key] = pixel_hash(outputs[0])
+        if key in expected_hashes and expected_hashes[key] != hashes[key]:
+            mismatches.append(key)
+
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            node.create_bubble(**params)
+            elapsed = (time.perf_counter() - start) * 1000
+            timings.append(elapsed)
+            groups["resolution"].setdefault(str(scale), []).append(elapsed)
+            groups["style"].setdefault(style, []).append(elapsed)
+            groups["language"].setdefault(language, []).append(elapsed)
+    wall = time.perf_counter() - start_all
+
+    rss = peak_rss_bytes()
+    result = {
+        "meta": {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": library_versions(),
+            "repeat": args.repeat,
+            "combinations": len(combos),
+            "wall_s": wall,
+        },
+        "summary": dict(summarize(timings),
+                        peak_rss_bytes=rss,
+                        tracemalloc_peak_bytes=alloc_peak),
+        "by_resolution": {name: summarize(values) for name, values in groups["resolution"].items()},
+        "by_style": {name: summarize(values) for name, values in groups["style"].items()},
+        "by_language": {name: summarize(values) for name, values in groups["language"].items()},
+        "golden": {
+            "checked": sum(1 for key in hashes if key in expected_hashes),
+            "missing": sum(1 for key in hashes if key not in expected_hashes),
+            "mismatches": mismatches,
+        },
+    }
+
+    if args.update_golden:
+        with open(args.golden, "w", encoding="utf-8") as f:
+            json.dump({"versions": library_versions(), "hashes": hashes}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"已更新 {args.golden}（{len(hashes)} 个组合）", file=sys.stderr)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for metric in ("p50_ms", "p99_ms", "throughput_per_s"):
+            old, new = baseline["summary"].get(metric), result["summary"].get(metric)
+            if old and new:
+                print(f"{metric}: {old:.2f} -> {new:.2f} ({(new / old - 1) * 100:+.1f}%)", file=sys.stderr)
+
+    if mismatches:
+        print(f"像素比对失败: {len(mismatches)} 个组合的输出与golden.json不同", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
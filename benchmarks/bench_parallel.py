@@ -0,0 +1,80 @@
+"""
+并行渲染基准：渲染500条消息的批次，对比顺序渲染与线程/进程模式在1~N个工作者下的耗时与加速比，并校验输出一致。
+
+用法: python benchmarks/bench_parallel.py [--messages 500] [--max-workers N] [--resolution 2] [--modes 线程 进程]
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+
+from _common import load_package, load_samples
+
+
+def build_script(count):
+    """用test_languages.txt的英文与中文样例轮流生成左右交替的消息列表"""
+    samples = [(language, text) for language, text in load_samples() if language in ("英文", "简体中文")]
+    messages = []
+    for i in range(count):
+        language, text = samples[i % len(samples)]
+        messages.append({"text": text, "side": "左侧" if i % 2 else "右侧", "language": language})
+    return json.dumps(messages, ensure_ascii=False)
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... 直到max_workers（包含max_workers本身）"""
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--resolution", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", default=["线程", "进程"])
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.chat_bubble_nodes import TextBubbleBatchNode
+    from chat_bubbles.parallel import process_mode_available, shutdown_executors
+
+    node = TextBubbleBatchNode()
+    script = build_script(args.messages)
+
+    def run(mode, workers):
+        start = time.perf_counter()
+        batch, _ = node.create_bubbles(script, "普通", "#B19CD9", "#E8E8E8", "#000000", "是", 24, 400, 20,
+                                       args.resolution, "英文", "2倍超采样", 文本渲染="FreeType",
+                                       并行模式=mode, 工作数=workers)
+        return time.perf_counter() - start, batch
+
+    # 预热字体与形状缓存，之后以顺序渲染作为基准
+    run("关闭", 1)
+    baseline, expected = run("关闭", 1)
+    print(f"CPU核数: {os.cpu_count()}，消息数: {args.messages}，分辨率: {args.resolution}")
+    print(f"{'模式':<6}{'工作数':>6}{'耗时秒':>10}{'加速比':>8}{'输出一致':>8}")
+    print(f"{'顺序':<6}{1:>6}{baseline:>10.2f}{1.0:>8.2f}{'是':>8}")
+
+    for mode in args.modes:
+        if mode == "进程" and not process_mode_available():
+            print("当前平台不支持fork，跳过进程模式")
+            continue
+        for workers in worker_counts(args.max_workers):
+            # 第一次调用包含线程/进程池启动与字体加载，只计第二次
+            run(mode, workers)
+            elapsed, batch = run(mode, workers)
+            same = "是" if torch.equal(batch, expected) else "否"
+            print(f"{mode:<6}{workers:>6}{elapsed:>10.2f}{baseline / elapsed:>8.2f}{same:>8}")
+    shutdown_executors()
+
+
+if __name__ == "__main__":
+    main()
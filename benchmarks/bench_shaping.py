@@ -0,0 +1,52 @@
+"""
+整形基准：对比阿拉伯文、印地文等文本首次整形与命中整形缓存后的断行耗时。
+
+用法: python benchmarks/bench_shaping.py [--size 24] [--width 400] [--repeat 200]
+"""
+import argparse
+import time
+
+from _common import load_package, load_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=24)
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode
+    from chat_bubbles.font_cache import get_font_cache
+    from chat_bubbles.font_fallback import resolve_font
+    from chat_bubbles import text_shaping
+
+    node = TextBubbleNode()
+    print(f"raqm: {'可用' if text_shaping.has_raqm() else '不可用（使用纯Python整形与双向重排）'}")
+    print(f"{'语言':<8}{'行数':>6}{'从右到左':>8}{'首次(ms)':>10}{'缓存(ms)':>10}{'缓存命中':>8}")
+    for language, text in load_samples():
+        font = resolve_font(get_font_cache().get_font(node._get_font_for_language(language), args.size), text)
+
+        cold = 0.0
+        for _ in range(args.repeat):
+            text_shaping.clear_shaping_cache()
+            start = time.perf_counter()
+            lines, directions = text_shaping.shape_lines(text, font, args.width)
+            cold += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            text_shaping.shape_lines(text, font, args.width)
+        warm = time.perf_counter() - start
+
+        print(f"{language:<8}{len(lines):>6}{'是' if any(directions) else '否':>8}"
+              f"{cold / args.repeat * 1000:>10.3f}{warm / args.repeat * 1000:>10.3f}"
+              f"{text_shaping.shaping_stats()['run_hits']:>8}")
+
+    print("\n首次 = 每次清空整形缓存后的断行与整形；缓存 = 整形结果命中缓存后只剩断行（片段宽度同样已缓存）。")
+    print("不需要整形的文字（拉丁、CJK、泰文等）直接断行，不使用整形缓存。")
+
+
+if __name__ == "__main__":
+    main()
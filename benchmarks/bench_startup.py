@@ -0,0 +1,64 @@
+"""
+启动耗时基准：在全新的子进程中测量导入节点包、首次与重复调用各节点INPUT_TYPES的耗时，
+并列出导入后已加载的重量级依赖（torch、numpy、PIL）。
+
+用法: python benchmarks/bench_startup.py [--runs 5] [--calls 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# 在子进程中执行的测量代码，结果以JSON输出
+PROBE = r"""
+import json, sys, time
+sys.path.insert(0, {bench_dir!r})
+start = time.perf_counter()
+from _common import load_package
+package = load_package()
+import_ms = (time.perf_counter() - start) * 1000
+
+classes = list(dict.fromkeys(package.NODE_CLASS_MAPPINGS.values()))
+start = time.perf_counter()
+for cls in classes:
+    cls.INPUT_TYPES()
+first_ms = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+for _ in range({calls}):
+    for cls in classes:
+        cls.INPUT_TYPES()
+repeat_us = (time.perf_counter() - start) * 1e6 / ({calls} * len(classes))
+
+heavy = [name for name in ("torch", "numpy", "PIL.Image", "PIL.ImageFont") if name in sys.modules]
+print(json.dumps({{"import_ms": import_ms, "first_ms": first_ms, "repeat_us": repeat_us, "heavy": heavy}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    code = PROBE.format(bench_dir=os.path.dirname(os.path.abspath(__file__)), calls=args.calls)
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    def median(key):
+        return float(np.median([result[key] for result in results]))
+
+    print(f"子进程次数: {args.runs}")
+    print(f"导入节点包: {median('import_ms'):.1f}ms")
+    print(f"首次调用全部节点的INPUT_TYPES: {median('first_ms'):.2f}ms")
+    print(f"重复调用INPUT_TYPES: 每次 {median('repeat_us'):.1f}µs")
+    print(f"导入后已加载的重量级依赖: {', '.join(results[-1]['heavy']) or '无'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+PIL→张量转换基准：对比旧的多次拷贝转换与单次分配转换在各分辨率下的耗时与峰值内存。
+
+用法: python benchmarks/bench_tensor_conversion.py [--repeat 20]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from _common import load_package
+
+TEXT = "Hello! How are you today? This is a sample text in English to test the chat bubble functionality."
+
+
+def legacy_convert(img):
+    """旧实现：uint8拷贝、float32转换、除法、整图拷贝以及全图min/max统计"""
+    bubble_np = np.array(img).astype(np.float32) / 255.0
+    np.min(bubble_np), np.max(bubble_np)
+    bubble_rgba = bubble_np.copy()
+    return torch.from_numpy(bubble_rgba)[None,]
+
+
+def measure(convert, img, repeat):
+    """返回(中位耗时毫秒, 峰值分配字节)"""
+    convert(img)
+    tracemalloc.start()
+    convert(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(img)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    load_package()
+    from chat_bubbles.chat_bubble_nodes import TextBubbleNode, _image_to_tensor
+
+    node = TextBubbleNode()
+    print(f"{'分辨率':<6}{'尺寸':>12}{'旧:毫秒':>10}{'旧:峰值MB':>12}{'新:毫秒':>10}{'新:峰值MB':>12}")
+    for scale in range(1, 5):
+        font = node._load_font("英文", 24 * scale)
+        img = node._render_bubble(TEXT, "普通", (177, 156, 217, 255), (0, 0, 0), True, True,
+                                  font, 24 * scale, 400 * scale, 20 * scale, scale)
+        assert torch.equal(legacy_convert(img), _image_to_tensor(img)), "转换结果与旧实现不一致"
+
+        old_ms, old_peak = measure(legacy_convert, img, args.repeat)
+        new_ms, new_peak = measure(_image_to_tensor, img, args.repeat)
+        size = f"{img.width}x{img.height}"
+        print(f"{scale:<6}{size:>12}{old_ms:>10.2f}{old_peak / 2**20:>12.2f}{new_ms:>10.2f}{new_peak / 2**20:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
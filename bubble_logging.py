@@ -0,0 +1,45 @@
+import os
+
+# 日志级别，数值越大越重要；off表示关闭所有输出
+LOG_LEVELS = {
+    "debug": 10,
+    "info": 20,
+    "warning": 30,
+    "error": 40,
+    "off": 100,
+}
+
+# 默认只输出警告和错误，逐次渲染的调试信息需要显式开启
+_level = LOG_LEVELS.get(os.environ.get("CHAT_BUBBLE_LOG_LEVEL", "warning").lower(), LOG_LEVELS["warning"])
+
+
+def set_log_level(level):
+    """设置日志级别，可以是级别名称（debug/info/warning/error/off）或数值"""
+    global _level
+    if isinstance(level, str):
+        level = LOG_LEVELS[level.lower()]
+    _level = int(level)
+
+
+def get_log_level():
+    return _level
+
+
+def debug_enabled():
+    """调试输出是否开启，用于跳过只为调试而做的计算"""
+    return _level <= LOG_LEVELS["debug"]
+
+
+def log_debug(message):
+    if _level <= LOG_LEVELS["debug"]:
+        print(message)
+
+
+def log_info(message):
+    if _level <= LOG_LEVELS["info"]:
+        print(message)
+
+
+def log_warning(message):
+    if _level <= LOG_LEVELS["warning"]:
+        print(message)
@@ -0,0 +1,369 @@
+import os
+import math
+import threading
+from collections import OrderedDict, namedtuple
+from .lazy_import import lazy_module
+from .instrumentation import count
+
+Image = lazy_module("PIL.Image")
+ImageChops = lazy_module("PIL.ImageChops")
+ImageDraw = lazy_module("PIL.ImageDraw")
+
+# 各样式的几何参数，单位为逻辑像素（分辨率为1时的像素），绘制时乘以图像分辨率。
+# tail:
+#   "corner"   尾巴从气泡底角斜向伸出，points为相对(右边缘, 下边缘)的三角形顶点（接收者水平镜像）
+#   "triangle" 尾巴从侧边伸出的三角形，span为尾巴根部占气泡高度的比例（自下而上），
+#              tip为尖端的高度比例（自下而上，默认0.5即侧边中部）
+#   "curve"    与triangle相同位置的二次贝塞尔曲线尾巴
+# body_shift: 左侧（接收者）气泡主体是否右移一个尾巴宽度，为侧边尾巴留出空间
+# 主题（themes.json）中自定义的形状以"主题名/右侧"等名称通过register_styles注册
+BUBBLE_STYLES = {
+    "普通": {
+        "radius": 15,
+        "tail": "corner",
+        "points": ((-15, -20), (40, 35), (-60, 0)),
+        "body_shift": False,
+    },
+    "特殊一": {
+        "radius": 8,
+        "tail": "triangle",
+        "tail_width": 20,
+        "span": (1 / 4, 3 / 4),
+        "body_shift": True,
+    },
+    "特殊二": {
+        "radius": 25,
+        "tail": "curve",
+        "tail_width": 25,
+        "span": (1 / 3, 2 / 3),
+        "body_shift": True,
+    },
+    "特殊三": {
+        "radius": 15,
+        "tail": "triangle",
+        "tail_width": 20,
+        "span": (1 / 3, 2 / 3),
+        "body_shift": True,
+    },
+}
+
+# 抗锯齿选项与形状遮罩的超采样倍数
+ANTIALIAS_MODES = {
+    "关闭": 1,
+    "2倍超采样": 2,
+    "4倍超采样": 4,
+}
+
+# 曲线尾巴的采样段数
+CURVE_SEGMENTS = 10
+
+# 形状遮罩缓存的默认字节预算（MB），可通过环境变量调整
+DEFAULT_SHAPE_CACHE_BYTES = int(os.environ.get("CHAT_BUBBLE_SHAPE_CACHE_MB", "64")) * 1024 * 1024
+
+BubbleGeometry = namedtuple("BubbleGeometry", ["body", "radius", "tail"])
+
+# 主题注册的形状，与内置样式同样按名称查找
+_theme_styles = {}
+
+
+def register_styles(styles):
+    """替换主题注册的形状；形状定义发生变化时清空形状遮罩缓存，避免按名称复用旧的遮罩"""
+    global _theme_styles
+    if styles == _theme_styles:
+        return
+    _theme_styles = dict(styles)
+    _shape_cache.clear()
+
+
+def style_spec(style):
+    """返回样式的几何参数，未知样式使用普通样式"""
+    spec = BUBBLE_STYLES.get(style) or _theme_styles.get(style)
+    if spec is None and isinstance(style, str) and "/" in style:
+        # 进程池中的工作进程可能还没有加载主题，按需读取themes.json
+        from .themes import get_theme_cache
+        get_theme_cache().get_entries()
+        spec = _theme_styles.get(style)
+    return spec or BUBBLE_STYLES["普通"]
+
+
+def bubble_geometry(style, width, height, is_sender, show_tail, scale, margin=0):
+    """
+    计算气泡形状（已缩放后的像素坐标）。
+    body为主体矩形(左, 上, 右, 下)，radius为圆角半径，tail为尾巴多边形顶点列表（无尾巴时为None）。
+    width/height为已缩放后的气泡主体尺寸，scale为图像分辨率，margin为画布四周的额外边距。
+    """
+    spec = style_spec(style)
+    radius = spec["radius"] * scale
+    if spec["tail"] == "curve":
+        # 高度圆润的样式，圆角不超过高度的一半
+        radius = min(radius, height // 2 - 2)
+    radius = max(radius, 0)
+
+    left = margin
+    if spec["body_shift"] and not is_sender:
+        left += spec["tail_width"] * scale
+    top = margin
+    right = left + width
+    bottom = top + height
+    body = (left, top, right, bottom)
+
+    if not show_tail:
+        return BubbleGeometry(body, radius, None)
+
+    if spec["tail"] == "corner":
+        if is_sender:
+            tail = [(right + dx * scale, bottom + dy * scale) for dx, dy in spec["points"]]
+        else:
+            tail = [(left - dx * scale, bottom + dy * scale) for dx, dy in spec["points"]]
+        return BubbleGeometry(body, radius, tail)
+
+    # 侧边尾巴：根部位于右边缘（发送者）或左边缘（接收者）
+    edge = right if is_sender else left
+    direction = 1 if is_sender else -1
+    low, high = spec["span"]
+    start = (edge, bottom - height * low)
+    tip = (edge + direction * spec["tail_width"] * scale, bottom - height * spec.get("tip", 0.5))
+    end = (edge, bottom - height * high)
+
+    if spec["tail"] == "triangle":
+        return BubbleGeometry(body, radius, [start, tip, end])
+
+    # 二次贝塞尔曲线尾巴，tip为控制点
+    tail = [start]
+    for i in range(1, CURVE_SEGMENTS):
+        t = i / CURVE_SEGMENTS
+        x = (1 - t) ** 2 * start[0] + 2 * (1 - t) * t * tip[0] + t ** 2 * end[0]
+        y = (1 - t) ** 2 * start[1] + 2 * (1 - t) * t * tip[1] + t ** 2 * end[1]
+        tail.append((x, y))
+    tail.append(end)
+    return BubbleGeometry(body, radius, tail)
+
+
+def shape_bounds(geometry):
+    """
+    返回形状实际覆盖的像素范围(左, 上, 右, 下)，右/下为开区间。
+    主体矩形包含右/下边界像素，尾巴按贴图的取整方式计算，与draw_shape_mask绘制的范围一致。
+    """
+    left, top, right, bottom = [int(round(v)) for v in geometry.body]
+    bounds = [left, top, right + 1, bottom + 1]
+    if geometry.tail:
+        bounds[0] = min(bounds[0], int(math.floor(min(x for x, _ in geometry.tail))))
+        bounds[1] = min(bounds[1], int(math.floor(min(y for _, y in geometry.tail))))
+        bounds[2] = max(bounds[2], int(math.ceil(max(x for x, _ in geometry.tail))) + 1)
+        bounds[3] = max(bounds[3], int(math.ceil(max(y for _, y in geometry.tail))) + 1)
+    return tuple(bounds)
+
+
+def place_geometry(style, width, height, is_sender, show_tail, scale):
+    """
+    计算气泡形状并平移到恰好容纳主体与尾巴的画布中，返回(几何, 画布尺寸)。
+    各样式的尾巴伸出范围不同（例如普通样式的尾巴向外伸出40、向下伸出35逻辑像素），
+    画布按shape_bounds的结果分配，既不裁掉尾巴也不留多余的透明边。
+    """
+    geometry = bubble_geometry(style, width, height, is_sender, show_tail, scale)
+    left, top, right, bottom = shape_bounds(geometry)
+    # 只做整数平移，尾巴顶点的小数部分不变，尾巴贴图缓存仍然可以复用
+    body = tuple(v - offset for v, offset in zip(geometry.body, (left, top, left, top)))
+    tail = [(x - left, y - top) for x, y in geometry.tail] if geometry.tail else None
+    return BubbleGeometry(body, geometry.radius, tail), (right - left, bottom - top)
+
+
+def _corner_sprites(radius, supersample):
+    """生成四个方向的圆角覆盖率贴图（左上、右上、左下、右下），每个为radius×radius"""
+    k = supersample
+    patch = Image.new('L', (radius * k, radius * k), 0)
+    ImageDraw.Draw(patch).ellipse([(0, 0), (radius * 2 * k - 1, radius * 2 * k - 1)], fill=255)
+    if k > 1:
+        patch = patch.resize((radius, radius), Image.BOX)
+    return (
+        patch,
+        patch.transpose(Image.FLIP_LEFT_RIGHT),
+        patch.transpose(Image.FLIP_TOP_BOTTOM),
+        patch.transpose(Image.ROTATE_180),
+    )
+
+
+def _tail_sprite(points, supersample):
+    """将尾巴多边形绘制为独立的小贴图，返回(贴图, 左上角坐标)"""
+    k = supersample
+    origin_x = int(math.floor(min(x for x, _ in points)))
+    origin_y = int(math.floor(min(y for _, y in points)))
+    width = int(math.ceil(max(x for x, _ in points))) - origin_x + 1
+    height = int(math.ceil(max(y for _, y in points))) - origin_y + 1
+
+    patch = Image.new('L', (width * k, height * k), 0)
+    offset = (k - 1) / 2
+    ImageDraw.Draw(patch).polygon(
+        [((x - origin_x) * k + offset, (y - origin_y) * k + offset) for x, y in points], fill=255)
+    if k > 1:
+        patch = patch.resize((width, height), Image.BOX)
+    return patch, (origin_x, origin_y)
+
+
+def draw_shape_mask(geometry, size, supersample=1, sprites=None):
+    """
+    将气泡几何绘制为L模式的覆盖率遮罩。
+    主体由矩形填充与四个圆角贴图拼成，尾巴单独绘制为贴图后取最大值合并；
+    supersample大于1时贴图在放大后绘制并用BOX滤波缩小，得到抗锯齿边缘。
+    sprites为可选的贴图缓存（ShapeMaskCache），提供时圆角与尾巴贴图会被复用。
+    """
+    mask = Image.new('L', size, 0)
+
+    # PIL的矩形坐标包含右/下边界像素
+    left, top, right, bottom = [int(round(v)) for v in geometry.body]
+    radius = min(int(round(geometry.radius)), (right - left + 1) // 2, (bottom - top + 1) // 2)
+
+    if radius > 0:
+        mask.paste(255, (left + radius, top, right - radius + 1, bottom + 1))
+        mask.paste(255, (left, top + radius, left + radius, bottom - radius + 1))
+        mask.paste(255, (right - radius + 1, top + radius, right + 1, bottom - radius + 1))
+
+        if sprites is not None:
+            corners = sprites.get_sprite(("corner", radius, supersample), _corner_sprites, radius, supersample)
+        else:
+            corners = _corner_sprites(radius, supersample)
+        top_left, top_right, bottom_left, bottom_right = corners
+        mask.paste(top_left, (left, top))
+        mask.paste(top_right, (right - radius + 1, top))
+        mask.paste(bottom_left, (left, bottom - radius + 1))
+        mask.paste(bottom_right, (right - radius + 1, bottom - radius + 1))
+    else:
+        mask.paste(255, (left, top, right + 1, bottom + 1))
+
+    if geometry.tail:
+        if sprites is not None:
+            # 以尾巴相对自身左上角的形状作为键，相同样式与高度的气泡共用同一贴图
+            origin_x = math.floor(min(x for x, _ in geometry.tail))
+            origin_y = math.floor(min(y for _, y in geometry.tail))
+            shape = tuple((round(x - origin_x, 3), round(y - origin_y, 3)) for x, y in geometry.tail)
+            patch, (dx, dy) = sprites.get_sprite(("tail", shape, supersample), _tail_sprite,
+                                                 [(x + 0.0, y + 0.0) for x, y in shape], supersample)
+            position = (origin_x + dx, origin_y + dy)
+        else:
+            patch, position = _tail_sprite(geometry.tail, supersample)
+        box = (position[0], position[1], position[0] + patch.width, position[1] + patch.height)
+        mask.paste(ImageChops.lighter(mask.crop(box), patch), position)
+
+    return mask
+
+
+class ShapeMaskCache:
+    """
+    进程级形状遮罩缓存：完整遮罩按(样式, 发送者, 尾巴, 宽, 高, 分辨率, 超采样)做LRU，受字节预算限制；
+    圆角与尾巴贴图单独缓存，即使气泡尺寸各不相同也不需要重新绘制圆弧。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_SHAPE_CACHE_BYTES, max_sprites=1024):
+        self.max_bytes = max(0, max_bytes)
+        self.max_sprites = max_sprites
+        self._lock = threading.Lock()
+        self._masks = OrderedDict()
+        self._sprites = {}
+        self._bytes = 0
+        self._counters = {
+            "mask_hits": 0,
+            "mask_misses": 0,
+            "mask_evictions": 0,
+            "sprite_hits": 0,
+            "sprite_misses": 0,
+        }
+
+    def get_mask(self, style, width, height, is_sender, show_tail, scale, supersample):
+        """
+        返回缓存的形状遮罩，未命中时用贴图拼出并放入缓存（返回的遮罩不能被修改）。
+        遮罩尺寸即place_geometry计算的画布尺寸。
+        """
+        key = (style, is_sender, show_tail, width, height, scale, supersample)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                self._counters["mask_hits"] += 1
+                count("shape_cache_hits")
+                return mask
+
+        geometry, size = place_geometry(style, width, height, is_sender, show_tail, scale)
+        mask = draw_shape_mask(geometry, size, supersample, sprites=self)
+        nbytes = mask.width * mask.height
+        count("shape_cache_misses")
+
+        with self._lock:
+            self._counters["mask_misses"] += 1
+            if nbytes <= self.max_bytes and key not in self._masks:
+                self._masks[key] = mask
+                self._bytes += nbytes
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._masks.popitem(last=False)
+                    self._bytes -= evicted.width * evicted.height
+                    self._counters["mask_evictions"] += 1
+        return mask
+
+    def get_sprite(self, key, build, *args):
+        """返回缓存的圆角/尾巴贴图，数量超过上限时整体清空"""
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._counters["sprite_hits"] += 1
+                return sprite
+
+        sprite = build(*args)
+
+        with self._lock:
+            self._counters["sprite_misses"] += 1
+            if len(self._sprites) >= self.max_sprites:
+                self._sprites.clear()
+            self._sprites[key] = sprite
+        return sprite
+
+    def set_max_bytes(self, max_bytes):
+        """调整遮罩缓存的字节预算，超出部分立即淘汰"""
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            while self._bytes > self.max_bytes and self._masks:
+                _, evicted = self._masks.popitem(last=False)
+                self._bytes -= evicted.width * evicted.height
+                self._counters["mask_evictions"] += 1
+
+    def stats(self):
+        """返回命中/未命中计数以及当前占用的字节数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["masks_cached"] = len(self._masks)
+            stats["sprites_cached"] = len(self._sprites)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def clear(self):
+        """清空遮罩与贴图缓存，并重置计数"""
+        with self._lock:
+            self._masks.clear()
+            self._sprites.clear()
+            self._bytes = 0
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+# 全局共享的形状遮罩缓存实例
+_shape_cache = ShapeMaskCache()
+
+
+def get_shape_cache():
+    """获取进程级共享的形状遮罩缓存"""
+    return _shape_cache
+
+
+def shape_cache_stats():
+    """获取形状遮罩缓存的命中统计"""
+    return _shape_cache.stats()
+
+
+def fill_mask(mask, color):
+    """
+    用纯色填充遮罩，返回RGBA图像。
+    遮罩覆盖的像素RGB为气泡颜色（边缘不会变暗），alpha为覆盖率乘以颜色的alpha；未覆盖的像素全透明。
+    """
+    r, g, b, a = color
+    bands = [mask.point([0] + [value] * 255) for value in (r, g, b)]
+    bands.append(mask.point([(v * a + 127) // 255 for v in range(256)]) if a != 255 else mask)
+    return Image.merge('RGBA', bands)
@@ -1,10 +1,43 @@
 import os
-import numpy as np
-import torch
-from PIL import Image, ImageDraw, ImageFont, ImageColor
-import textwrap
-import datetime
 import json
+import math
+import itertools
+import threading
+import time
+from .font_cache import FONT_DIR, get_font_cache
+from .font_manager import SUBSET_MODES, get_font_manager
+from .text_layout import measure_lines
+from .text_shaping import LAYOUT_DIRECTIONS, has_raqm, shape_lines
+from .bubble_shapes import ANTIALIAS_MODES, fill_mask, get_shape_cache, place_geometry, style_spec
+from .render_cache import CACHE_MODES, get_render_cache, render_key
+from .parallel import PARALLEL_MODES, render_parallel
+from .glyph_atlas import TEXT_BACKENDS, draw_lines
+from .font_fallback import resolve_font, draw_text, get_coverage_index
+from .bubble_logging import log_debug, log_info, log_warning, debug_enabled
+from .lazy_import import lazy_module, load_all
+from .instrumentation import stage, count, collect, format_stats
+from .svg_export import SVG_OUTPUT_MODES, FONT_REFERENCE_MODES, bubble_svg, parse_svg_params, save_svg
+from .transcript import DEFAULT_SCHEMA, is_transcript_file, iter_transcript, iter_messages
+from .themes import NO_THEME, get_theme_cache, parse_color
+
+# torch、numpy与PIL在第一次渲染时才导入，注册节点和获取INPUT_TYPES不需要它们
+np = lazy_module("numpy")
+torch = lazy_module("torch")
+Image = lazy_module("PIL.Image")
+ImageDraw = lazy_module("PIL.ImageDraw")
+ImageFont = lazy_module("PIL.ImageFont")
+
+# 设置CHAT_BUBBLE_PREWARM=1后，注册节点时在后台线程预先导入依赖并加载各语言的常用字号字体
+PREWARM_ENABLED = os.environ.get("CHAT_BUBBLE_PREWARM", "0").lower() in ("1", "true", "yes")
+# 预热的字号：文本聊天气泡与聊天对话默认参数下缩放后的字号
+PREWARM_FONT_SIZES = (24 * 4, 24 * 2)
+
+# 聊天动画未指定输出目录时，输出的float32帧序列允许占用的内存（MB），超出时改为写入磁盘
+MAX_ANIMATION_MEMORY_MB = int(os.environ.get("CHAT_BUBBLE_ANIMATION_MEMORY_MB", "2048"))
+# 超出上述内存上限时帧序列写入的目录，每次执行使用一个以时间命名的子目录
+DEFAULT_ANIMATION_DIR = os.environ.get(
+    "CHAT_BUBBLE_ANIMATION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "animation"))
 
 class TextBubbleNode:
     """
@@ -30,29 +63,60 @@ class TextBubbleNode:
                 "图像分辨率": ("INT", {"default": 4, "min": 1, "max": 4, "step": 1}),
                 "语言": (languages, {"default": "简体中文"}),
             },
+            "optional": {
+                "预乘Alpha": (["否", "是"], {"default": "否"}),
+                "抗锯齿": (list(ANTIALIAS_MODES), {"default": "关闭"}),
+                "渲染缓存": (CACHE_MODES, {"default": "关闭"}),
+                "文本渲染": (TEXT_BACKENDS, {"default": "FreeType"}),
+                "裁剪到内容": (["否", "是"], {"default": "否"}),
+                "输出模式": (SVG_OUTPUT_MODES, {"default": "位图"}),
+                "字体引用": (FONT_REFERENCE_MODES, {"default": "文件路径"}),
+                "SVG保存路径": ("STRING", {"default": ""}),
+                "主题": (cls._get_theme_options(), {"default": NO_THEME}),
+                "布局方向": (LAYOUT_DIRECTIONS, {"default": "从左到右"}),
+                "输出统计": (["否", "是"], {"default": "否"}),
+            },
         }
     
+    @classmethod
+    def IS_CHANGED(cls, 预乘Alpha="否", 渲染缓存="关闭", **kwargs):
+        """返回渲染参数（含字体文件修改时间）的内容哈希，参数和字体都未变化时ComfyUI会跳过执行"""
+        # 图像等连线输入由ComfyUI按上游节点判断是否变化，这里只对基本类型参数求哈希
+        params = {name: value for name, value in kwargs.items() if isinstance(value, (str, int, float, bool))}
+        return "|".join((cls()._render_key(**params), 预乘Alpha))
+    
     @classmethod
     def _get_language_options(cls):
         """获取所有可用的语言选项"""
-        # 配置文件路径
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "font_config.json")
-        
         # 默认语言列表，以防配置文件不存在
         default_languages = ["简体中文", "English"]
         
-        # 如果配置文件存在，从中读取语言列表
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return [lang["name"] for lang in config["languages"]]
-            except Exception as e:
-                print(f"无法加载语言配置文件: {e}")
+        # 语言列表与配置一同缓存，ComfyUI反复请求INPUT_TYPES时只需检查一次文件修改时间
+        try:
+            languages = get_font_cache().get_languages()
+        except Exception as e:
+            log_warning(f"无法加载语言配置文件: {e}")
+        else:
+            if languages is not None:
+                return languages
                 
         return default_languages
     
-    RETURN_TYPES = ("IMAGE",)
+    def _mirror_layout(self, 布局方向, 语言):
+        """布局方向为从右到左，或为自动且语言配置的direction为rtl时，气泡左右镜像"""
+        if 布局方向 == "自动":
+            config = get_font_cache().get_config() or {}
+            return any(lang.get("name") == 语言 and lang.get("direction") == "rtl"
+                       for lang in config.get("languages", []))
+        return 布局方向 == "从右到左"
+    
+    @classmethod
+    def _get_theme_options(cls):
+        """获取主题选项：第一项为"无"，其余为themes.json中的预设"""
+        return get_theme_cache().get_names()
+    
+    RETURN_TYPES = ("IMAGE", "IMAGE", "MASK", "STRING", "STRING")
+    RETURN_NAMES = ("气泡图像", "RGB图像", "遮罩", "统计信息", "SVG")
     FUNCTION = "create_bubble"
     CATEGORY = "聊天气泡"
     
@@ -68,17 +132,17 @@ class TextBubbleNode:
             # 如果是RGB、RGBA格式的元组或列表
             if isinstance(color_str, (tuple, list)):
                 if len(color_str) == 3:
-                    return color_str + (255,)  # 添加Alpha通道
+                    return tuple(color_str) + (255,)  # 添加Alpha通道
                 elif len(color_str) == 4:
-                    return color_str
+                    return tuple(color_str)
                 else:
                     return default_color
             
             # 如果是以#开头的16进制颜色
             elif isinstance(color_str, str) and color_str.startswith('#'):
+                # 解析结果按字符串缓存，同一颜色在整个进程内只解析一次
                 try:
-                    rgba = ImageColor.getrgb(color_str) + (255,) if len(ImageColor.getrgb(color_str)) == 3 else ImageColor.getrgb(color_str)
-                    return rgba
+                    return parse_color(color_str)
                 except ValueError:
                     return default_color
             
@@ -87,44 +151,40 @@ class TextBubbleNode:
                 return default_color
                 
         except Exception as e:
-            print(f"颜色转换错误: {e}")
+            log_warning(f"颜色转换错误: {e}")
             return default_color
     
     def _get_font_for_language(self, language):
         """根据选择的语言返回对应的字体文件路径"""
-        # 配置文件路径
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "font_config.json")
-        font_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+        font_dir = FONT_DIR
         
         # 默认字体
         default_font = "NotoSansSC-Regular.ttf"
         
-        # 如果配置文件存在，从中读取语言-字体映射
-        if os.path.exists(config_path):
+        # 从共享缓存读取语言-字体映射
+        config = get_font_cache().get_config()
+        if config is not None:
             try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    
-                    # 寻找匹配的语言配置
-                    for lang in config["languages"]:
-                        if lang["name"] == language:
-                            font_file = lang["font"]
-                            font_path = os.path.join(font_dir, font_file)
-                            
-                            # 检查字体文件是否存在
-                            if os.path.exists(font_path):
-                                return font_path
-                            else:
-                                print(f"字体文件不存在: {font_path}，将使用系统字体")
-                                break
-                    
-                    # 如果找不到匹配的语言，使用回退字体
-                    fallback_font = config.get("fallback_font", default_font)
-                    fallback_path = os.path.join(font_dir, fallback_font)
-                    if os.path.exists(fallback_path):
-                        return fallback_path
+                # 寻找匹配的语言配置
+                for lang in config["languages"]:
+                    if lang["name"] == language:
+                        font_file = lang["font"]
+                        font_path = os.path.join(font_dir, font_file)
+                        
+                        # 检查字体文件是否存在
+                        if os.path.exists(font_path):
+                            return font_path
+                        else:
+                            log_warning(f"字体文件不存在: {font_path}，将使用系统字体")
+                            break
+                
+                # 如果找不到匹配的语言，使用回退字体
+                fallback_font = config.get("fallback_font", default_font)
+                fallback_path = os.path.join(font_dir, fallback_font)
+                if os.path.exists(fallback_path):
+                    return fallback_path
             except Exception as e:
-                print(f"加载字体配置文件失败: {e}")
+                log_warning(f"加载字体配置文件失败: {e}")
         
         # 如果无法从配置文件获取字体，使用系统字体
         if os.name == 'nt':  # Windows
@@ -140,436 +200,1235 @@ class TextBubbleNode:
             
         return system_font
     
-    def create_bubble(self, 文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言):
+    def create_bubble(self, 文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, 预乘Alpha="否", 抗锯齿="关闭", 渲染缓存="关闭",
+                      文本渲染="FreeType", 裁剪到内容="否", 输出模式="位图", 字体引用="文件路径", SVG保存路径="", 主题=NO_THEME,
+                      布局方向="从左到右", 输出统计="否"):
+        theme = get_theme_cache().get_theme(主题)
+        if theme is not None:
+            # 主题按发送者位置提供气泡样式、气泡颜色与文本颜色
+            side = theme.sides["右侧" if 发送者位置 == "右侧" else "左侧"]
+            气泡样式, 气泡背景颜色, 文本颜色 = side.style, side.bubble_color, side.text_color
+        if self._mirror_layout(布局方向, 语言):
+            # 从右到左的布局中气泡左右镜像，尾巴随之换到另一侧
+            发送者位置 = "左侧" if 发送者位置 == "右侧" else "右侧"
+        
+        args = (文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言,
+                预乘Alpha, 抗锯齿, 渲染缓存, 文本渲染, 裁剪到内容)
+        if 输出统计 != "是":
+            return self._create_outputs(args, 输出模式, 字体引用, SVG保存路径)
+        
+        # 只收集本次调用的各阶段耗时与计数，以JSON字符串输出并写一行info日志
+        with collect() as recorder:
+            outputs = self._create_outputs(args, 输出模式, 字体引用, SVG保存路径)
+        stats = format_stats(recorder.stats())
+        log_info(f"聊天气泡统计: {stats}")
+        return outputs[:3] + (stats,) + outputs[4:]
+    
+    def _create_outputs(self, args, 输出模式, 字体引用, SVG保存路径):
+        """按输出模式生成位图与SVG，返回(RGBA图像, RGB图像, 遮罩, 统计信息, SVG)，统计信息由调用方填写"""
+        svg = ""
+        if 输出模式 != "位图":
+            with stage("svg"):
+                svg = self._create_svg(*args, 字体引用=字体引用)
+            if SVG保存路径.strip():
+                save_svg(svg, SVG保存路径.strip())
+        
+        if 输出模式 == "仅SVG":
+            # 最终尺寸留到栅格化时再决定，位图输出只是1×1的透明占位
+            images = (torch.zeros((1, 1, 1, 4)), torch.zeros((1, 1, 1, 3)), torch.zeros((1, 1, 1)))
+        else:
+            images = self._create_bubble(*args)
+        return images + ("", svg)
+    
+    def _create_bubble(self, 文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言,
+                       预乘Alpha, 抗锯齿, 渲染缓存, 文本渲染, 裁剪到内容="否"):
+        """渲染单个气泡，返回(RGBA图像, RGB图像, 遮罩)三个张量"""
+        use_cache = 渲染缓存 != "关闭"
+        use_disk = 渲染缓存 == "内存+磁盘"
+        
+        if use_cache:
+            # 相同输入的气泡直接复用缓存的像素，跳过全部绘制步骤
+            key = self._render_key(文本内容=文本内容, 气泡样式=气泡样式, 气泡背景颜色=气泡背景颜色, 文本颜色=文本颜色,
+                                   发送者位置=发送者位置, 显示尾巴=显示尾巴, 字体大小=字体大小, 气泡宽度=气泡宽度,
+                                   内边距=内边距, 图像分辨率=图像分辨率, 语言=语言, 抗锯齿=抗锯齿,
+                                   文本渲染=文本渲染, 裁剪到内容=裁剪到内容)
+            with stage("render_cache"):
+                pixels = get_render_cache().get(key, use_disk)
+            if pixels is not None:
+                log_info(get_render_cache().format_stats())
+                with stage("convert"):
+                    return _pixels_to_outputs(pixels, 预乘Alpha == "是")
+        
+        img = self._render_image(文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距,
+                                 图像分辨率, 语言, 抗锯齿, 文本渲染, 裁剪到内容)
+        
+        # 直接从PIL的像素缓冲区生成RGBA、RGB和遮罩三个输出，每个输出只分配一次
+        with stage("convert"):
+            pixels = _image_pixels(img)
+            bubble_tensor, rgb_tensor, mask_tensor = _pixels_to_outputs(pixels, 预乘Alpha == "是")
+        
+        if use_cache:
+            with stage("render_cache"):
+                get_render_cache().put(key, pixels, use_disk)
+            log_info(get_render_cache().format_stats())
+        
+        if debug_enabled():
+            # 以下统计需要扫描整幅图像，只在调试级别下计算
+            bubble_np = bubble_tensor[0].numpy()
+            log_debug(f"气泡图像形状: {bubble_np.shape}，数据类型: {bubble_np.dtype}")
+            log_debug(f"气泡图像值范围: {np.min(bubble_np)} 到 {np.max(bubble_np)}")
+            
+            # 打印最终输出数组的一些像素值作为调试
+            sample_points = [(内边距 * 图像分辨率, 内边距 * 图像分辨率), (bubble_np.shape[0]//2, bubble_np.shape[1]//2)]
+            for y, x in sample_points:
+                if y < bubble_np.shape[0] and x < bubble_np.shape[1]:
+                    log_debug(f"位置 ({y},{x}) 的颜色值: {bubble_np[y,x]}")
+        
+        return (bubble_tensor, rgb_tensor, mask_tensor)
+
+    def _render_image(self, 文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言,
+                      抗锯齿="关闭", 文本渲染="FreeType", 裁剪到内容="否"):
+        """按节点参数（逻辑像素）在指定分辨率下绘制气泡，返回PIL RGBA图像"""
         # 根据分辨率因子调整尺寸
         字体大小 = 字体大小 * 图像分辨率
         气泡宽度 = 气泡宽度 * 图像分辨率
         内边距 = 内边距 * 图像分辨率
         
-        # 添加额外边距以避免裁剪
-        额外边距 = 10 * 图像分辨率
-        
-        # 获取与语言匹配的字体
-        font_path = self._get_font_for_language(语言)
-        
         # Determine style and colors
         is_sender = 发送者位置 == "右侧"
         show_tail = 显示尾巴 == "是"
         
         # 使用辅助方法处理颜色
-        print(f"气泡背景颜色：{气泡背景颜色}")  # 调试信息
         color_rgba = self._prepare_color(气泡背景颜色)
         text_color_rgb = self._prepare_color(文本颜色)[:3]  # 文本颜色只需要RGB
-        print(f"转换后的颜色 -> RGBA: {color_rgba}")
+        log_debug(f"气泡背景颜色：{气泡背景颜色} -> RGBA: {color_rgba}")
+        log_debug(f"保持透明背景，气泡颜色为: {color_rgba[:3]}")
         
-        # Create font object
+        # 获取与语言匹配的字体
+        with stage("font"):
+            font = self._load_font(语言, 字体大小)
+        
+        img = self._render_bubble(文本内容, 气泡样式, color_rgba, text_color_rgb, is_sender, show_tail,
+                                  font, 字体大小, 气泡宽度, 内边距, 图像分辨率, ANTIALIAS_MODES.get(抗锯齿, 1), 文本渲染)
+        if 裁剪到内容 == "是":
+            img = _crop_to_alpha(img)
+        return img
+    
+    def _create_svg(self, 文本内容, 气泡样式, 气泡背景颜色, 文本颜色, 发送者位置, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言,
+                    预乘Alpha, 抗锯齿, 渲染缓存, 文本渲染, 裁剪到内容="否", 字体引用="文件路径"):
+        """
+        以逻辑像素（分辨率1）生成气泡的SVG，形状与位图使用同一几何模型，文本引用字体文件。
+        渲染参数写入SVG的metadata，栅格化节点据此在最终分辨率下绘制。
+        """
+        with stage("font"):
+            font = resolve_font(self._load_font(语言, 字体大小), 文本内容)
+        with stage("layout"):
+            text_lines, line_boxes, directions, bubble_width, bubble_height = _layout_text(文本内容, font, 气泡宽度, 内边距)
+        geometry, size = place_geometry(气泡样式, bubble_width, bubble_height, 发送者位置 == "右侧", 显示尾巴 == "是", 1)
+        
+        params = dict(文本内容=文本内容, 气泡样式=气泡样式, 气泡背景颜色=气泡背景颜色, 文本颜色=文本颜色, 发送者位置=发送者位置,
+                      显示尾巴=显示尾巴, 字体大小=字体大小, 气泡宽度=气泡宽度, 内边距=内边距, 语言=语言, 抗锯齿=抗锯齿,
+                      文本渲染=文本渲染, 裁剪到内容=裁剪到内容)
+        return bubble_svg(geometry, size, self._prepare_color(气泡背景颜色), self._prepare_color(文本颜色)[:3],
+                          text_lines, _line_positions(geometry.body, 内边距, line_boxes, directions), font, 字体大小,
+                          params, 字体引用 == "内嵌", visual_order=not has_raqm())
+    
+    def _render_key(self, **params):
+        """
+        渲染参数的内容哈希，包含所用字体文件的路径和修改时间以及样式与主题的定义，
+        字体被替换或themes.json被修改后缓存自动失效
+        """
+        font_path = self._get_font_for_language(params.get("语言"))
+        try:
+            font_mtime = os.stat(font_path).st_mtime_ns if font_path else None
+        except OSError:
+            font_mtime = None
+        theme = get_theme_cache().get_entries().get(params.get("主题"))
+        return render_key(font=[font_path, font_mtime], shape=style_spec(params.get("气泡样式")), theme=theme, **params)
+    
+    def _load_font(self, 语言, 字体大小, 子集文本=None):
+        """
+        加载与语言匹配的字体（字号为已按分辨率缩放后的值），失败时使用默认字体。
+        提供子集文本时改用只包含这些字符的子集字体（需要fontTools，否则仍使用完整字体）。
+        """
+        font_path = self._get_font_for_language(语言)
+        if 子集文本 and font_path:
+            font_path = get_font_manager().subset(font_path, 子集文本)
+        
+        # Create font object (从进程级缓存获取，避免重复加载字体文件)
         try:
-            font = ImageFont.truetype(font_path, 字体大小)
-            print(f"使用字体: {font_path} 显示{语言}文本")
+            font = get_font_cache().get_font(font_path, 字体大小)
+            log_debug(f"使用字体: {font_path} 显示{语言}文本")
         except (IOError, OSError) as e:
-            print(f"加载字体失败: {e}，将使用默认字体")
+            log_warning(f"加载字体失败: {e}，将使用默认字体")
             font = ImageFont.load_default()
+        return font
+    
+    def _render_bubble(self, 文本内容, 气泡样式, color_rgba, text_color_rgb, is_sender, show_tail,
+                       font, 字体大小, 气泡宽度, 内边距, 图像分辨率, 超采样=1, 文本渲染="FreeType", shape_cache=None):
+        """
+        绘制单个气泡并返回PIL RGBA图像。尺寸参数均为已按分辨率缩放后的值，超采样为形状遮罩的抗锯齿倍数。
+        文本渲染为"字形缓存"时用缓存的字形拼接文本，需要整形的文字自动回退到FreeType绘制。
+        shape_cache为可选的字典，批量渲染时用于复用相同几何与颜色的气泡底图。
+        图像尺寸恰好容纳气泡主体与尾巴，主体在图像中的位置记录在img.info["bubble_body"]。
+        """
+        with stage("layout"):
+            # 主字体缺少的字符（例如混排的其他语言文字）自动改用fonts目录中包含该字符的字体
+            font = resolve_font(font, 文本内容)
+            text_lines, line_boxes, directions, bubble_width, bubble_height = _layout_text(文本内容, font, 气泡宽度, 内边距)
         
-        # Calculate text dimensions
-        text_lines = textwrap.wrap(文本内容, width=int(气泡宽度 / (字体大小 * 0.6)))
+        shape_key = (气泡样式, bubble_width, bubble_height, is_sender, show_tail, tuple(color_rgba), 图像分辨率, 超采样)
+        with stage("shape"):
+            shape_img = shape_cache.get(shape_key) if shape_cache is not None else None
+            
+            if shape_img is None:
+                shape_img = self._draw_shape_layer(气泡样式, color_rgba, bubble_width, bubble_height,
+                                                   is_sender, show_tail, 图像分辨率, 超采样)
+                if shape_cache is not None:
+                    shape_cache[shape_key] = shape_img
+            
+            # 缓存的底图需要保持不变，因此在副本上绘制文本
+            img = shape_img.copy() if shape_cache is not None else shape_img
         
-        # Create a temporary image to measure text dimensions
-        temp_img = Image.new('RGBA', (1, 1), (0, 0, 0, 0))
-        temp_draw = ImageDraw.Draw(temp_img)
+        # Draw the text（文本相对气泡主体定位，左侧尾巴会使主体在画布中右移）
+        positions = _line_positions(img.info["bubble_body"], 内边距, line_boxes, directions)
         
-        # Calculate text dimensions
-        text_height = 0
-        text_width = 0
+        with stage("text"):
+            if 文本渲染 != "字形缓存" or not draw_lines(img, text_lines, positions, font, text_color_rgb):
+                draw = ImageDraw.Draw(img)
+                for line, position in zip(text_lines, positions):
+                    draw_text(draw, position, line, font, text_color_rgb)
+                count("glyphs_drawn", sum(len(line) for line in text_lines))
         
-        for line in text_lines:
-            bbox = font.getbbox(line)
-            line_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-            text_height += line_height + 4  # Add a little extra spacing
-            text_width = max(text_width, line_width)
+        return img
+    
+    def _measure_bubble(self, 文本内容, 气泡样式, color_rgba, text_color_rgb, is_sender, show_tail,
+                        font, 字体大小, 气泡宽度, 内边距, 图像分辨率, 超采样=1, 文本渲染="FreeType"):
+        """只做断行与测量，返回_render_bubble输出图像的(宽, 高)，不分配任何像素"""
+        font = resolve_font(font, 文本内容)
+        _, _, _, bubble_width, bubble_height = _layout_text(文本内容, font, 气泡宽度, 内边距)
+        return place_geometry(气泡样式, bubble_width, bubble_height, is_sender, show_tail, 图像分辨率)[1]
+    
+    def _draw_shape_layer(self, 气泡样式, color_rgba, bubble_width, bubble_height, is_sender, show_tail, 图像分辨率, 超采样=1):
+        """
+        按几何模型绘制气泡形状（不含文本），返回透明背景的RGBA图像。
+        画布按样式的实际形状边界分配，恰好容纳主体与尾巴，主体位置写入img.info["bubble_body"]。
+        """
+        geometry, size = place_geometry(气泡样式, bubble_width, bubble_height, is_sender, show_tail, 图像分辨率)
         
-        # Adjust for the last line's extra spacing
-        text_height -= 4
+        # 形状只在单通道遮罩上绘制（抗锯齿时只对遮罩超采样），再用气泡颜色一次填充
+        # 相同样式与尺寸的遮罩从进程级缓存获取，只需用新颜色填充
+        mask = get_shape_cache().get_mask(气泡样式, bubble_width, bubble_height, is_sender, show_tail,
+                                          图像分辨率, 超采样)
+        log_debug(f"绘制{气泡样式}气泡使用的颜色: {color_rgba}，超采样: {超采样}")
         
-        # Calculate bubble dimensions
-        bubble_width = text_width + 内边距 * 2
-        bubble_height = text_height + 内边距 * 2
+        # 遮罩外的像素全透明，填充结果即为完整的形状层，不需要再与空白画布合成
+        img = fill_mask(mask, color_rgba)
+        count("bytes_allocated", size[0] * size[1] * 4)
+        img.info["bubble_body"] = geometry.body
+        return img
+
+
+def _layout_text(text, font, max_width, padding):
+    """断行、整形并测量文本，返回(行列表, 每行边界框, 每行是否从右到左, 气泡宽, 气泡高)"""
+    # 按实际像素宽度断行，每行只测量一次；阿拉伯文等在这里完成整形与双向重排
+    text_lines, directions = shape_lines(text, font, max_width)
+    line_boxes = measure_lines(text_lines, font)
+    
+    # Calculate text dimensions
+    text_height = 0
+    text_width = 0
+    
+    for bbox in line_boxes:
+        line_width = bbox[2] - bbox[0]
+        line_height = bbox[3] - bbox[1]
+        text_height += line_height + 4  # Add a little extra spacing
+        text_width = max(text_width, line_width)
+    
+    # Adjust for the last line's extra spacing
+    text_height -= 4
+    
+    # Calculate bubble dimensions
+    return text_lines, line_boxes, directions, text_width + padding * 2, text_height + padding * 2
+
+
+def _line_positions(body, padding, line_boxes, directions=None):
+    """每行文本左上角的坐标，从气泡主体左上角向内偏移内边距；从右到左的行靠右对齐"""
+    x_offset = body[0] + padding
+    y_offset = body[1] + padding
+    text_width = max((bbox[2] - bbox[0] for bbox in line_boxes), default=0)
+    positions = []
+    for i, bbox in enumerate(line_boxes):
+        x = x_offset
+        if directions and directions[i]:
+            x += text_width - (bbox[2] - bbox[0])
+        positions.append((x, y_offset))
+        y_offset += bbox[3] - bbox[1] + 4
+    return positions
+
+
+def _normalize_side(value, default="右侧"):
+    """将消息中的发送者位置统一为右侧/左侧"""
+    if value is None:
+        return default
+    value = str(value).strip().lower()
+    if value in ("右侧", "右", "right", "r", "sender", "me"):
+        return "右侧"
+    if value in ("左侧", "左", "left", "l", "receiver", "other"):
+        return "左侧"
+    return default
+
+
+def _normalize_yes_no(value, default="是"):
+    """将布尔值或字符串统一为是/否"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return "是" if value else "否"
+    value = str(value).strip().lower()
+    if value in ("是", "true", "yes", "1"):
+        return "是"
+    if value in ("否", "false", "no", "0"):
+        return "否"
+    return default
+
+
+def _normalize_font_size(value, default):
+    """将消息中的字号转换为正整数，无法解析时使用节点的字体大小"""
+    if value is None:
+        return default
+    try:
+        size = int(float(value))
+    except (TypeError, ValueError):
+        size = 0
+    if size <= 0:
+        log_warning(f"消息中的字号无效: {value!r}，使用节点的字体大小 {default}")
+        return default
+    return size
+
+
+def _scale_uint8(src, out):
+    """将uint8像素除以255写入float32数组out，计算过程中不产生中间数组"""
+    np.divide(src, np.float32(255.0), out=out, dtype=np.float32)
+    return out
+
+
+def _image_to_tensor(img, out=None):
+    """
+    将PIL图像转换为[0, 1]范围的float32张量(1, H, W, C)，只分配一次float32输出。
+    out为可选的float32 numpy数组（形状(H, W, C)），用于直接写入预先分配好的批次，此时返回out。
+    """
+    channels = len(img.getbands())
+    src = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(img.height, img.width, channels)
+    if out is not None:
+        return _scale_uint8(src, out)
+    result = np.empty((1, img.height, img.width, channels), dtype=np.float32)
+    _scale_uint8(src, result[0])
+    return torch.from_numpy(result)
+
+
+def _image_pixels(img):
+    """返回PIL RGBA图像的uint8像素数组(H, W, 4)（只读，直接引用tobytes的缓冲区）"""
+    return np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(img.height, img.width, 4)
+
+
+def _pixels_to_outputs(src, premultiply=False):
+    """
+    将uint8 RGBA像素(H, W, 4)转换为(RGBA图像, RGB图像, 遮罩)三个张量，每个输出只分配一次。
+    遮罩为alpha通道（1表示气泡可见）；premultiply为True时RGB与RGBA的颜色通道预乘alpha，
+    下游合成时只需 背景 * (1 - 遮罩) + RGB。
+    """
+    height, width = src.shape[:2]
+    rgba = np.empty((1, height, width, 4), dtype=np.float32)
+    mask = np.empty((1, height, width), dtype=np.float32)
+    _scale_uint8(src[..., 3], mask[0])
+    
+    if premultiply:
+        # 颜色 * alpha / (255 * 255)，在float32中一次完成
+        np.multiply(src[..., :3], mask[0][..., None], out=rgba[0, ..., :3], dtype=np.float32)
+        np.divide(rgba[0, ..., :3], np.float32(255.0), out=rgba[0, ..., :3])
+        rgba[0, ..., 3] = mask[0]
+    else:
+        _scale_uint8(src, rgba[0])
+    
+    rgb = np.ascontiguousarray(rgba[..., :3])
+    count("bytes_allocated", rgba.nbytes + rgb.nbytes + mask.nbytes)
+    return torch.from_numpy(rgba), torch.from_numpy(rgb), torch.from_numpy(mask)
+
+
+def _images_to_batch(images):
+    """按最大宽高一次性分配输出批次，每个气泡放在左上角，其余部分保持透明"""
+    max_height = max(img.height for img in images)
+    max_width = max(img.width for img in images)
+    batch = np.zeros((len(images), max_height, max_width, 4), dtype=np.float32)
+    for i, img in enumerate(images):
+        _image_to_tensor(img, out=batch[i, :img.height, :img.width])
+    return torch.from_numpy(batch)
+
+
+def _chunked(items, size):
+    """将可迭代对象按固定数量分块，逐块返回列表"""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _crop_to_alpha(img):
+    """裁剪到alpha不为0的最小矩形，完全透明的图像保持原样"""
+    bbox = img.getchannel('A').getbbox()
+    if bbox is None or bbox == (0, 0, img.width, img.height):
+        return img
+    return img.crop(bbox)
+
+
+def _composite_clipped(canvas, img, x, y):
+    """alpha_composite的裁剪版本，允许图像部分位于画布之外（例如滚动时被顶部遮住的消息）"""
+    left = max(0, -x)
+    top = max(0, -y)
+    right = min(img.width, canvas.width - x)
+    bottom = min(img.height, canvas.height - y)
+    if right <= left or bottom <= top:
+        return
+    if (left, top, right, bottom) != (0, 0, img.width, img.height):
+        img = img.crop((left, top, right, bottom))
+    canvas.alpha_composite(img, (x + left, y + top))
+
+
+def parse_message_script(script):
+    """
+    解析消息脚本，返回消息字典列表。
+    支持JSON数组（元素为字符串或包含text/side/style/bubble_color/text_color/show_tail/language等字段的对象），
+    也支持逐行文本格式："右: 内容" / "左: 内容"，没有前缀的行视为右侧消息。
+    """
+    script = (script or "").strip()
+    if not script:
+        return []
+    
+    if script.startswith("["):
+        try:
+            items = json.loads(script)
+        except ValueError as e:
+            log_warning(f"消息列表JSON解析失败: {e}，将按逐行文本处理")
+        else:
+            messages = []
+            for item in items:
+                if isinstance(item, str):
+                    messages.append({"text": item})
+                elif isinstance(item, dict):
+                    messages.append(dict(item))
+            return messages
+    
+    messages = []
+    for line in script.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        side = None
+        for sep in (":", "："):
+            prefix, found, rest = line.partition(sep)
+            if found and _normalize_side(prefix, None) is not None:
+                side = _normalize_side(prefix)
+                line = rest.strip()
+                break
+        messages.append({"text": line, "side": side or "右侧"})
+    return messages
+
+
+def _file_signature(path):
+    """文件的[大小, 修改时间]，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _font_signatures():
+    """语言配置文件与其中所有字体文件的签名，任一字体被替换时多消息节点的IS_CHANGED随之变化"""
+    config = get_font_cache().get_config() or {}
+    names = [lang.get("font") for lang in config.get("languages", [])] + [config.get("fallback_font")]
+    signatures = {name: _file_signature(os.path.join(FONT_DIR, name)) for name in names if name}
+    signatures[""] = _file_signature(get_font_cache().config_path)
+    return signatures
+
+
+class TextBubbleBatchNode(TextBubbleNode):
+    """
+    批量聊天气泡节点，一次渲染多条消息并输出一个填充对齐的IMAGE批次
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        languages = cls._get_language_options()
+        
+        return {
+            "required": {
+                "消息列表": ("STRING", {"multiline": True, "default": '[\n  {"text": "你好！", "side": "左侧"},\n  {"text": "你好，最近怎么样？", "side": "右侧"}\n]'}),
+                "气泡样式": (["普通", "特殊一", "特殊二", "特殊三"], {"default": "普通"}),
+                "发送者气泡颜色": ("STRING", {"default": "#B19CD9"}),
+                "接收者气泡颜色": ("STRING", {"default": "#E8E8E8"}),
+                "文本颜色": ("STRING", {"default": "#000000"}),
+                "显示尾巴": (["是", "否"], {"default": "是"}),
+                "字体大小": ("INT", {"default": 24, "min": 10, "max": 80}),
+                "气泡宽度": ("INT", {"default": 400, "min": 100, "max": 2000}),
+                "内边距": ("INT", {"default": 20, "min": 5, "max": 100}),
+                "图像分辨率": ("INT", {"default": 4, "min": 1, "max": 4, "step": 1}),
+                "语言": (languages, {"default": "简体中文"}),
+            },
+            "optional": {
+                "抗锯齿": (list(ANTIALIAS_MODES), {"default": "关闭"}),
+                "文本渲染": (TEXT_BACKENDS, {"default": "FreeType"}),
+                "并行模式": (PARALLEL_MODES, {"default": "关闭", "tooltip": (
+                    "线程模式在ComfyUI中可安全使用。进程模式通过fork启动工作进程，ComfyUI服务进程是多线程的"
+                    "（可能已初始化CUDA），fork时其他线程持有的锁会被复制到工作进程中，可能导致死锁")}),
+                "工作数": ("INT", {"default": 0, "min": 0, "max": 256}),
+                "裁剪到内容": (["否", "是"], {"default": "否"}),
+                "主题": (cls._get_theme_options(), {"default": NO_THEME}),
+                "布局方向": (LAYOUT_DIRECTIONS, {"default": "从左到右"}),
+                "字体子集": (SUBSET_MODES, {"default": "关闭"}),
+            },
+        }
+    
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("气泡批次", "尺寸信息")
+    FUNCTION = "create_bubbles"
+    CATEGORY = "聊天气泡"
+    
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        """
+        多消息节点（批量、对话、动画、分页、聊天记录）的输入哈希：基本类型参数、主题定义、所有语言的字体文件，
+        以及以路径形式传入的聊天记录文件的大小和修改时间，文件被原地修改后ComfyUI会重新执行
+        """
+        params = {name: value for name, value in kwargs.items() if isinstance(value, (str, int, float, bool))}
+        files = {name: _file_signature(os.path.expanduser(value.strip())) for name, value in params.items()
+                 if isinstance(value, str) and is_transcript_file(value.strip())}
+        theme = get_theme_cache().get_entries().get(params.get("主题"))
+        return render_key(fonts=_font_signatures(), files=files, theme=theme, **params)
+    
+    def create_bubbles(self, 消息列表, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴, 字体大小, 气泡宽度, 内边距, 图像分辨率, 语言,
+                       抗锯齿="关闭", 文本渲染="FreeType", 并行模式="关闭", 工作数=0, 裁剪到内容="否", 主题=NO_THEME,
+                       布局方向="从左到右", 字体子集="关闭"):
+        messages = parse_message_script(消息列表)
+        if not messages:
+            log_info("消息列表为空，输出一个空白气泡")
+            messages = [{"text": ""}]
         
-        # Add extra width or height for tail if needed
-        tail_width = 20 * 图像分辨率 if show_tail else 0
-        tail_height = 20 * 图像分辨率 if show_tail else 0
+        images = self._render_messages(messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                       字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                       文本渲染, 并行模式, 工作数, 主题, 布局方向, 字体子集)
+        if 裁剪到内容 == "是":
+            images = [_crop_to_alpha(img) for img in images]
         
-        # 创建一个新的PIL图像，明确设置背景为透明，添加额外边距避免裁剪
-        if not show_tail:
-            img = Image.new('RGBA', (bubble_width + 额外边距 * 2, bubble_height + 额外边距 * 2), (0, 0, 0, 0))
-        else:
-            img = Image.new('RGBA', (bubble_width + tail_width + 额外边距 * 2, bubble_height + tail_height + 额外边距 * 2), (0, 0, 0, 0))
-            
-        # 在这里直接测试背景颜色是否有效 - 创建一个纯色测试图像
-        test_color = color_rgba[:3] + (200,)  # 使用一定透明度，200表示部分透明
-        test_img = Image.new('RGBA', (50, 50), test_color)
-        
-        # 将测试图像粘贴到主图像上
-        img.paste(test_img, (额外边距 + 10, 额外边距 + 10), test_img)
-        
-        draw = ImageDraw.Draw(img)
-        
-        # Create the bubble shape based on style
-        if 气泡样式 == "普通":
-            # 普通样式 - 尾巴在对角位置
-            self._draw_bubble(draw, color_rgba, bubble_width, bubble_height, is_sender, show_tail, 额外边距)
-        
-        elif 气泡样式 == "特殊一":
-            # Special style 1 - Sharper corners
-            self._draw_bubble_style1(draw, color_rgba, bubble_width, bubble_height, is_sender, show_tail, 额外边距)
-        
-        elif 气泡样式 == "特殊二":
-            # Special style 2 - Very rounded
-            self._draw_bubble_style2(draw, color_rgba, bubble_width, bubble_height, is_sender, show_tail, 额外边距)
-        
-        elif 气泡样式 == "特殊三":
-            # Special style 3 - 类似于普通样式但位置不同
-            self._draw_bubble_style3(draw, color_rgba, bubble_width, bubble_height, is_sender, show_tail, 额外边距)
-        
-        # Draw the text
-        y_offset = 额外边距 + 内边距
-        x_offset = 额外边距 + 内边距
-        
-        for line in text_lines:
-            bbox = font.getbbox(line)
-            line_height = bbox[3] - bbox[1]
-            draw.text((x_offset, y_offset), line, fill=text_color_rgb, font=font)
-            y_offset += line_height + 4
-        
-        # Convert PIL image to numpy array
-        bubble_np = np.array(img).astype(np.float32) / 255.0
-        
-        # 额外调试 - 输出图像数组信息
-        print(f"气泡图像形状: {bubble_np.shape}")
-        print(f"气泡图像数据类型: {bubble_np.dtype}")
-        print(f"气泡图像值范围: {np.min(bubble_np)} 到 {np.max(bubble_np)}")
-        
-        # 保持透明通道
-        # 确保输出包含alpha通道
-        if bubble_np.shape[2] == 4:
-            # 创建包含RGB和Alpha的输出
-            bubble_rgba = bubble_np.copy()  # 直接复制整个数组，保留原始颜色
-            print(f"保持透明背景，气泡颜色为: {color_rgba[:3]}")
-            print(f"输出图像是否有透明通道: 是")
-        else:
-            # 如果没有透明通道，确保创建一个
-            print(f"图像没有透明通道，创建一个...")
-            bubble_rgba = np.zeros((bubble_height + 额外边距 * 2, bubble_width + tail_width + 额外边距 * 2, 4), dtype=np.float32)
-            bubble_rgba[:, :, :3] = bubble_np
-            bubble_rgba[:, :, 3] = 1.0  # 完全不透明
-            bubble_np = bubble_rgba
-            
-        # 打印最终输出数组的一些像素值作为调试
-        sample_points = [(额外边距 + 10, 额外边距 + 10), (bubble_np.shape[0]//2, bubble_np.shape[1]//2)]
-        for y, x in sample_points:
-            if y < bubble_np.shape[0] and x < bubble_np.shape[1]:
-                print(f"位置 ({y},{x}) 的颜色值: {bubble_np[y,x]}")
-        
-        # Convert numpy array to PyTorch tensor
-        bubble_tensor = torch.from_numpy(bubble_np)[None,]
-        
-        return (bubble_tensor,)
-
-    def _draw_bubble(self, draw, color, width, height, is_sender, show_tail, 额外边距=0):
-        """画一个基本的圆角矩形气泡，尾巴在对角位置"""
-        # 直接使用传入的颜色，color现在应该是RGBA格式
-        print(f"绘制气泡使用的颜色: {color}")
-        
-        # Set radius and tail dimensions
-        radius = 15
-        tail_width = 40
-        tail_height = 35
-        
-        # 计算位置，考虑额外边距
-        left = 额外边距
-        right = 额外边距 + width
-        top = 额外边距
-        bottom = 额外边距 + height
-        
-        # Draw the rounded rectangle
-        draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-        draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-        
-        # Draw the four corners
-        draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-        draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-        draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-        draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-        
-        # 只有在需要显示尾巴时才绘制
-        if show_tail:
-            # 根据发送者位置决定尾巴的位置
-            if is_sender:
-                # 尾巴在右下角，更尖锐的形状
-                tail_points = [
-                    (right - 15, bottom - 20),
-                    (right + tail_width, bottom + tail_height),
-                    (right - 60, bottom)
-                ]
+        sizes = [{"index": i, "width": img.width, "height": img.height} for i, img in enumerate(images)]
+        return (_images_to_batch(images), json.dumps(sizes, ensure_ascii=False))
+    
+    def _render_messages(self, messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                         字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, 超采样=1, 文本渲染="FreeType",
+                         并行模式="关闭", 工作数=0, 主题=NO_THEME, 布局方向="从左到右", 字体子集="关闭"):
+        """
+        渲染消息列表，返回与消息顺序一致的图像列表，颜色、字体与气泡底图在整批内复用。
+        并行模式为线程或进程时各气泡并发渲染，工作数为0表示使用CPU核数。
+        字体子集为按批次时，每种语言的字体只保留本批消息用到的字符。
+        """
+        specs = self._resolve_messages(messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                       字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, 超采样, 文本渲染, 主题, 布局方向,
+                                       字体子集)
+        return self._render_specs(specs, 并行模式, 工作数)
+    
+    def _render_specs(self, specs, 并行模式="关闭", 工作数=0, shape_cache=None):
+        """渲染_resolve_messages生成的参数元组列表，shape_cache为顺序渲染时复用的气泡底图缓存"""
+        if 并行模式 != "关闭" and len(specs) > 1:
+            return render_parallel(type(self), specs, 并行模式, 工作数)
+        shape_cache = {} if shape_cache is None else shape_cache
+        return [self._render_bubble(*spec, shape_cache=shape_cache) for spec in specs]
+    
+    def _resolve_messages(self, messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                          字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, 超采样=1, 文本渲染="FreeType", 主题=NO_THEME,
+                          布局方向="从左到右", 字体子集="关闭"):
+        """
+        将每条消息解析为_render_bubble的位置参数元组。左右两侧的默认样式与颜色（来自节点输入或主题）
+        在整批开始时解析一次，消息中单独指定的颜色和字体在整批内也只解析一次。
+        """
+        scaled_width = 气泡宽度 * 图像分辨率
+        scaled_padding = 内边距 * 图像分辨率
+        
+        colors = {}
+        fonts = {}
+        
+        def color_of(value):
+            if value not in colors:
+                colors[value] = self._prepare_color(value)
+            return colors[value]
+        
+        # 镜像布局中右侧（发送者）消息的气泡在左侧，尾巴也朝左
+        mirrored = self._mirror_layout(布局方向, 语言)
+        
+        # 每侧的(样式, 气泡颜色, 文本颜色)，消息没有单独指定时使用
+        theme = get_theme_cache().get_theme(主题)
+        defaults = {}
+        for is_sender, side, bubble_color in ((True, "右侧", 发送者气泡颜色), (False, "左侧", 接收者气泡颜色)):
+            if theme is not None:
+                palette = theme.sides[side]
+                defaults[is_sender] = (palette.style, palette.bubble_rgba, palette.text_rgba[:3])
             else:
-                # 尾巴在左下角，更尖锐的形状
-                tail_points = [
-                    (left + 15, bottom - 20),
-                    (left - tail_width, bottom + tail_height),
-                    (left + 60, bottom)
-                ]
-            
-            # 绘制尾巴（三角形）
-            draw.polygon(tail_points, fill=color)
-
-    def _draw_bubble_style1(self, draw, color, width, height, is_sender, show_tail, 额外边距=0):
-        """画一个带有尖角的气泡"""
-        # 直接使用传入的颜色，color现在应该是RGBA格式
-        print(f"绘制样式1气泡使用的颜色: {color}")
-        
-        # Set radius and tail dimensions (very rounded)
-        radius = 8  # Sharper corners
-        tail_width = 20
-        tail_height = 15
-        
-        # Calculate positions
-        if is_sender and show_tail:
-            # Right side of bubble
-            left = 额外边距
-            right = 额外边距 + width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle with sharper corners
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-            
-            # Draw a sharp pointed tail on the right
-            tail_points = [(right, bottom - height // 4),
-                          (right + tail_width, bottom - height // 2),
-                          (right, bottom - 3 * height // 4)]
-            draw.polygon(tail_points, fill=color)
-            
-        elif not is_sender and show_tail:
-            # Left side of bubble
-            left = 额外边距 + tail_width
-            right = 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-            
-            # Draw a sharp pointed tail on the left
-            tail_points = [(left, bottom - height // 4),
-                          (left - tail_width, bottom - height // 2),
-                          (left, bottom - 3 * height // 4)]
-            draw.polygon(tail_points, fill=color)
-        else:
-            # No tail, just draw a rounded rectangle
-            left = 额外边距 if is_sender else 额外边距 + tail_width
-            right = 额外边距 + width if is_sender else 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-
-    def _draw_bubble_style2(self, draw, color, width, height, is_sender, show_tail, 额外边距=0):
-        """画一个高度圆润的气泡"""
-        # 直接使用传入的颜色，color现在应该是RGBA格式
-        print(f"绘制样式2气泡使用的颜色: {color}")
-        
-        # Set radius and tail dimensions (very rounded)
-        radius = min(25, height // 2 - 2)  # More rounded corners, but not exceeding half height
-        tail_width = 25
-        tail_height = 20
-        
-        # Calculate positions
-        if is_sender and show_tail:
-            # Right side of bubble
-            left = 额外边距
-            right = 额外边距 + width
-            top = 额外边距
-            bottom = 额外边距 + height
+                defaults[is_sender] = (气泡样式, color_of(bubble_color), color_of(文本颜色)[:3])
+        
+        # 按批次生成子集字体时，先收集每种语言在整批中用到的字符
+        subset_text = {}
+        if 字体子集 == "按批次":
+            for message in messages:
+                language = message.get("language", 语言)
+                subset_text[language] = subset_text.get(language, "") + str(message.get("text", ""))
+        
+        def font_of(language, size):
+            key = (language, size)
+            if key not in fonts:
+                fonts[key] = self._load_font(language, size * 图像分辨率, subset_text.get(language))
+            return fonts[key]
+        
+        specs = []
+        for message in messages:
+            side = _normalize_side(message.get("side"))
+            is_sender = side == "右侧"
+            default_style, default_color, default_text_color = defaults[is_sender]
+            size = _normalize_font_size(message.get("font_size"), 字体大小)
             
-            # Draw the rounded rectangle with very rounded corners
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
+            specs.append((
+                str(message.get("text", "")),
+                message.get("style", default_style),
+                color_of(message["bubble_color"]) if "bubble_color" in message else default_color,
+                color_of(message["text_color"])[:3] if "text_color" in message else default_text_color,
+                is_sender != mirrored,
+                _normalize_yes_no(message.get("show_tail"), 显示尾巴) == "是",
+                font_of(message.get("language", 语言), size),
+                size * 图像分辨率,
+                scaled_width,
+                scaled_padding,
+                图像分辨率,
+                超采样,
+                文本渲染,
+            ))
+        return specs
+
+
+class ChatConversationNode(TextBubbleBatchNode):
+    """
+    聊天对话节点，将整段对话脚本排版到同一张画布上，一次渲染输出完整的聊天截图
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        languages = cls._get_language_options()
+        
+        return {
+            "required": {
+                "对话脚本": ("STRING", {"multiline": True, "default": '[\n  {"text": "你好！", "side": "左侧", "time": "10:00"},\n  {"text": "你好，最近怎么样？", "side": "右侧"}\n]'}),
+                "气泡样式": (["普通", "特殊一", "特殊二", "特殊三"], {"default": "普通"}),
+                "发送者气泡颜色": ("STRING", {"default": "#B19CD9"}),
+                "接收者气泡颜色": ("STRING", {"default": "#E8E8E8"}),
+                "文本颜色": ("STRING", {"default": "#000000"}),
+                "背景颜色": ("STRING", {"default": "#F5F5F5"}),
+                "显示尾巴": (["是", "否"], {"default": "是"}),
+                "字体大小": ("INT", {"default": 24, "min": 10, "max": 80}),
+                "气泡宽度": ("INT", {"default": 400, "min": 100, "max": 2000}),
+                "内边距": ("INT", {"default": 20, "min": 5, "max": 100}),
+                "画布宽度": ("INT", {"default": 720, "min": 200, "max": 4000}),
+                "消息间距": ("INT", {"default": 16, "min": 0, "max": 200}),
+                "显示头像": (["是", "否"], {"default": "是"}),
+                "头像大小": ("INT", {"default": 48, "min": 16, "max": 256}),
+                "图像分辨率": ("INT", {"default": 2, "min": 1, "max": 4, "step": 1}),
+                "语言": (languages, {"default": "简体中文"}),
+            },
+            "optional": {
+                "发送者头像": ("IMAGE",),
+                "接收者头像": ("IMAGE",),
+                "抗锯齿": (list(ANTIALIAS_MODES), {"default": "关闭"}),
+                "文本渲染": (TEXT_BACKENDS, {"default": "FreeType"}),
+                "并行模式": (PARALLEL_MODES, {"default": "关闭", "tooltip": (
+                    "线程模式在ComfyUI中可安全使用。进程模式通过fork启动工作进程，ComfyUI服务进程是多线程的"
+                    "（可能已初始化CUDA），fork时其他线程持有的锁会被复制到工作进程中，可能导致死锁")}),
+                "工作数": ("INT", {"default": 0, "min": 0, "max": 256}),
+                "主题": (cls._get_theme_options(), {"default": NO_THEME}),
+                "布局方向": (LAYOUT_DIRECTIONS, {"default": "从左到右"}),
+                "字体子集": (SUBSET_MODES, {"default": "关闭"}),
+            },
+        }
+    
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("对话图像",)
+    FUNCTION = "create_conversation"
+    CATEGORY = "聊天气泡"
+    
+    # 画布四周留白与头像和气泡之间的间隔（逻辑像素，按分辨率缩放）
+    CANVAS_MARGIN = 16
+    AVATAR_GAP = 8
+    TIME_COLOR = (153, 153, 153)
+    
+    def create_conversation(self, 对话脚本, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 背景颜色, 显示尾巴,
+                            字体大小, 气泡宽度, 内边距, 画布宽度, 消息间距, 显示头像, 头像大小, 图像分辨率, 语言,
+                            发送者头像=None, 接收者头像=None, 抗锯齿="关闭", 文本渲染="FreeType",
+                            并行模式="关闭", 工作数=0, 主题=NO_THEME, 布局方向="从左到右", 字体子集="关闭"):
+        messages = parse_message_script(对话脚本)
+        
+        images = self._render_messages(messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                       字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                       文本渲染, 并行模式, 工作数, 主题, 布局方向, 字体子集)
+        发送者气泡颜色, 接收者气泡颜色, 背景颜色 = self._theme_colors(主题, 发送者气泡颜色, 接收者气泡颜色, 背景颜色)
+        avatars = self._prepare_avatars(显示头像 == "是", 头像大小 * 图像分辨率, 发送者头像, 接收者头像,
+                                        发送者气泡颜色, 接收者气泡颜色)
+        time_font = self._load_font(语言, max(10, int(字体大小 * 0.6)) * 图像分辨率)
+        
+        width, height, rows = self._layout_conversation(messages, [img.size for img in images], avatars, time_font,
+                                                        画布宽度, 消息间距, 图像分辨率, self._mirror_layout(布局方向, 语言))
+        for row, img in zip(rows, images):
+            row["bubble"] = img
+        canvas = Image.new('RGBA', (width, height), self._prepare_color(背景颜色))
+        for row in rows:
+            self._draw_row(canvas, row, avatars, time_font)
+        
+        # 整段对话只做一次张量转换
+        return (_image_to_tensor(canvas),)
+    
+    def _theme_colors(self, 主题, 发送者气泡颜色, 接收者气泡颜色, 背景颜色):
+        """使用主题时，头像占位与画布背景改用主题的气泡颜色和背景颜色"""
+        theme = get_theme_cache().get_theme(主题)
+        if theme is None:
+            return 发送者气泡颜色, 接收者气泡颜色, 背景颜色
+        return theme.sides["右侧"].bubble_color, theme.sides["左侧"].bubble_color, theme.background
+    
+    def _prepare_avatars(self, show_avatar, avatar_size, sender_avatar, receiver_avatar, sender_color, receiver_color):
+        """准备左右两侧的圆形头像，未提供头像图像时使用气泡颜色的圆形占位"""
+        if not show_avatar:
+            return {}
+        
+        avatar_size = int(avatar_size)
+        mask = Image.new('L', (avatar_size, avatar_size), 0)
+        ImageDraw.Draw(mask).ellipse([(0, 0), (avatar_size - 1, avatar_size - 1)], fill=255)
+        
+        avatars = {}
+        for side, tensor, color in (("右侧", sender_avatar, sender_color), ("左侧", receiver_avatar, receiver_color)):
+            avatar = Image.new('RGBA', (avatar_size, avatar_size), (0, 0, 0, 0))
+            if tensor is not None:
+                frame = (tensor[0].clamp(0, 1) * 255).byte().cpu().numpy()
+                source = Image.fromarray(frame).convert('RGBA').resize((avatar_size, avatar_size), Image.LANCZOS)
+                avatar.paste(source, (0, 0), mask)
+            else:
+                fill = Image.new('RGBA', (avatar_size, avatar_size), self._prepare_color(color))
+                avatar.paste(fill, (0, 0), mask)
+            avatars[side] = avatar
+        return avatars
+    
+    def _layout_conversation(self, messages, sizes, avatars, time_font, 画布宽度, 消息间距, 图像分辨率, mirrored=False):
+        """
+        根据每个气泡图像的(宽, 高)计算每条消息的摆放位置，返回(画布宽, 画布高, 行列表)。
+        每行包含气泡坐标、可选的时间戳和头像坐标以及该行的上下边界，坐标均为已缩放后的像素值；
+        行中的气泡图像（bubble）由调用方在渲染后填入。
+        """
+        margin = self.CANVAS_MARGIN * 图像分辨率
+        gap = self.AVATAR_GAP * 图像分辨率
+        spacing = 消息间距 * 图像分辨率
+        avatar_size = next(iter(avatars.values())).width if avatars else 0
+        avatar_space = avatar_size + gap if avatars else 0
+        
+        # 画布至少要容纳最宽的气泡
+        widest = max((size[0] for size in sizes), default=0)
+        width = max(画布宽度 * 图像分辨率, widest + avatar_space + margin * 2)
+        
+        rows = []
+        y = margin
+        for message, (bubble_width, bubble_height) in zip(messages, sizes):
+            side = _normalize_side(message.get("side"))
+            # side决定头像与颜色，align为实际排列的一侧（镜像布局中与side相反）
+            align = side if not mirrored else ("左侧" if side == "右侧" else "右侧")
+            row = {"bubble": None, "side": side, "align": align, "time": None, "avatar": None, "top": y}
             
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
+            timestamp = message.get("time")
+            if timestamp:
+                timestamp = str(timestamp)
+                bbox = time_font.getbbox(timestamp)
+                row["time"] = (timestamp, (width - (bbox[2] - bbox[0])) // 2, y)
+                y += bbox[3] + spacing
             
-            # Draw a smooth curved tail on the right
-            # Create a smoother curve with additional points
-            tail_start = (right, bottom - height // 3)
-            tail_end = (right, bottom - 2 * height // 3)
-            tail_mid = (right + tail_width, bottom - height // 2)
+            if align == "右侧":
+                x = width - margin - avatar_space - bubble_width
+                avatar_x = width - margin - avatar_size
+            else:
+                x = margin + avatar_space
+                avatar_x = margin
             
-            # Draw a series of points to create a smooth curve
-            points = [tail_start]
-            for i in range(1, 9):
-                t = i / 10
-                x = (1-t)**2 * tail_start[0] + 2*(1-t)*t*tail_mid[0] + t**2*tail_end[0]
-                y = (1-t)**2 * tail_start[1] + 2*(1-t)*t*tail_mid[1] + t**2*tail_end[1]
-                points.append((x, y))
-            points.append(tail_end)
+            row["position"] = (x, y)
+            if avatars:
+                # 头像与气泡主体顶部对齐（气泡图像的上边缘即主体顶部）
+                row["avatar"] = (avatar_x, y)
             
-            draw.polygon(points, fill=color)
+            y += max(bubble_height, avatar_size)
+            row["bottom"] = y
+            rows.append(row)
+            y += spacing
+        
+        height = max(y - spacing + margin, margin * 2)
+        return width, height, rows
+    
+    def _draw_row(self, canvas, row, avatars, time_font, offset_y=0):
+        """将一行消息（时间戳、头像、气泡）绘制到画布上"""
+        if row["time"] is not None:
+            text, x, y = row["time"]
+            ImageDraw.Draw(canvas).text((x, y - offset_y), text, fill=self.TIME_COLOR, font=time_font)
+        if row["avatar"] is not None:
+            x, y = row["avatar"]
+            avatar = avatars[row["side"]]
+            _composite_clipped(canvas, avatar, x, y - offset_y)
+        if row["bubble"] is not None:
+            x, y = row["position"]
+            _composite_clipped(canvas, row["bubble"], x, y - offset_y)
+
+
+class ChatAnimationNode(ChatConversationNode):
+    """
+    聊天动画节点，输出消息逐条出现或逐字显示的滚动对话帧序列
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        inputs = super().INPUT_TYPES()
+        required = dict(inputs["required"])
+        required["动画模式"] = (["逐条出现", "逐字显示"], {"default": "逐条出现"})
+        required["画布高度"] = ("INT", {"default": 1280, "min": 200, "max": 8000})
+        required["每条消息帧数"] = ("INT", {"default": 12, "min": 1, "max": 600})
+        required["每帧字数"] = ("INT", {"default": 1, "min": 1, "max": 100})
+        required["分块帧数"] = ("INT", {"default": 16, "min": 1, "max": 1024,
+                                        "tooltip": "每次生成并转换的帧数，内存中最多同时保留一个分块的uint8帧"})
+        required["输出目录"] = ("STRING", {"default": "", "tooltip": (
+            "填写后逐帧保存为PNG，只输出最后一帧。留空时所有帧以float32张量输出（每帧 宽×高×16 字节），"
+            f"总量超过{MAX_ANIMATION_MEMORY_MB}MB（环境变量CHAT_BUBBLE_ANIMATION_MEMORY_MB）时自动写入cache/animation")})
+        inputs["required"] = required
+        return inputs
+    
+    RETURN_TYPES = ("IMAGE", "INT")
+    RETURN_NAMES = ("动画帧", "帧数")
+    FUNCTION = "create_animation"
+    CATEGORY = "聊天气泡"
+    
+    def create_animation(self, 对话脚本, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 背景颜色, 显示尾巴,
+                         字体大小, 气泡宽度, 内边距, 画布宽度, 消息间距, 显示头像, 头像大小, 图像分辨率, 语言,
+                         动画模式, 画布高度, 每条消息帧数, 每帧字数, 分块帧数, 输出目录,
+                         发送者头像=None, 接收者头像=None, 抗锯齿="关闭", 文本渲染="FreeType",
+                         并行模式="关闭", 工作数=0, 主题=NO_THEME, 布局方向="从左到右", 字体子集="关闭"):
+        messages = parse_message_script(对话脚本)
+        if not messages:
+            log_info("对话脚本为空，输出一帧空白画面")
+        
+        specs = self._resolve_messages(messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                       字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                       文本渲染, 主题, 布局方向, 字体子集)
+        发送者气泡颜色, 接收者气泡颜色, 背景颜色 = self._theme_colors(主题, 发送者气泡颜色, 接收者气泡颜色, 背景颜色)
+        # 每条消息的完整气泡只渲染一次，后续帧直接复用
+        shape_cache = {}
+        images = self._render_specs(specs, 并行模式, 工作数, shape_cache)
+        avatars = self._prepare_avatars(显示头像 == "是", 头像大小 * 图像分辨率, 发送者头像, 接收者头像,
+                                        发送者气泡颜色, 接收者气泡颜色)
+        time_font = self._load_font(语言, max(10, int(字体大小 * 0.6)) * 图像分辨率)
+        width, _, rows = self._layout_conversation(messages, [img.size for img in images], avatars, time_font,
+                                                   画布宽度, 消息间距, 图像分辨率, self._mirror_layout(布局方向, 语言))
+        for row, img in zip(rows, images):
+            row["bubble"] = img
+        
+        schedule = self._build_schedule(specs, 动画模式 == "逐字显示", 每条消息帧数, 每帧字数)
+        frames = self.iter_frames(schedule, rows, specs, avatars, time_font, width, 画布高度 * 图像分辨率,
+                                  self._prepare_color(背景颜色), self.CANVAS_MARGIN * 图像分辨率, shape_cache)
+        
+        output_dir = 输出目录.strip()
+        output_mb = len(schedule) * 画布高度 * 图像分辨率 * width * 4 * 4 / (1024 * 1024)
+        if not output_dir and output_mb > MAX_ANIMATION_MEMORY_MB:
+            output_dir = os.path.join(DEFAULT_ANIMATION_DIR, time.strftime("%Y%m%d-%H%M%S"))
+            log_warning(f"{len(schedule)}帧动画需要{output_mb:.0f}MB内存，超过上限{MAX_ANIMATION_MEMORY_MB}MB，"
+                        f"帧序列改为写入 {output_dir}，只输出最后一帧")
+        
+        if output_dir:
+            # 逐帧写入磁盘，内存中最多只保留一个分块
+            last_frame = self._save_frames(frames, output_dir, 分块帧数)
+            return (torch.from_numpy(_scale_uint8(last_frame, np.empty((1,) + last_frame.shape, dtype=np.float32))), len(schedule))
+        
+        # 帧数预先已知且总量在内存上限内，输出张量只分配一次，按分块填充
+        output = np.empty((len(schedule), 画布高度 * 图像分辨率, width, 4), dtype=np.float32)
+        index = 0
+        for chunk in self.iter_frame_chunks(frames, 分块帧数):
+            _scale_uint8(chunk, output[index:index + len(chunk)])
+            index += len(chunk)
+        return (torch.from_numpy(output), len(schedule))
+    
+    def _build_schedule(self, specs, typing, hold_frames, chars_per_frame):
+        """
+        生成逐帧的动画计划，每一项为(消息序号, 已显示字数)，字数为None表示该消息已完整显示。
+        没有消息时返回一帧空白画面。
+        """
+        schedule = []
+        for index, spec in enumerate(specs):
+            text = spec[0]
+            if typing:
+                for n_chars in range(chars_per_frame, len(text), chars_per_frame):
+                    schedule.append((index, n_chars))
+            schedule.extend([(index, None)] * hold_frames)
+        return schedule or [(-1, None)]
+    
+    def iter_frames(self, schedule, rows, specs, avatars, time_font, width, view_height, background, margin,
+                    shape_cache=None):
+        """
+        按动画计划逐帧生成uint8 RGBA数组(H, W, 4)。
+        视口不滚动时只清除并重绘发生变化的气泡区域；视口滚动时仅用缓存的气泡位图重新拼接可见行。
+        内容不变的帧直接复用上一帧的数组，调用方不应修改返回的数组。
+        """
+        shape_cache = {} if shape_cache is None else shape_cache
+        frame = None
+        frame_np = None
+        offset = None
+        completed = 0       # 已完整绘制到当前帧的行数
+        decorated = None    # 已绘制时间戳和头像的行
+        partial_box = None  # 上一帧逐字显示中的气泡区域
+        
+        for index, n_chars in schedule:
+            if index < 0:
+                frame = Image.new('RGBA', (width, view_height), background)
+                yield np.array(frame)
+                continue
             
-        elif not is_sender and show_tail:
-            # Left side of bubble
-            left = 额外边距 + tail_width
-            right = 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
+            row = rows[index]
+            new_offset = max(0, row["bottom"] + margin - view_height)
+            changed = False
             
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
+            if frame is None or new_offset != offset:
+                # 视口发生滚动，用缓存的位图重新拼接当前可见的已完成消息
+                offset = new_offset
+                frame = Image.new('RGBA', (width, view_height), background)
+                for done in rows[:index]:
+                    if done["bottom"] > offset and done["top"] < offset + view_height:
+                        self._draw_row(frame, done, avatars, time_font, offset)
+                completed = index
+                decorated = None
+                partial_box = None
+                changed = True
             
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
+            if partial_box is not None:
+                # 清除上一帧的半成品气泡
+                frame.paste(background, partial_box)
+                partial_box = None
+                changed = True
             
-            # Draw a smooth curved tail on the left
-            tail_start = (left, bottom - height // 3)
-            tail_end = (left, bottom - 2 * height // 3)
-            tail_mid = (left - tail_width, bottom - height // 2)
+            if completed == index and decorated != index:
+                # 时间戳和头像每行只画一次，避免重复叠加抗锯齿边缘
+                self._draw_row(frame, dict(row, bubble=None), avatars, time_font, offset)
+                decorated = index
+                changed = True
             
-            # Draw a series of points to create a smooth curve
-            points = [tail_start]
-            for i in range(1, 9):
-                t = i / 10
-                x = (1-t)**2 * tail_start[0] + 2*(1-t)*t*tail_mid[0] + t**2*tail_end[0]
-                y = (1-t)**2 * tail_start[1] + 2*(1-t)*t*tail_mid[1] + t**2*tail_end[1]
-                points.append((x, y))
-            points.append(tail_end)
+            if n_chars is None:
+                if completed == index:
+                    x, y = row["position"]
+                    _composite_clipped(frame, row["bubble"], x, y - offset)
+                    completed = index + 1
+                    changed = True
+            else:
+                partial = self._render_bubble(specs[index][0][:n_chars], *specs[index][1:], shape_cache=shape_cache)
+                x, y = row["position"]
+                if row["align"] == "右侧":
+                    # 右侧消息按最终气泡的右边缘对齐
+                    x += row["bubble"].width - partial.width
+                _composite_clipped(frame, partial, x, y - offset)
+                top = min(view_height, max(0, y - offset))
+                partial_box = (x, top, x + partial.width, min(view_height, max(top, y - offset + partial.height)))
+                changed = True
             
-            draw.polygon(points, fill=color)
+            if changed or frame_np is None:
+                frame_np = np.array(frame)
+            yield frame_np
+    
+    def iter_frame_chunks(self, frames, chunk_size):
+        """将逐帧生成器按固定帧数打包为(N, H, W, 4)的uint8数组"""
+        chunk = []
+        for frame in frames:
+            chunk.append(frame)
+            if len(chunk) >= chunk_size:
+                yield np.stack(chunk)
+                chunk = []
+        if chunk:
+            yield np.stack(chunk)
+    
+    def _save_frames(self, frames, output_dir, chunk_size):
+        """将帧序列按分块逐帧保存为PNG，返回最后一帧"""
+        os.makedirs(output_dir, exist_ok=True)
+        last_frame = None
+        index = 0
+        for chunk in self.iter_frame_chunks(frames, chunk_size):
+            for frame in chunk:
+                Image.fromarray(frame).save(os.path.join(output_dir, f"frame_{index:05d}.png"), compress_level=1)
+                index += 1
+            last_frame = chunk[-1]
+        return last_frame
+
+
+class ChatPagesNode(ChatConversationNode):
+    """
+    聊天分页节点，预先测量全部气泡的尺寸，把长对话排版到固定尺寸的页面中（气泡不会跨页），每次只渲染一页
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        inputs = super().INPUT_TYPES()
+        required = dict(inputs["required"])
+        # 默认页面为手机屏幕尺寸：540×960，图像分辨率2时输出1080×1920
+        required["画布宽度"] = ("INT", {"default": 540, "min": 200, "max": 4000})
+        required["页面高度"] = ("INT", {"default": 960, "min": 200, "max": 8000})
+        required["输出目录"] = ("STRING", {"default": ""})
+        inputs["required"] = required
+        optional = dict(inputs["optional"])
+        optional["说话人映射"] = ("STRING", {"multiline": True, "default": ""})
+        inputs["optional"] = optional
+        return inputs
+    
+    RETURN_TYPES = ("IMAGE", "INT")
+    RETURN_NAMES = ("页面", "页数")
+    FUNCTION = "create_pages"
+    CATEGORY = "聊天气泡"
+    
+    def create_pages(self, 对话脚本, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 背景颜色, 显示尾巴,
+                     字体大小, 气泡宽度, 内边距, 画布宽度, 消息间距, 显示头像, 头像大小, 图像分辨率, 语言,
+                     页面高度, 输出目录, 发送者头像=None, 接收者头像=None, 抗锯齿="关闭", 文本渲染="FreeType",
+                     并行模式="关闭", 工作数=0, 主题=NO_THEME, 布局方向="从左到右", 字体子集="关闭", 说话人映射=""):
+        # 对话脚本也可以是聊天记录文件的路径，按说话人映射读取
+        if is_transcript_file(对话脚本.strip()):
+            messages = list(iter_messages(iter_transcript(对话脚本), 说话人映射))
         else:
-            # No tail, just draw a very rounded rectangle
-            left = 额外边距 if is_sender else 额外边距 + tail_width
-            right = 额外边距 + width if is_sender else 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-
-    def _draw_bubble_style3(self, draw, color, width, height, is_sender, show_tail, 额外边距=0):
-        """画一个类似于普通气泡的样式，但尾巴位置不同"""
-        # 直接使用传入的颜色，color现在应该是RGBA格式
-        print(f"绘制样式3气泡使用的颜色: {color}")
-        
-        # Set radius and tail dimensions
-        radius = 15
-        tail_width = 20
-        tail_height = 15
-        
-        # 计算位置，考虑额外边距
-        if is_sender and show_tail:
-            # Right side of bubble
-            left = 额外边距
-            right = 额外边距 + width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-            
-            # Draw the tail (a triangle) on the right side
-            tail_points = [(right, bottom - height // 3),
-                          (right + tail_width, bottom - height // 2),
-                          (right, bottom - 2 * height // 3)]
-            draw.polygon(tail_points, fill=color)
-            
-        elif not is_sender and show_tail:
-            # Left side of bubble
-            left = 额外边距 + tail_width
-            right = 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
-            
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
-            
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
-            
-            # Draw the tail (a triangle) on the left side
-            tail_points = [(left, bottom - height // 3),
-                          (left - tail_width, bottom - height // 2),
-                          (left, bottom - 2 * height // 3)]
-            draw.polygon(tail_points, fill=color)
+            messages = parse_message_script(对话脚本)
+        
+        specs = self._resolve_messages(messages, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                       字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                       文本渲染, 主题, 布局方向, 字体子集)
+        发送者气泡颜色, 接收者气泡颜色, 背景颜色 = self._theme_colors(主题, 发送者气泡颜色, 接收者气泡颜色, 背景颜色)
+        # 只断行和测量，得到每个气泡的尺寸后即可完成全部排版与分页
+        with stage("measure"):
+            sizes = [self._measure_bubble(*spec) for spec in specs]
+        avatars = self._prepare_avatars(显示头像 == "是", 头像大小 * 图像分辨率, 发送者头像, 接收者头像,
+                                        发送者气泡颜色, 接收者气泡颜色)
+        time_font = self._load_font(语言, max(10, int(字体大小 * 0.6)) * 图像分辨率)
+        width, _, rows = self._layout_conversation(messages, sizes, avatars, time_font, 画布宽度, 消息间距, 图像分辨率,
+                                                   self._mirror_layout(布局方向, 语言))
+        
+        page_height = 页面高度 * 图像分辨率
+        pages = self._paginate(rows, page_height, self.CANVAS_MARGIN * 图像分辨率)
+        background = self._prepare_color(背景颜色)
+        
+        output_dir = 输出目录.strip()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            batch = None
         else:
-            # No tail, just draw a rounded rectangle
-            left = 额外边距 if is_sender else 额外边距 + tail_width
-            right = 额外边距 + width if is_sender else 额外边距 + width + tail_width
-            top = 额外边距
-            bottom = 额外边距 + height
+            # 页数预先已知，输出批次只分配一次
+            batch = np.empty((len(pages), page_height, width, 4), dtype=np.float32)
+        
+        canvas = None
+        for page, (offset, indices) in enumerate(pages):
+            # 只渲染本页的气泡，绘制完成后立即释放
+            for index, img in zip(indices, self._render_specs([specs[i] for i in indices], 并行模式, 工作数)):
+                rows[index]["bubble"] = img
+            canvas = Image.new('RGBA', (width, page_height), background)
+            for index in indices:
+                self._draw_row(canvas, rows[index], avatars, time_font, offset)
+                rows[index]["bubble"] = None
             
-            # Draw the rounded rectangle
-            draw.rectangle([(left + radius, top), (right - radius, bottom)], fill=color)
-            draw.rectangle([(left, top + radius), (right, bottom - radius)], fill=color)
+            if output_dir:
+                canvas.save(os.path.join(output_dir, f"page_{page:04d}.png"), compress_level=1)
+            else:
+                _image_to_tensor(canvas, out=batch[page])
+        log_info(f"聊天分页: {len(messages)} 条消息，共 {len(pages)} 页")
+        
+        if output_dir:
+            # 逐页写入磁盘时只输出最后一页
+            return (_image_to_tensor(canvas), len(pages))
+        return (torch.from_numpy(batch), len(pages))
+    
+    def _paginate(self, rows, page_height, margin):
+        """
+        将行按顺序装入固定高度的页面，返回[(页面顶部在整体排版中的y, 行序号列表)]。
+        行不会跨页；单独一行就超过页面高度时独占一页，超出部分被裁掉。
+        """
+        pages = []
+        for index, row in enumerate(rows):
+            if pages:
+                offset, indices = pages[-1]
+                if row["bottom"] - offset + margin <= page_height:
+                    indices.append(index)
+                    continue
+            if row["bottom"] - row["top"] + margin * 2 > page_height:
+                log_warning(f"第{index + 1}条消息高于页面高度，超出部分会被裁掉")
+            pages.append((row["top"] - margin, [index]))
+        return pages or [(0, [])]
+
+
+class ChatTranscriptNode(TextBubbleBatchNode):
+    """
+    聊天记录导入节点，读取JSON/CSV聊天记录，按说话人映射分块渲染气泡，并可逐个写入磁盘
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        inputs = super().INPUT_TYPES()
+        required = {
+            "聊天记录": ("STRING", {"multiline": True, "default": ""}),
+            "说话人映射": ("STRING", {"multiline": True, "default": DEFAULT_SCHEMA}),
+        }
+        required.update((name, value) for name, value in inputs["required"].items() if name != "消息列表")
+        required["分块消息数"] = ("INT", {"default": 64, "min": 1, "max": 4096})
+        required["最大消息数"] = ("INT", {"default": 0, "min": 0, "max": 1000000})
+        required["输出目录"] = ("STRING", {"default": ""})
+        inputs["required"] = required
+        return inputs
+    
+    RETURN_TYPES = ("IMAGE", "STRING", "INT")
+    RETURN_NAMES = ("气泡批次", "尺寸信息", "消息数")
+    FUNCTION = "load_transcript"
+    CATEGORY = "聊天气泡"
+    
+    def load_transcript(self, 聊天记录, 说话人映射, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴, 字体大小, 气泡宽度,
+                        内边距, 图像分辨率, 语言, 分块消息数, 最大消息数, 输出目录, 抗锯齿="关闭", 文本渲染="FreeType",
+                        并行模式="关闭", 工作数=0, 裁剪到内容="否", 主题=NO_THEME, 布局方向="从左到右",
+                        字体子集="关闭"):
+        messages = iter_messages(iter_transcript(聊天记录), 说话人映射)
+        if 最大消息数 > 0:
+            messages = itertools.islice(messages, 最大消息数)
+        
+        output_dir = 输出目录.strip()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        # 消息逐块读取和渲染；写入磁盘时每块渲染完即保存，内存中只保留当前分块的uint8位图
+        sizes = []
+        kept = []
+        images = []
+        for chunk in _chunked(messages, 分块消息数):
+            images = self._render_messages(chunk, 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                           字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                           文本渲染, 并行模式, 工作数, 主题, 布局方向, 字体子集)
+            if 裁剪到内容 == "是":
+                images = [_crop_to_alpha(img) for img in images]
             
-            # Draw the four corners
-            draw.pieslice([(left, top), (left + radius * 2, top + radius * 2)], 180, 270, fill=color)
-            draw.pieslice([(right - radius * 2, top), (right, top + radius * 2)], 270, 360, fill=color)
-            draw.pieslice([(left, bottom - radius * 2), (left + radius * 2, bottom)], 90, 180, fill=color)
-            draw.pieslice([(right - radius * 2, bottom - radius * 2), (right, bottom)], 0, 90, fill=color)
+            for message, img in zip(chunk, images):
+                entry = {"index": len(sizes), "speaker": message["speaker"], "width": img.width, "height": img.height}
+                if output_dir:
+                    entry["file"] = os.path.join(output_dir, f"bubble_{len(sizes):05d}.png")
+                    img.save(entry["file"], compress_level=1)
+                sizes.append(entry)
+            if not output_dir:
+                kept.extend(images)
+            log_info(f"聊天记录已渲染 {len(sizes)} 条消息")
+        
+        if not sizes:
+            log_info("聊天记录中没有可渲染的消息，输出一个空白气泡")
+            images = self._render_messages([{"text": ""}], 气泡样式, 发送者气泡颜色, 接收者气泡颜色, 文本颜色, 显示尾巴,
+                                           字体大小, 气泡宽度, 内边距, 图像分辨率, 语言, ANTIALIAS_MODES.get(抗锯齿, 1),
+                                           文本渲染, 主题=主题, 布局方向=布局方向)
+        
+        # 写入磁盘时只输出最后一个分块，避免上万条消息同时以float32张量驻留内存
+        batch = _images_to_batch(kept or images)
+        return (batch, json.dumps(sizes, ensure_ascii=False), len(sizes))
+
+
+class BubbleSVGRasterizeNode:
+    """
+    SVG气泡栅格化节点，将文本聊天气泡输出的SVG在最终尺寸下绘制为位图
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "SVG": ("STRING", {"multiline": True, "default": ""}),
+                "目标宽度": ("INT", {"default": 0, "min": 0, "max": 8192}),
+                "缩放倍数": ("FLOAT", {"default": 2.0, "min": 0.25, "max": 8.0, "step": 0.25}),
+            },
+            "optional": {
+                "预乘Alpha": (["否", "是"], {"default": "否"}),
+            },
+        }
+    
+    RETURN_TYPES = ("IMAGE", "IMAGE", "MASK")
+    RETURN_NAMES = ("气泡图像", "RGB图像", "遮罩")
+    FUNCTION = "rasterize"
+    CATEGORY = "聊天气泡"
+    
+    def rasterize(self, SVG, 目标宽度, 缩放倍数, 预乘Alpha="否"):
+        params, size = parse_svg_params(SVG)
+        # 目标宽度为0时按缩放倍数，否则按SVG的逻辑宽度换算倍数
+        scale = 目标宽度 / size[0] if 目标宽度 > 0 and size else 缩放倍数
+        
+        # 在不低于目标的整数分辨率下用与文本聊天气泡相同的流程绘制，非整数倍时再缩小到目标尺寸
+        resolution = max(1, math.ceil(scale - 1e-6))
+        img = TextBubbleNode()._render_image(图像分辨率=resolution, **params)
+        if 目标宽度 > 0:
+            target = (目标宽度, max(1, round(img.height * 目标宽度 / img.width)))
+        else:
+            target = (max(1, round(img.width * scale / resolution)), max(1, round(img.height * scale / resolution)))
+        if target != img.size:
+            img = img.resize(target, Image.LANCZOS)
+        
+        with stage("convert"):
+            return _pixels_to_outputs(_image_pixels(img), 预乘Alpha == "是")
+
+
+def prewarm(font_sizes=PREWARM_FONT_SIZES):
+    """导入延迟的依赖，建立字体覆盖索引，并加载每种语言在常用字号下的字体"""
+    load_all()
+    node = TextBubbleNode()
+    for language in node._get_language_options():
+        font_path = node._get_font_for_language(language)
+        if font_path:
+            get_coverage_index().fallback_paths(font_path)
+        for size in font_sizes:
+            node._load_font(language, size)
+    log_info("聊天气泡节点预热完成")
+
+
+def start_prewarm():
+    """在后台守护线程中执行prewarm，不阻塞ComfyUI启动"""
+    thread = threading.Thread(target=prewarm, name="chat_bubble_prewarm", daemon=True)
+    thread.start()
+    return thread
+
 
 # 节点映射
 NODE_CLASS_MAPPINGS = {
     "文本聊天气泡": TextBubbleNode,
-    "TextBubble": TextBubbleNode
+    "TextBubble": TextBubbleNode,
+    "批量聊天气泡": TextBubbleBatchNode,
+    "TextBubbleBatch": TextBubbleBatchNode,
+    "聊天对话": ChatConversationNode,
+    "ChatConversation": ChatConversationNode,
+    "聊天动画": ChatAnimationNode,
+    "ChatAnimation": ChatAnimationNode,
+    "聊天分页": ChatPagesNode,
+    "ChatPages": ChatPagesNode,
+    "聊天记录导入": ChatTranscriptNode,
+    "ChatTranscript": ChatTranscriptNode,
+    "SVG气泡栅格化": BubbleSVGRasterizeNode,
+    "BubbleSVGRasterize": BubbleSVGRasterizeNode
 }
 
 # 节点显示名称
 NODE_DISPLAY_NAME_MAPPINGS = {
     "文本聊天气泡": "文本聊天气泡",
-    "TextBubble": "Text Chat Bubble"
+    "TextBubble": "Text Chat Bubble",
+    "批量聊天气泡": "批量聊天气泡",
+    "TextBubbleBatch": "Text Chat Bubble Batch",
+    "聊天对话": "聊天对话",
+    "ChatConversation": "Chat Conversation",
+    "聊天动画": "聊天动画",
+    "ChatAnimation": "Chat Animation",
+    "聊天分页": "聊天分页",
+    "ChatPages": "Chat Pages",
+    "聊天记录导入": "聊天记录导入",
+    "ChatTranscript": "Chat Transcript Loader",
+    "SVG气泡栅格化": "SVG气泡栅格化",
+    "BubbleSVGRasterize": "Bubble SVG Rasterize"
 }
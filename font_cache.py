@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from .bubble_logging import log_warning
+from .instrumentation import count
+from .font_manager import get_font_manager
+
+# 字体目录与配置文件路径
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+CONFIG_PATH = os.path.join(FONT_DIR, "font_config.json")
+
+# 字体对象缓存的默认容量，可通过环境变量调整
+DEFAULT_MAX_FONTS = int(os.environ.get("CHAT_BUBBLE_FONT_CACHE_SIZE", "32"))
+
+
+class FontCache:
+    """
+    进程级字体缓存：语言配置按文件mtime失效，FreeTypeFont按(字体路径, 字号)做LRU缓存
+    """
+
+    def __init__(self, config_path=CONFIG_PATH, max_fonts=DEFAULT_MAX_FONTS):
+        self.config_path = config_path
+        self.max_fonts = max(1, max_fonts)
+        self._lock = threading.Lock()
+        self._config = None
+        self._config_mtime = None
+        self._languages = None
+        self._fonts = OrderedDict()
+        self._counters = {
+            "config_hits": 0,
+            "config_loads": 0,
+            "font_hits": 0,
+            "font_misses": 0,
+            "font_evictions": 0,
+        }
+
+    def get_config(self):
+        """返回解析后的font_config.json，文件修改后自动重新加载；文件不存在或损坏时返回None"""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._config = None
+                self._config_mtime = None
+            return None
+
+        with self._lock:
+            if self._config is not None and self._config_mtime == mtime:
+                self._counters["config_hits"] += 1
+                return self._config
+
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception as e:
+            log_warning(f"无法加载语言配置文件: {e}")
+            return None
+
+        with self._lock:
+            self._config = config
+            self._config_mtime = mtime
+            self._counters["config_loads"] += 1
+        return config
+
+    def get_languages(self):
+        """返回配置中的语言名称列表，与配置一同缓存，配置文件修改后才重新生成；配置不可用时返回None"""
+        config = self.get_config()
+        if config is None:
+            return None
+        with self._lock:
+            if self._languages is not None and self._languages[0] is config:
+                return list(self._languages[1])
+        
+        languages = [lang["name"] for lang in config["languages"]]
+        with self._lock:
+            self._languages = (config, languages)
+        return list(languages)
+
+    def get_font(self, font_path, size):
+        """按(字体路径, 字号)返回缓存的FreeTypeFont，未命中时加载并按LRU淘汰"""
+        key = (font_path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self._counters["font_hits"] += 1
+                count("font_cache_hits")
+                return font
+
+        # 在锁外加载字体，避免阻塞其他线程；加载失败时异常直接抛给调用方
+        font = get_font_manager().load_font(font_path, size)
+        count("fonts_loaded")
+
+        with self._lock:
+            self._counters["font_misses"] += 1
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+                self._counters["font_evictions"] += 1
+        return font
+
+    def set_max_fonts(self, max_fonts):
+        """调整字体缓存容量，超出部分立即淘汰"""
+        with self._lock:
+            self.max_fonts = max(1, int(max_fonts))
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+                self._counters["font_evictions"] += 1
+
+    def stats(self):
+        """返回命中/未命中计数以及当前缓存的字体数量"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["fonts_cached"] = len(self._fonts)
+            stats["max_fonts"] = self.max_fonts
+        return stats
+
+    def clear(self):
+        """清空缓存的配置与字体对象，并重置计数"""
+        with self._lock:
+            self._config = None
+            self._config_mtime = None
+            self._languages = None
+            self._fonts.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+# 全局共享的字体缓存实例
+_font_cache = FontCache()
+
+
+def get_font_cache():
+    """获取进程级共享的字体缓存"""
+    return _font_cache
+
+
+def font_cache_stats():
+    """获取字体缓存的命中统计"""
+    return _font_cache.stats()
@@ -0,0 +1,432 @@
+import os
+import json
+import struct
+import threading
+import unicodedata
+from .font_cache import FONT_DIR, get_font_cache
+from .font_manager import get_font_manager
+from .bubble_logging import log_debug, log_warning
+
+# 字体覆盖范围索引的缓存文件，字体文件的大小或修改时间变化后对应条目自动重建
+COVERAGE_CACHE_PATH = os.environ.get(
+    "CHAT_BUBBLE_COVERAGE_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "font_coverage.json"))
+COVERAGE_VERSION = 1
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# cmap子表的优先顺序：(平台ID, 编码ID)，完整Unicode子表优先于只含BMP的子表
+_CMAP_PREFERENCE = [(3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)]
+
+# 每个码位占一位的位图大小
+_BITSET_BYTES = 0x110000 >> 3
+
+
+def _table_offsets(data, index=0):
+    """返回字体(或字体集合中第index个字体)的{表名: (偏移, 长度)}"""
+    offset = 0
+    if data[:4] == b"ttcf":
+        count = struct.unpack_from(">I", data, 8)[0]
+        offset = struct.unpack_from(">I", data, 12 + 4 * min(index, count - 1))[0]
+    num_tables = struct.unpack_from(">H", data, offset + 4)[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sIII", data, offset + 12 + 16 * i)
+        tables[tag.decode("latin-1")] = (table_offset, length)
+    return tables
+
+
+def _cmap_codepoints(data, offset):
+    """解析一个cmap子表，返回映射到非空字形的码位集合（支持格式0、4、6、12、13）"""
+    fmt = struct.unpack_from(">H", data, offset)[0]
+    codepoints = set()
+
+    if fmt == 0:
+        glyphs = data[offset + 6:offset + 6 + 256]
+        codepoints.update(code for code, glyph in enumerate(glyphs) if glyph)
+
+    elif fmt == 4:
+        seg_count = struct.unpack_from(">H", data, offset + 6)[0] // 2
+        ends = struct.unpack_from(f">{seg_count}H", data, offset + 14)
+        starts = struct.unpack_from(f">{seg_count}H", data, offset + 16 + 2 * seg_count)
+        deltas = struct.unpack_from(f">{seg_count}h", data, offset + 16 + 4 * seg_count)
+        range_base = offset + 16 + 6 * seg_count
+        range_offsets = struct.unpack_from(f">{seg_count}H", data, range_base)
+        for i in range(seg_count):
+            start, end, delta, range_offset = starts[i], ends[i], deltas[i], range_offsets[i]
+            if start == 0xFFFF:
+                continue
+            for code in range(start, end + 1):
+                if range_offset == 0:
+                    glyph = (code + delta) & 0xFFFF
+                else:
+                    # idRangeOffset相对于自身在数组中的位置
+                    address = range_base + 2 * i + range_offset + 2 * (code - start)
+                    glyph = struct.unpack_from(">H", data, address)[0]
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                if glyph:
+                    codepoints.add(code)
+
+    elif fmt == 6:
+        first, count = struct.unpack_from(">HH", data, offset + 6)
+        glyphs = struct.unpack_from(f">{count}H", data, offset + 10)
+        codepoints.update(first + i for i, glyph in enumerate(glyphs) if glyph)
+
+    elif fmt in (12, 13):
+        groups = struct.unpack_from(">I", data, offset + 12)[0]
+        for i in range(groups):
+            start, end, glyph = struct.unpack_from(">III", data, offset + 16 + 12 * i)
+            if fmt == 13 and glyph == 0:
+                continue
+            if fmt == 12 and glyph == 0:
+                start += 1
+            codepoints.update(range(start, min(end, 0x10FFFF) + 1))
+
+    return codepoints
+
+
+def read_cmap_ranges(path, index=0):
+    """读取字体文件的cmap表，返回已排序的[起始码位, 结束码位]区间列表（通过mmap读取，不复制整个文件）"""
+    data = get_font_manager().map_file(path)
+    tables = _table_offsets(data, index)
+    if "cmap" not in tables:
+        return []
+    cmap_offset = tables["cmap"][0]
+    count = struct.unpack_from(">H", data, cmap_offset + 2)[0]
+    subtables = {}
+    for i in range(count):
+        platform, encoding, sub_offset = struct.unpack_from(">HHI", data, cmap_offset + 4 + 8 * i)
+        subtables.setdefault((platform, encoding), cmap_offset + sub_offset)
+
+    codepoints = set()
+    for key in _CMAP_PREFERENCE:
+        if key in subtables:
+            codepoints = _cmap_codepoints(data, subtables[key])
+            if codepoints:
+                break
+
+    ranges = []
+    for code in sorted(codepoints):
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return ranges
+
+
+def _ranges_to_bitset(ranges):
+    bits = bytearray(_BITSET_BYTES)
+    for start, end in ranges:
+        for code in range(start, end + 1):
+            bits[code >> 3] |= 1 << (code & 7)
+    return bytes(bits)
+
+
+def _is_sticky(char):
+    """空白、标点、组合字符和控制字符优先沿用当前片段的字体，避免把一个词拆成多个字体片段"""
+    return unicodedata.category(char)[0] in "ZPMC"
+
+
+class CoverageIndex:
+    """
+    字体码位覆盖索引：首次使用时为fonts目录下的所有字体建立cmap位图并写入缓存文件，
+    之后每个字符的覆盖查询都是O(1)的位运算。
+    """
+
+    def __init__(self, font_dir=FONT_DIR, cache_path=COVERAGE_CACHE_PATH):
+        self.font_dir = font_dir
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._bitsets = {}
+        self._fallbacks = {}
+        self._loaded = False
+        self._counters = {
+            "fonts_loaded": 0,
+            "fonts_built": 0,
+            "chains_built": 0,
+        }
+
+    def font_files(self):
+        """fonts目录下的所有字体文件（绝对路径，按文件名排序）"""
+        try:
+            names = sorted(os.listdir(self.font_dir))
+        except OSError:
+            return []
+        return [os.path.join(self.font_dir, name) for name in names if name.lower().endswith(FONT_EXTENSIONS)]
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("version") != COVERAGE_VERSION:
+            return {}
+        return cache.get("fonts", {})
+
+    def _write_cache(self, entries):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": COVERAGE_VERSION, "fonts": entries}, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            log_warning(f"写入字体覆盖索引失败: {e}")
+
+    def _entry_for(self, path, cached):
+        """返回(缓存条目, 是否新建)，字体文件大小和修改时间都未变化时复用缓存条目"""
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime_ns:
+            return entry, False
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "ranges": read_cmap_ranges(path)}
+        return entry, True
+
+    def _ensure_loaded(self, extra_paths=()):
+        """建立fonts目录下所有字体（以及extra_paths）的位图，有新建条目时写回缓存文件"""
+        with self._lock:
+            missing = [path for path in extra_paths if path not in self._bitsets]
+            if self._loaded and not missing:
+                return
+            paths = ([] if self._loaded else self.font_files()) + missing
+            cached = self._read_cache()
+            entries = dict(cached)
+            changed = False
+            for path in paths:
+                if path in self._bitsets:
+                    continue
+                try:
+                    entry, built = self._entry_for(path, cached)
+                except (OSError, struct.error) as e:
+                    log_warning(f"读取字体码位表失败: {path}: {e}")
+                    self._bitsets[path] = bytes(_BITSET_BYTES)
+                    continue
+                # 按批次生成的子集字体只建立内存中的位图，不写入缓存文件
+                if not get_font_manager().is_subset(path):
+                    entries[path] = entry
+                    changed = changed or built
+                self._counters["fonts_built" if built else "fonts_loaded"] += 1
+                self._bitsets[path] = _ranges_to_bitset(entry["ranges"])
+            self._loaded = True
+            if changed:
+                self._write_cache(entries)
+                log_debug(f"已更新字体覆盖索引: {self.cache_path}")
+
+    def bitset(self, path):
+        """返回字体的码位位图，未建立索引的字体会先建立索引"""
+        bits = self._bitsets.get(path)
+        if bits is None:
+            self._ensure_loaded((path,))
+            bits = self._bitsets[path]
+        return bits
+
+    def covers(self, path, char):
+        code = ord(char)
+        return bool(self.bitset(path)[code >> 3] >> (code & 7) & 1)
+
+    def fallback_paths(self, primary):
+        """
+        回退字体顺序：主字体、font_config.json中各语言的字体（按配置顺序），最后是fonts目录中的其余字体
+        """
+        self._ensure_loaded()
+        config = get_font_cache().get_config() or {}
+        # 配置文件未修改时get_config返回同一个对象，可据此复用上次的结果
+        cached = self._fallbacks.get(primary)
+        if cached is not None and cached[0] is config:
+            return cached[1]
+        paths = [primary]
+        for lang in config.get("languages", []):
+            paths.append(os.path.join(self.font_dir, lang.get("font", "")))
+        paths.extend(self.font_files())
+        ordered = []
+        for path in paths:
+            if path not in ordered and os.path.isfile(path):
+                ordered.append(path)
+        self._fallbacks[primary] = (config, ordered)
+        return ordered
+
+    def needs_fallback(self, path, text):
+        """文本中是否有主字体缺少、但其他字体包含的字符"""
+        primary = self.bitset(path)
+        others = None
+        for char in set(text):
+            code = ord(char)
+            if primary[code >> 3] >> (code & 7) & 1:
+                continue
+            if others is None:
+                others = [self.bitset(other) for other in self.fallback_paths(path)[1:]]
+            if any(bits[code >> 3] >> (code & 7) & 1 for bits in others):
+                return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["fonts_indexed"] = len(self._bitsets)
+        return stats
+
+    def clear(self):
+        """清空内存中的位图，下次使用时从缓存文件重新加载"""
+        with self._lock:
+            self._bitsets.clear()
+            self._fallbacks.clear()
+            self._loaded = False
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+class FallbackFont:
+    """
+    按字符覆盖范围组合多个字体：文本被切分为连续片段，每个片段使用第一个包含该字符的字体。
+    提供断行、测量与字形缓存用到的getlength/getbbox/getmetrics/getmask2，绘制使用draw_text。
+    回退字体在第一次有片段用到时才加载，大多数文本只会加载主字体之外的一两个字体。
+    """
+
+    def __init__(self, primary, paths, bitsets):
+        self.paths = paths
+        self.primary = primary
+        self.path = "|".join(paths)
+        self.size = primary.size
+        self.index = 0
+        self._fonts = [primary] + [None] * (len(paths) - 1)
+        self._bitsets = bitsets
+        self._owners = {}
+
+    @property
+    def fonts(self):
+        """回退链中的全部字体；会加载尚未用到的字体，只在需要完整列表时使用（例如生成SVG的@font-face）"""
+        return [self._font(i) for i in range(len(self.paths))]
+
+    def _font(self, font_index):
+        font = self._fonts[font_index]
+        if font is None:
+            font = self._fonts[font_index] = get_font_manager().load_font(self.paths[font_index], self.size)
+        return font
+
+    def set_primary(self, font):
+        """替换主字体（字体缓存可能返回新的同名字体对象），已加载的回退字体保持不变"""
+        self._fonts[0] = self.primary = font
+
+    def covers(self, char):
+        """回退链中是否有字体包含该字符"""
+        return self._owner(char)[0] is not None
+
+    def _owner(self, char):
+        """返回(第一个包含该字符的字体序号或None, 是否沿用当前字体)"""
+        owner = self._owners.get(char)
+        if owner is None:
+            code = ord(char)
+            first = next((i for i, bits in enumerate(self._bitsets) if bits[code >> 3] >> (code & 7) & 1), None)
+            owner = self._owners[char] = (first, _is_sticky(char))
+        return owner
+
+    def _covers(self, font_index, char):
+        code = ord(char)
+        return bool(self._bitsets[font_index][code >> 3] >> (code & 7) & 1)
+
+    def runs(self, text):
+        """将文本切分为[(字体, 片段)]列表"""
+        runs = []
+        current = None
+        start = 0
+        for i, char in enumerate(text):
+            first, sticky = self._owner(char)
+            if current is not None:
+                # 没有任何字体包含的字符留在当前片段；空白和标点在当前字体包含时不切换字体
+                if first is None or first == current or (sticky and self._covers(current, char)):
+                    continue
+            target = 0 if first is None else first
+            if target != current:
+                if current is not None:
+                    runs.append((self._font(current), text[start:i]))
+                current = target
+                start = i
+        if current is not None:
+            runs.append((self._font(current), text[start:]))
+        return runs
+
+    def getmetrics(self):
+        return self.primary.getmetrics()
+
+    def getlength(self, text, *args, **kwargs):
+        return sum(font.getlength(part) for font, part in self.runs(text))
+
+    def getbbox(self, text, *args, anchor=None, **kwargs):
+        """与FreeTypeFont.getbbox相同：默认以左上角(la)为原点，anchor="ls"时以基线为原点"""
+        x = 0.0
+        box = None
+        for font, part in self.runs(text):
+            left, top, right, bottom = font.getbbox(part, anchor="ls")
+            left, right = left + int(round(x)), right + int(round(x))
+            box = (left, top, right, bottom) if box is None else (
+                min(box[0], left), min(box[1], top), max(box[2], right), max(box[3], bottom))
+            x += font.getlength(part)
+        if box is None:
+            box = (0, 0, 0, 0)
+        if anchor in (None, "la"):
+            ascent = self.primary.getmetrics()[0]
+            box = (box[0], box[1] + ascent, box[2], box[3] + ascent)
+        return box
+
+    def getmask2(self, text, mode="L", *args, anchor=None, **kwargs):
+        """只支持单一字体片段的文本（字形缓存逐字符调用）"""
+        runs = self.runs(text)
+        font, part = runs[0] if runs else (self.primary, text)
+        if len(runs) > 1:
+            raise ValueError("FallbackFont.getmask2只支持单一字体的文本")
+        if anchor in (None, "la"):
+            mask, (x, y) = font.getmask2(part, mode, *args, anchor="ls", **kwargs)
+            return mask, (x, y + self.primary.getmetrics()[0])
+        return font.getmask2(part, mode, *args, anchor=anchor, **kwargs)
+
+
+_coverage_index = CoverageIndex()
+_local = threading.local()
+
+
+def get_coverage_index():
+    """获取进程级共享的字体覆盖索引"""
+    return _coverage_index
+
+
+def resolve_font(font, text):
+    """
+    文本中有主字体缺少、但其他字体包含的字符时返回FallbackFont，否则直接返回font。
+    回退字体按线程缓存（FreeType字体对象不能被多个线程同时使用）。
+    """
+    path = getattr(font, "path", None)
+    if not isinstance(path, str) or not _coverage_index.needs_fallback(path, text):
+        return font
+
+    chains = getattr(_local, "chains", None)
+    if chains is None:
+        chains = _local.chains = {}
+    key = (path, font.size, getattr(font, "index", 0))
+    chain = chains.get(key)
+    if chain is None:
+        paths = _coverage_index.fallback_paths(path)
+        chain = chains[key] = FallbackFont(font, paths, [_coverage_index.bitset(p) for p in paths])
+        with _coverage_index._lock:
+            _coverage_index._counters["chains_built"] += 1
+    else:
+        chain.set_primary(font)
+    return chain
+
+
+def draw_text(draw, xy, text, font, fill):
+    """与draw.text(xy, text, fill, font)相同；FallbackFont按片段逐个绘制，所有片段共用主字体的基线"""
+    if not isinstance(font, FallbackFont):
+        draw.text(xy, text, fill=fill, font=font)
+        return
+    x, y = xy
+    baseline = y + font.getmetrics()[0]
+    for part_font, part in font.runs(text):
+        draw.text((x, baseline), part, fill=fill, font=part_font, anchor="ls")
+        x += part_font.getlength(part)
+
+
+def coverage_stats():
+    """获取字体覆盖索引的统计信息"""
+    return _coverage_index.stats()
@@ -0,0 +1,199 @@
+import os
+import io
+import mmap
+import hashlib
+import threading
+from .bubble_logging import log_debug, log_warning
+from .lazy_import import lazy_module
+from .instrumentation import count
+
+ImageFont = lazy_module("PIL.ImageFont")
+
+# 按批次生成的子集字体目录，可通过环境变量修改
+DEFAULT_SUBSET_DIR = os.environ.get(
+    "CHAT_BUBBLE_SUBSET_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "fonts"))
+# 小于该大小（KB）的字体不生成子集，收益不足以抵消生成子集的时间；fonts目录中除泰文外的字体都在200KB以上
+DEFAULT_SUBSET_MIN_KB = int(os.environ.get("CHAT_BUBBLE_SUBSET_MIN_KB", "64"))
+# 子集目录中保留的文件数上限，超出后删除最久未使用的文件
+MAX_SUBSET_FILES = 256
+
+# 节点上的字体子集选项
+SUBSET_MODES = ["关闭", "按批次"]
+
+_SUBSET_EXTENSIONS = (".ttf", ".otf")
+
+
+def _subset_font(path, text, output):
+    """用fontTools生成只包含text中字符的子集字体并写入output（路径或文件对象），未安装fontTools时返回False"""
+    try:
+        from fontTools import subset
+    except ImportError:
+        return False
+    options = subset.Options()
+    options.layout_features = ["*"]
+    options.notdef_outline = True
+    font = subset.load_font(path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    subset.save_font(font, output, options)
+    return True
+
+
+class FontManager:
+    """
+    进程级字体文件管理。
+    FreeTypeFont始终按路径打开：FreeType以mmap只读映射字体文件，不同字号的字体对象和不同进程都共享页缓存中的
+    同一份文件页面；若以bytes/BytesIO传入，Pillow会为每个字号各复制一份完整的字体数据到进程私有内存。
+    本模块自身读取字体（解析cmap、SVG内嵌）时同样使用mmap，不把整个文件读入内存；
+    可选地为一个批次生成只含用到字符的子集字体，写入磁盘后按路径打开。
+    """
+
+    def __init__(self, subset_dir=DEFAULT_SUBSET_DIR, subset_min_kb=DEFAULT_SUBSET_MIN_KB):
+        self.subset_dir = subset_dir
+        self.subset_min_bytes = max(0, subset_min_kb) * 1024
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._warned = False
+        self._counters = {
+            "faces_loaded": 0,
+            "files_mapped": 0,
+            "subsets_built": 0,
+            "subset_hits": 0,
+        }
+
+    def load_font(self, path, size, index=0):
+        """按路径创建FreeTypeFont（由FreeType映射文件，不复制字体数据）"""
+        font = ImageFont.truetype(path, size, index=index)
+        with self._lock:
+            self._counters["faces_loaded"] += 1
+        return font
+
+    def map_file(self, path):
+        """返回字体文件的只读mmap，按(大小, 修改时间)缓存，文件被替换后重新映射"""
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._maps.get(path)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        with self._lock:
+            entry = self._maps.get(path)
+            if entry is not None and entry[0] == signature:
+                # 其他线程已经映射了同一文件
+                data.close()
+                return entry[1]
+            # 旧的映射可能仍被调用方引用，交给垃圾回收关闭
+            self._maps[path] = (signature, data)
+            self._counters["files_mapped"] += 1
+        return data
+
+    def subset(self, path, text):
+        """
+        返回只包含text中字符的子集字体路径，文件已存在时直接复用。
+        字体较小、为字体集合(.ttc)、未安装fontTools或生成失败时返回原路径。
+        """
+        if not path or not text or not path.lower().endswith(_SUBSET_EXTENSIONS):
+            return path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path
+        if stat.st_size < self.subset_min_bytes:
+            return path
+
+        chars = "".join(sorted(set(text) | {" "}))
+        digest = hashlib.sha1(f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{chars}".encode("utf-8")).hexdigest()[:16]
+        name, ext = os.path.splitext(os.path.basename(path))
+        subset_path = os.path.join(self.subset_dir, f"{name}-{digest}{ext}")
+        if os.path.exists(subset_path):
+            with self._lock:
+                self._counters["subset_hits"] += 1
+            count("font_subset_hits")
+            return subset_path
+
+        temp_path = f"{subset_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.subset_dir, exist_ok=True)
+            if not _subset_font(path, chars, temp_path):
+                self._warn_no_fonttools()
+                return path
+            os.replace(temp_path, subset_path)
+        except Exception as e:
+            log_warning(f"生成子集字体失败: {path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return path
+
+        with self._lock:
+            self._counters["subsets_built"] += 1
+        count("font_subsets_built")
+        log_debug(f"已生成子集字体: {subset_path}（{len(chars)}个字符）")
+        self._prune_subsets()
+        return subset_path
+
+    def subset_data(self, path, text):
+        """返回只包含text中字符的子集字体数据，未安装fontTools时返回None（每个进程只警告一次）"""
+        buffer = io.BytesIO()
+        if not _subset_font(path, text, buffer):
+            self._warn_no_fonttools()
+            return None
+        return buffer.getvalue()
+
+    def _warn_no_fonttools(self):
+        with self._lock:
+            if self._warned:
+                return
+            self._warned = True
+        log_warning("未安装fontTools，字体子集不可用，将使用完整的字体文件")
+
+    def _prune_subsets(self):
+        """子集文件超过上限时删除最久未使用的文件"""
+        try:
+            entries = [os.path.join(self.subset_dir, name) for name in os.listdir(self.subset_dir)
+                       if name.lower().endswith(_SUBSET_EXTENSIONS)]
+            if len(entries) <= MAX_SUBSET_FILES:
+                return
+            entries.sort(key=lambda entry: os.stat(entry).st_atime)
+            for entry in entries[:len(entries) - MAX_SUBSET_FILES]:
+                os.remove(entry)
+        except OSError as e:
+            log_warning(f"清理子集字体目录失败: {e}")
+
+    def is_subset(self, path):
+        """路径是否为本管理器生成的子集字体"""
+        return isinstance(path, str) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.subset_dir)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["files_mapped_now"] = len(self._maps)
+        return stats
+
+    def clear(self):
+        """释放缓存的文件映射并重置计数"""
+        with self._lock:
+            self._maps.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+# 全局共享的字体管理器实例
+_font_manager = FontManager()
+
+
+def get_font_manager():
+    """获取进程级共享的字体管理器"""
+    return _font_manager
+
+
+def font_manager_stats():
+    """获取字体管理器的统计信息"""
+    return _font_manager.stats()
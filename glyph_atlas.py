@@ -0,0 +1,161 @@
+import threading
+import unicodedata
+from .text_layout import _font_key
+from .lazy_import import lazy_module
+from .instrumentation import count
+
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+
+# 节点上的文本渲染方式：FreeType逐次光栅化，或使用字形缓存拼接
+TEXT_BACKENDS = ["FreeType", "字形缓存"]
+
+# 每个字体缓存的字形与字偶距上限，超出后清空该字体的缓存
+MAX_GLYPHS_PER_FONT = 4096
+MAX_PAIRS_PER_FONT = 16384
+
+_lock = threading.Lock()
+_atlases = {}
+_kerning = {}
+_counters = {
+    "glyph_hits": 0,
+    "glyph_misses": 0,
+    "glyphs_drawn": 0,
+    "fallbacks": 0,
+}
+
+
+def needs_shaping(text):
+    """
+    文本是否需要字形整形（连写、重排或组合字符定位），这类文本不能逐字拼接，需回退到FreeType绘制。
+    包括希伯来文、阿拉伯文、天城文等印度系文字、泰文、老挝文，以及所有组合字符。
+    """
+    for char in text:
+        code = ord(char)
+        if (0x0590 <= code <= 0x08FF or      # 希伯来文、阿拉伯文、叙利亚文等
+                0x0900 <= code <= 0x0DFF or  # 天城文等印度系文字
+                0x0E00 <= code <= 0x0EFF or  # 泰文、老挝文
+                0xFB1D <= code <= 0xFDFF or  # 希伯来/阿拉伯表现形式A
+                0xFE70 <= code <= 0xFEFF or  # 阿拉伯表现形式B
+                0x200C <= code <= 0x200F):   # 零宽连接符与方向控制符
+            return True
+        if code >= 0x0300 and unicodedata.category(char) in ("Mn", "Mc", "Me"):
+            return True
+    return False
+
+
+def _glyph(font, key, char):
+    """返回字符的(覆盖率数组, 相对基线原点的x偏移, y偏移)，按字体缓存"""
+    with _lock:
+        glyphs = _atlases.get(key)
+        if glyphs is not None:
+            glyph = glyphs.get(char)
+            if glyph is not None:
+                _counters["glyph_hits"] += 1
+                return glyph
+
+    mask, offset = font.getmask2(char, "L", anchor="ls")
+    width, height = mask.size
+    coverage = np.frombuffer(bytes(mask), dtype=np.uint8).reshape(height, width)
+    glyph = (coverage, offset[0], offset[1])
+
+    count("glyph_cache_misses")
+    with _lock:
+        _counters["glyph_misses"] += 1
+        glyphs = _atlases.setdefault(key, {})
+        if len(glyphs) >= MAX_GLYPHS_PER_FONT:
+            glyphs.clear()
+        glyphs[char] = glyph
+    return glyph
+
+
+def _advance(font, key, prev, char):
+    """返回前一个字符原点到当前字符原点的距离（前一个字符的前进宽度加字偶距），按字符对缓存"""
+    pair = prev + char
+    with _lock:
+        pairs = _kerning.get(key)
+        if pairs is not None:
+            advance = pairs.get(pair)
+            if advance is not None:
+                return advance
+
+    advance = font.getlength(pair) - font.getlength(char)
+
+    with _lock:
+        pairs = _kerning.setdefault(key, {})
+        if len(pairs) >= MAX_PAIRS_PER_FONT:
+            pairs.clear()
+        pairs[pair] = advance
+    return advance
+
+
+def draw_lines(img, lines, positions, font, color):
+    """
+    用缓存的字形覆盖率拼出所有行的alpha遮罩，再以文本颜色一次性填充到img上。
+    positions为每行左上角（与draw.text默认锚点相同）的坐标。返回False表示文本需要整形，调用方应回退到draw.text。
+    """
+    if any(needs_shaping(line) for line in lines):
+        with _lock:
+            _counters["fallbacks"] += 1
+        return False
+
+    key = _font_key(font)
+    ascent = font.getmetrics()[0]
+    placed = []
+    for line, (x, y) in zip(lines, positions):
+        pen = float(x)
+        prev = None
+        for char in line:
+            if prev is not None:
+                pen += _advance(font, key, prev, char)
+            prev = char
+            coverage, dx, dy = _glyph(font, key, char)
+            if coverage.size:
+                placed.append((coverage, int(round(pen)) + dx, y + ascent + dy))
+
+    if not placed:
+        return True
+
+    # 所有字形合并到一个覆盖文本区域的遮罩中，重叠部分取最大值（与FreeType逐字绘制一致）
+    left = max(0, min(gx for _, gx, _ in placed))
+    top = max(0, min(gy for _, _, gy in placed))
+    right = min(img.width, max(gx + c.shape[1] for c, gx, _ in placed))
+    bottom = min(img.height, max(gy + c.shape[0] for c, _, gy in placed))
+    if right <= left or bottom <= top:
+        return True
+
+    mask = np.zeros((bottom - top, right - left), dtype=np.uint8)
+    for coverage, gx, gy in placed:
+        x0, y0 = gx - left, gy - top
+        sx, sy = max(0, -x0), max(0, -y0)
+        x1 = min(mask.shape[1], x0 + coverage.shape[1])
+        y1 = min(mask.shape[0], y0 + coverage.shape[0])
+        if x1 <= x0 + sx or y1 <= y0 + sy:
+            continue
+        region = mask[y0 + sy:y1, x0 + sx:x1]
+        np.maximum(region, coverage[sy:sy + region.shape[0], sx:sx + region.shape[1]], out=region)
+
+    with _lock:
+        _counters["glyphs_drawn"] += len(placed)
+    count("glyphs_drawn", len(placed))
+    img.paste(tuple(color), (left, top, right, bottom), Image.fromarray(mask))
+    return True
+
+
+def atlas_stats():
+    """返回字形缓存的命中统计"""
+    with _lock:
+        stats = dict(_counters)
+        stats["fonts_cached"] = len(_atlases)
+        stats["glyphs_cached"] = sum(len(glyphs) for glyphs in _atlases.values())
+        stats["bytes"] = sum(glyph[0].nbytes for glyphs in _atlases.values() for glyph in glyphs.values())
+    return stats
+
+
+def clear_atlas():
+    """清空字形与字偶距缓存并重置计数"""
+    with _lock:
+        _atlases.clear()
+        _kerning.clear()
+        for name in _counters:
+            _counters[name] = 0
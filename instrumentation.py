@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+from time import perf_counter
+
+# 设置CHAT_BUBBLE_STATS=1或调用enable_stats(True)后，全局累计各阶段耗时与计数；
+# 关闭时stage()返回共享的空上下文，count()直接返回，几乎没有额外开销
+_enabled = os.environ.get("CHAT_BUBBLE_STATS", "0").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_local = threading.local()
+
+
+class Recorder:
+    """一次调用范围内的统计，由collect()创建，只记录当前线程中发生的阶段与计数"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def stats(self):
+        return _snapshot(self.stages, self.counters)
+
+
+def _snapshot(stages, counters):
+    return {
+        "stages": {name: {"calls": calls, "total_ms": total * 1000, "max_ms": longest * 1000}
+                   for name, (calls, total, longest) in stages.items()},
+        "counters": dict(counters),
+    }
+
+
+def _add_stage(stages, name, elapsed):
+    calls, total, longest = stages.get(name, (0, 0.0, 0.0))
+    stages[name] = (calls + 1, total + elapsed, max(longest, elapsed))
+
+
+def _recorders():
+    return getattr(_local, "recorders", None)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        if _enabled:
+            with _lock:
+                _add_stage(_stages, self.name, elapsed)
+        for recorder in _recorders() or ():
+            _add_stage(recorder.stages, self.name, elapsed)
+        return False
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+def stage(name):
+    """计时上下文：with stage("wrap"): ...；统计关闭时返回空上下文"""
+    if _enabled or _recorders():
+        return _Stage(name)
+    return _NOOP
+
+
+def count(name, amount=1):
+    """累加一个计数器（例如fonts_loaded、glyphs_drawn、bytes_allocated）"""
+    if not _enabled and not _recorders():
+        return
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+    for recorder in _recorders() or ():
+        recorder.counters[name] = recorder.counters.get(name, 0) + amount
+
+
+class collect:
+    """
+    收集一段代码内当前线程的统计，即使全局统计处于关闭状态：
+        with collect() as recorder:
+            ...
+        recorder.stats()
+    """
+
+    def __enter__(self):
+        recorders = _recorders()
+        if recorders is None:
+            recorders = _local.recorders = []
+        self.recorder = Recorder()
+        recorders.append(self.recorder)
+        return self.recorder
+
+    def __exit__(self, *exc):
+        _local.recorders.remove(self.recorder)
+        return False
+
+
+def enable_stats(enabled=True):
+    """开启或关闭全局统计"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def stats_enabled():
+    return _enabled
+
+
+def get_stats():
+    """返回全局累计的各阶段耗时（调用次数、总毫秒、最长毫秒）与计数器"""
+    with _lock:
+        return _snapshot(_stages, _counters)
+
+
+def reset_stats():
+    """清空全局累计的统计"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def format_stats(stats):
+    """将统计格式化为一行结构化日志（JSON）"""
+    stages = {name: round(value["total_ms"], 3) for name, value in stats["stages"].items()}
+    return json.dumps({"stages_ms": stages, "counters": stats["counters"]}, ensure_ascii=False, sort_keys=True)
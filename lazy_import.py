@@ -0,0 +1,46 @@
+import importlib
+import threading
+
+# 需要导入耗时较长的依赖（torch、numpy、PIL）的模块通过lazy_module引用，
+# 注册节点和响应INPUT_TYPES时不会导入这些依赖，第一次真正渲染时才导入
+
+_lock = threading.Lock()
+_pending = []
+
+
+class LazyModule:
+    """模块代理，首次访问属性时才执行import，之后直接转发到真实模块"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # import_module自带导入锁，多个线程同时触发时只会导入一次
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "已导入" if self._module is not None else "未导入"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_module(name):
+    """返回模块的延迟代理"""
+    module = LazyModule(name)
+    with _lock:
+        _pending.append(module)
+    return module
+
+
+def load_all():
+    """立即导入所有延迟模块（预热线程使用）"""
+    with _lock:
+        modules = list(_pending)
+    for module in modules:
+        module._load()
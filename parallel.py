@@ -0,0 +1,206 @@
+import os
+import threading
+from .font_cache import get_font_cache
+from .font_manager import get_font_manager
+from .bubble_logging import log_debug, log_warning
+from .lazy_import import lazy_module
+
+Image = lazy_module("PIL.Image")
+ImageFont = lazy_module("PIL.ImageFont")
+# multiprocessing与concurrent.futures的导入也有数十毫秒，只在开启并行时才需要
+multiprocessing = lazy_module("multiprocessing")
+futures = lazy_module("concurrent.futures")
+resource_tracker = lazy_module("multiprocessing.resource_tracker")
+shared_memory = lazy_module("multiprocessing.shared_memory")
+
+# 节点上的并行模式选项
+PARALLEL_MODES = ["关闭", "线程", "进程"]
+
+# 工作线程/进程数为0时的默认值，未设置环境变量时使用CPU核数
+DEFAULT_WORKERS = int(os.environ.get("CHAT_BUBBLE_WORKERS", "0"))
+
+_lock = threading.Lock()
+_executors = {}
+_thread_fonts = threading.local()
+
+
+def resolve_workers(workers=0):
+    """返回实际使用的工作数：显式指定的值优先，其次是环境变量，最后是CPU核数"""
+    if workers and workers > 0:
+        return int(workers)
+    if DEFAULT_WORKERS > 0:
+        return DEFAULT_WORKERS
+    return os.cpu_count() or 1
+
+
+def process_mode_available():
+    """进程模式依赖fork启动方式：子进程直接继承已导入的节点模块，无需按包名重新导入"""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _font_ref(font):
+    """将FreeTypeFont替换为可在线程/进程间传递的(路径, 字号, 索引)，无法按路径重建的字体返回None"""
+    path = getattr(font, "path", None)
+    if isinstance(path, str):
+        return (path, font.size, getattr(font, "index", 0))
+    return None
+
+
+def _thread_font(path, size, index=0):
+    """
+    每个工作线程持有自己的FreeTypeFont。PIL绘制文本时会释放GIL，
+    同一个FreeType字体对象不能被多个线程同时使用。
+    """
+    fonts = getattr(_thread_fonts, "fonts", None)
+    if fonts is None:
+        fonts = _thread_fonts.fonts = {}
+    key = (path, size, index)
+    font = fonts.get(key)
+    if font is None:
+        font = fonts[key] = get_font_manager().load_font(path, size, index)
+    return font
+
+
+def _process_font(path, size, index=0):
+    """进程模式下每个工作进程使用自己的进程级字体缓存"""
+    if index:
+        return get_font_manager().load_font(path, size, index)
+    return get_font_cache().get_font(path, size)
+
+
+def _render_spec(node_cls, spec, load_font):
+    """按_render_bubble的位置参数渲染一个气泡，spec中的字体为_font_ref返回的引用"""
+    ref = spec[6]
+    font = load_font(*ref) if ref is not None else ImageFont.load_default()
+    return node_cls()._render_bubble(*spec[:6], font, *spec[7:])
+
+
+def _render_in_thread(node_cls, spec):
+    return _render_spec(node_cls, spec, _thread_font)
+
+
+def _render_in_process(node_cls, spec):
+    """在工作进程中渲染，像素写入新建的共享内存块，只把块名和尺寸传回主进程"""
+    img = _render_spec(node_cls, spec, _process_font)
+    data = img.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        block.buf[:len(data)] = data
+        return block.name, img.size
+    finally:
+        block.close()
+
+
+def _render_chunk_in_process(node_cls, specs):
+    """在工作进程中渲染一组气泡；其中某个气泡失败时先释放本组已创建的共享内存块再抛出"""
+    results = []
+    try:
+        for spec in specs:
+            results.append(_render_in_process(node_cls, spec))
+    except BaseException:
+        _release_blocks(results)
+        raise
+    return results
+
+
+def _release_blocks(results):
+    """释放已创建但不再读取的共享内存块"""
+    for name, _ in results:
+        try:
+            block = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+
+
+def _take_shared_image(name, size):
+    """从共享内存块读取RGBA图像并释放该块"""
+    block = shared_memory.SharedMemory(name=name)
+    view = block.buf[:size[0] * size[1] * 4]
+    try:
+        return Image.frombytes('RGBA', size, view)
+    finally:
+        # 关闭共享内存前必须先释放对其缓冲区的引用
+        view.release()
+        block.close()
+        block.unlink()
+
+
+def _get_executor(mode, workers):
+    """按(模式, 工作数)复用线程池/进程池，避免每次执行都重新创建工作进程"""
+    key = (mode, workers)
+    with _lock:
+        executor = _executors.get(key)
+        if executor is None:
+            if mode == "进程":
+                if threading.active_count() > 1:
+                    # ComfyUI服务进程是多线程的（可能已初始化CUDA），fork时其他线程持有的锁会被复制到工作进程中
+                    log_warning("进程模式从多线程进程fork工作进程，若fork时其他线程持有锁，工作进程可能死锁；"
+                                "在ComfyUI中建议优先使用线程模式")
+                # 资源跟踪进程需在fork之前启动，主进程与工作进程共用同一个跟踪进程登记共享内存块
+                resource_tracker.ensure_running()
+                executor = futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+            else:
+                executor = futures.ThreadPoolExecutor(workers, thread_name_prefix="chat_bubble")
+            _executors[key] = executor
+        return executor
+
+
+def render_parallel(node_cls, specs, mode="线程", workers=0):
+    """
+    并行渲染多个气泡，返回与specs顺序一致的PIL RGBA图像列表。
+    specs为_render_bubble的位置参数元组；线程模式下每个线程使用独立的字体对象，
+    进程模式下图像经共享内存传回，不做pickle序列化。只有一个气泡或一个工作者时直接顺序渲染，
+    mode不是PARALLEL_MODES之一时抛出ValueError。
+    """
+    if mode not in PARALLEL_MODES:
+        raise ValueError(f"未知的并行模式: {mode!r}，可选: {', '.join(PARALLEL_MODES)}")
+    workers = min(resolve_workers(workers), len(specs))
+    if mode == "进程" and not process_mode_available():
+        log_warning("当前平台不支持fork，进程模式改用线程模式")
+        mode = "线程"
+    if mode not in ("线程", "进程") or workers <= 1:
+        shape_cache = {}
+        return [node_cls()._render_bubble(*spec, shape_cache=shape_cache) for spec in specs]
+
+    jobs = [spec[:6] + (_font_ref(spec[6]),) + tuple(spec[7:]) for spec in specs]
+    executor = _get_executor(mode, workers)
+    log_debug(f"{mode}模式并行渲染{len(jobs)}个气泡，工作数: {workers}")
+
+    if mode == "线程":
+        # map按提交顺序返回结果，保证输出顺序确定
+        return list(executor.map(_render_in_thread, [node_cls] * len(jobs), jobs))
+
+    # 分块提交以减少进程间通信次数
+    chunksize = max(1, len(jobs) // (workers * 4))
+    pending = [executor.submit(_render_chunk_in_process, node_cls, jobs[i:i + chunksize])
+               for i in range(0, len(jobs), chunksize)]
+    results = []
+    done = 0
+    try:
+        for future in pending:
+            results.extend(future.result())
+            done += 1
+    except BaseException:
+        # 部分气泡渲染失败时取消尚未开始的分块，等待正在渲染的分块结束，
+        # 再释放所有已创建但未读取的共享内存块
+        remaining = pending[done:]
+        for future in remaining:
+            future.cancel()
+        futures.wait(remaining)
+        for future in remaining:
+            if not future.cancelled() and future.exception() is None:
+                results.extend(future.result())
+        _release_blocks(results)
+        raise
+    return [_take_shared_image(name, size) for name, size in results]
+
+
+def shutdown_executors():
+    """关闭所有复用的线程池/进程池"""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
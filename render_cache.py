@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from .bubble_logging import log_warning
+from .lazy_import import lazy_module
+from .instrumentation import count
+
+np = lazy_module("numpy")
+
+# 渲染结果格式的版本号，绘制逻辑发生变化时递增，使旧的磁盘缓存失效
+RENDER_VERSION = 4
+
+# 内存缓存的默认字节预算（MB）与磁盘缓存目录，可通过环境变量调整
+DEFAULT_MAX_BYTES = int(os.environ.get("CHAT_BUBBLE_RENDER_CACHE_MB", "256")) * 1024 * 1024
+DEFAULT_CACHE_DIR = os.environ.get(
+    "CHAT_BUBBLE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "render"))
+
+# 节点上的缓存模式选项
+CACHE_MODES = ["关闭", "内存", "内存+磁盘"]
+
+
+def render_key(**params):
+    """根据所有渲染参数计算内容哈希，参数需可被JSON序列化"""
+    payload = json.dumps({"version": RENDER_VERSION, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    按内容哈希缓存渲染好的uint8 RGBA像素：
+    内存层为受字节预算限制的LRU；磁盘层可选，保存为.npy文件并在读取时内存映射。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=DEFAULT_CACHE_DIR):
+        self.max_bytes = max(0, max_bytes)
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_writes": 0,
+        }
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key, use_disk=False):
+        """返回缓存的像素数组(H, W, 4)，未命中时返回None。返回的数组为只读"""
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                count("render_cache_hits")
+                return pixels
+
+        if use_disk:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    pixels = np.load(path, mmap_mode='r')
+                except (OSError, ValueError) as e:
+                    log_warning(f"读取渲染缓存失败: {e}")
+                else:
+                    with self._lock:
+                        self._counters["disk_hits"] += 1
+                    count("render_cache_hits")
+                    self._remember(key, pixels)
+                    return pixels
+
+        with self._lock:
+            self._counters["misses"] += 1
+        count("render_cache_misses")
+        return None
+
+    def put(self, key, pixels, use_disk=False):
+        """保存像素数组到内存层，use_disk为True时同时写入磁盘层"""
+        pixels.setflags(write=False)
+        self._remember(key, pixels)
+
+        if use_disk:
+            path = self._disk_path(key)
+            if not os.path.exists(path):
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # 先写临时文件再改名，避免其他进程读到不完整的文件
+                    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(temp_path, "wb") as f:
+                        np.save(f, pixels)
+                    os.replace(temp_path, path)
+                    with self._lock:
+                        self._counters["disk_writes"] += 1
+                except OSError as e:
+                    log_warning(f"写入渲染缓存失败: {e}")
+
+    def _remember(self, key, pixels):
+        nbytes = pixels.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = pixels
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._counters["evictions"] += 1
+
+    def set_max_bytes(self, max_bytes):
+        """调整内存层的字节预算，超出部分立即淘汰"""
+        with self._lock:
+            self.max_bytes = max(0, int(max_bytes))
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        """返回命中/未命中计数以及内存层占用的字节数"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def format_stats(self):
+        """将统计信息格式化为一行日志"""
+        stats = self.stats()
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hit_rate = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return (f"渲染缓存: 内存命中 {stats['memory_hits']}，磁盘命中 {stats['disk_hits']}，"
+                f"未命中 {stats['misses']}，命中率 {hit_rate:.1%}，"
+                f"内存占用 {stats['bytes'] / 2**20:.1f}/{stats['max_bytes'] / 2**20:.0f}MB")
+
+    def clear(self, disk=False):
+        """清空内存层并重置计数，disk为True时同时删除磁盘缓存文件"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for name in self._counters:
+                self._counters[name] = 0
+        if disk and os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".npy"):
+                        os.remove(os.path.join(root, name))
+
+
+# 全局共享的渲染缓存实例
+_render_cache = RenderCache()
+
+
+def get_render_cache():
+    """获取进程级共享的渲染缓存"""
+    return _render_cache
+
+
+def render_cache_stats():
+    """获取渲染缓存的命中统计"""
+    return _render_cache.stats()
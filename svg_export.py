@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import base64
+import pathlib
+from xml.sax.saxutils import escape, quoteattr, unescape
+from .font_manager import get_font_manager
+
+# 文本聊天气泡的输出模式：只输出位图、同时输出SVG，或只输出SVG（位图输出为1×1的透明占位）
+SVG_OUTPUT_MODES = ["位图", "位图+SVG", "仅SVG"]
+# SVG中字体的引用方式：引用本地字体文件路径，或以base64内嵌（安装fontTools时只内嵌用到的字符）
+FONT_REFERENCE_MODES = ["文件路径", "内嵌"]
+
+# 渲染参数以JSON写在这个metadata元素中，栅格化节点据此在目标分辨率下重新绘制
+METADATA_ID = "chat-bubble-params"
+_METADATA_PATTERN = re.compile(r'<metadata id="%s">(.*?)</metadata>' % METADATA_ID, re.S)
+
+_FONT_MIME = {".ttf": "font/ttf", ".otf": "font/otf", ".ttc": "font/collection"}
+
+
+def _num(value):
+    """SVG坐标格式化：最多保留三位小数，去掉多余的0"""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _hex(color):
+    return "#%02x%02x%02x" % tuple(color[:3])
+
+
+def _body_path(body, radius):
+    """
+    主体圆角矩形的路径。位图中主体包含右/下边界像素，因此路径的右/下边缘在right+1/bottom+1，
+    圆角半径的限制方式与draw_shape_mask相同。
+    """
+    left, top, right, bottom = [int(round(v)) for v in body]
+    right += 1
+    bottom += 1
+    r = min(int(round(radius)), (right - left) // 2, (bottom - top) // 2)
+    if r <= 0:
+        return f"M{left} {top}H{right}V{bottom}H{left}Z"
+    return (f"M{left + r} {top}H{right - r}A{r} {r} 0 0 1 {right} {top + r}"
+            f"V{bottom - r}A{r} {r} 0 0 1 {right - r} {bottom}"
+            f"H{left + r}A{r} {r} 0 0 1 {left} {bottom - r}"
+            f"V{top + r}A{r} {r} 0 0 1 {left + r} {top}Z")
+
+
+def _tail_path(tail):
+    """尾巴多边形的路径。位图中多边形顶点位于像素中心，SVG坐标需要偏移半个像素"""
+    points = [f"{_num(x + 0.5)} {_num(y + 0.5)}" for x, y in tail]
+    return "M" + "L".join(points) + "Z"
+
+
+def _font_source(path, text, embed):
+    """@font-face的src：文件路径模式为file URL，内嵌模式为base64数据URL"""
+    if not embed:
+        return "url(%s)" % json.dumps(pathlib.Path(path).resolve().as_uri())
+    data = get_font_manager().subset_data(path, text)
+    mime = "font/ttf"
+    if data is None:
+        # 未安装fontTools时subset_data已经警告过（每个进程一次），内嵌完整的字体文件
+        data = get_font_manager().map_file(path)
+        mime = _FONT_MIME.get(os.path.splitext(path)[1].lower(), "font/ttf")
+    return "url(%s)" % json.dumps(f"data:{mime};base64," + base64.b64encode(data).decode("ascii"))
+
+
+def _font_faces(font, text, embed):
+    """
+    返回(@font-face样式表, font-family列表)。
+    字体回退链中实际绘制了文本片段的字体注册为chat-bubble-N，并附上字体自身的族名与sans-serif作为后备；
+    未用到的回退字体既不加载也不写入SVG。
+    """
+    if hasattr(font, "runs"):
+        fonts = list({id(item): item for item, _ in font.runs(text)}.values()) or [font.primary]
+    else:
+        fonts = [font]
+    rules = []
+    families = []
+    for i, item in enumerate(fonts):
+        path = getattr(item, "path", None)
+        if isinstance(path, str) and os.path.exists(path):
+            name = f"chat-bubble-{i}"
+            rules.append("@font-face{font-family:%s;src:%s;}" % (json.dumps(name), _font_source(path, text, embed)))
+            families.append(json.dumps(name))
+        try:
+            family = item.getname()[0]
+        except (AttributeError, TypeError):
+            family = None
+        if family:
+            families.append(json.dumps(family))
+    families.append("sans-serif")
+    return "".join(rules), ", ".join(dict.fromkeys(families))
+
+
+def bubble_svg(geometry, size, color_rgba, text_color, lines, positions, font, font_size, params=None, embed_font=False,
+               visual_order=False):
+    """
+    生成与位图相同形状的SVG：主体为圆角矩形路径，尾巴为多边形路径，文本为引用字体文件的text元素。
+    geometry与size来自place_geometry，positions为每行左上角坐标（与位图绘制时相同）。
+    params为渲染参数，写入metadata供栅格化节点使用。
+    visual_order表示lines已经整形并重排为视觉顺序，此时禁止浏览器再次做双向重排。
+    """
+    width, height = size
+    ascent = font.getmetrics()[0]
+    style, families = _font_faces(font, "".join(lines), embed_font)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}">']
+    if params is not None:
+        parts.append(f'<metadata id="{METADATA_ID}">{escape(json.dumps(params, ensure_ascii=False))}</metadata>')
+    if style:
+        parts.append(f"<defs><style>{escape(style)}</style></defs>")
+
+    # 主体与尾巴放在同一组中设置不透明度，重叠部分不会叠加两次
+    fill = _hex(color_rgba)
+    opacity = color_rgba[3] / 255 if len(color_rgba) > 3 else 1
+    group = f'<g fill="{fill}"' + (f' opacity="{_num(opacity)}"' if opacity < 1 else "") + ">"
+    parts.append(group)
+    parts.append(f'<path d="{_body_path(geometry.body, geometry.radius)}"/>')
+    if geometry.tail:
+        parts.append(f'<path d="{_tail_path(geometry.tail)}"/>')
+    parts.append("</g>")
+
+    # unicode-bidi不会继承，必须设置在每个text元素上
+    bidi = ' direction="ltr" unicode-bidi="bidi-override"' if visual_order else ""
+    parts.append(f'<g font-family={quoteattr(families)} font-size="{_num(font_size)}" fill="{_hex(text_color)}">')
+    for line, (x, y) in zip(lines, positions):
+        # 位图中每行以上升线为顶部定位，SVG的y为基线
+        parts.append(f'<text x="{_num(x)}" y="{_num(y + ascent)}"{bidi} xml:space="preserve">{escape(line)}</text>')
+    parts.append("</g></svg>")
+    return "\n".join(parts)
+
+
+def parse_svg_params(svg):
+    """读取bubble_svg写入的渲染参数，返回(参数字典, (宽, 高))；不是本节点生成的SVG时抛出ValueError"""
+    match = _METADATA_PATTERN.search(svg or "")
+    if match is None:
+        raise ValueError("SVG中没有聊天气泡的渲染参数，只能栅格化文本聊天气泡节点输出的SVG")
+    params = json.loads(unescape(match.group(1)))
+    size = re.search(r'<svg[^>]*\bwidth="(\d+)"[^>]*\bheight="(\d+)"', svg)
+    return params, ((int(size.group(1)), int(size.group(2))) if size else None)
+
+
+def save_svg(svg, path):
+    """将SVG写入文件，自动创建所在目录"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(svg)
@@ -0,0 +1,34 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_DIR = os.path.join(REPO_DIR, "fonts")
+
+
+def _load_package(name="chat_bubbles"):
+    """不依赖ComfyUI，直接以包的形式导入本仓库（节点模块使用相对导入），与benchmarks/_common.py相同"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(REPO_DIR, "__init__.py"), submodule_search_locations=[REPO_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+_load_package()
+
+
+@pytest.fixture
+def font_path():
+    """返回fonts目录中字体文件的路径，文件不存在时跳过测试"""
+    def resolve(name):
+        path = os.path.join(FONT_DIR, name)
+        if not os.path.exists(path):
+            pytest.skip(f"缺少字体文件: {name}")
+        return path
+    return resolve
@@ -0,0 +1,143 @@
+import os
+import json
+import struct
+
+import pytest
+
+from chat_bubbles.font_fallback import CoverageIndex, read_cmap_ranges, _table_offsets
+
+SHIPPED_FONTS = [
+    "NotoSans-Regular.ttf",
+    "NotoSansArabic-Regular.ttf",
+    "NotoSansCyrillic-Regular.ttf",
+    "NotoSansDevanagari-Regular.ttf",
+    "NotoSansThai-Regular.ttf",
+]
+
+
+def _codepoints(ranges):
+    return {code for start, end in ranges for code in range(start, end + 1)}
+
+
+def _with_format12_cmap(data, groups):
+    """把字体的cmap表替换为只含一个(3, 10)格式12子表的版本，groups为(起始码位, 结束码位, 起始字形)列表"""
+    subtable = struct.pack(">HHIII", 12, 0, 16 + 12 * len(groups), 0, len(groups))
+    subtable += b"".join(struct.pack(">III", *group) for group in groups)
+    cmap = struct.pack(">HHHHI", 0, 1, 3, 10, 12) + subtable
+
+    font = bytearray(data)
+    font += b"\0" * (-len(font) % 4)
+    cmap_offset = len(font)
+    font += cmap
+    # 修改表目录中cmap表的偏移和长度（解析器不校验checksum）
+    num_tables = struct.unpack_from(">H", font, 4)[0]
+    for i in range(num_tables):
+        entry = 12 + 16 * i
+        if font[entry:entry + 4] == b"cmap":
+            struct.pack_into(">II", font, entry + 8, cmap_offset, len(cmap))
+            break
+    assert _table_offsets(bytes(font))["cmap"] == (cmap_offset, len(cmap))
+    return bytes(font)
+
+
+@pytest.mark.parametrize("name", SHIPPED_FONTS)
+def test_format4_matches_freetype(font_path, name):
+    """格式4子表的解析结果与FreeType一致：有映射的字符绘制结果与.notdef不同"""
+    from PIL import ImageFont
+    path = font_path(name)
+    font = ImageFont.truetype(path, 20)
+
+    def render(char):
+        mask = font.getmask(char)
+        return mask.size, bytes(mask), font.getlength(char)
+
+    notdef = render("\U0010FFFD")
+    ranges = read_cmap_ranges(path)
+    covered = _codepoints(ranges)
+    assert covered
+
+    # 每个区间的边界两侧与中点，以及BMP前部的均匀采样
+    samples = set(range(0x20, 0x3000, 7))
+    for start, end in ranges:
+        samples.update((start - 1, start, (start + end) // 2, end, end + 1))
+    for code in sorted(samples):
+        if code < 0 or 0xD800 <= code <= 0xDFFF:
+            continue
+        assert (render(chr(code)) != notdef) == (code in covered), hex(code)
+
+
+@pytest.mark.parametrize("name", SHIPPED_FONTS)
+def test_format12_matches_format4(font_path, tmp_path, name):
+    path = font_path(name)
+    with open(path, "rb") as f:
+        data = f.read()
+    ranges = read_cmap_ranges(path)
+    groups = [(start, end, 1 + i) for i, (start, end) in enumerate(ranges)]
+
+    converted = tmp_path / name
+    converted.write_bytes(_with_format12_cmap(data, groups))
+    assert read_cmap_ranges(str(converted)) == ranges
+
+
+def test_format12_group_starting_at_notdef(font_path, tmp_path):
+    with open(font_path("NotoSans-Regular.ttf"), "rb") as f:
+        data = f.read()
+    converted = tmp_path / "notdef.ttf"
+    # 起始字形为0的组中第一个码位映射到.notdef，不算覆盖；补充平面的组也能解析
+    converted.write_bytes(_with_format12_cmap(data, [(0x41, 0x43, 0), (0x1F600, 0x1F602, 10)]))
+    assert read_cmap_ranges(str(converted)) == [[0x42, 0x43], [0x1F600, 0x1F602]]
+
+
+def _copy(source, target, mtime_ns):
+    with open(source, "rb") as f:
+        target.write_bytes(f.read())
+    os.utime(target, ns=(mtime_ns, mtime_ns))
+
+
+def test_coverage_index_persists_and_invalidates(font_path, tmp_path):
+    font_dir = tmp_path / "fonts"
+    font_dir.mkdir()
+    cache_path = tmp_path / "coverage.json"
+    target = font_dir / "a.ttf"
+    path = str(target)
+    _copy(font_path("NotoSansThai-Regular.ttf"), target, 1_000_000_000_000_000_000)
+
+    index = CoverageIndex(str(font_dir), str(cache_path))
+    assert index.covers(path, "ก")
+    assert not index.covers(path, "Ж")
+    assert index.stats()["fonts_built"] == 1
+    entry = json.loads(cache_path.read_text(encoding="utf-8"))["fonts"][path]
+    assert entry["size"] == target.stat().st_size
+
+    # 文件未变化：新的索引实例直接使用缓存文件中的条目
+    index = CoverageIndex(str(font_dir), str(cache_path))
+    assert index.covers(path, "ก")
+    assert index.stats()["fonts_built"] == 0
+    assert index.stats()["fonts_loaded"] == 1
+
+    # 只有修改时间变化（大小不变）：条目同样重建
+    os.utime(target, ns=(1_000_000_000_000_000_000, 1_000_000_000_000_000_002))
+    index = CoverageIndex(str(font_dir), str(cache_path))
+    assert index.covers(path, "ก")
+    assert index.stats()["fonts_built"] == 1
+
+    # 字体被替换且修改时间变化：条目重建并写回缓存文件
+    _copy(font_path("NotoSansCyrillic-Regular.ttf"), target, 1_000_000_000_000_000_003)
+    index = CoverageIndex(str(font_dir), str(cache_path))
+    assert index.covers(path, "Ж")
+    assert not index.covers(path, "ก")
+    assert index.stats()["fonts_built"] == 1
+    entry = json.loads(cache_path.read_text(encoding="utf-8"))["fonts"][path]
+    assert entry["mtime"] == 1_000_000_000_000_000_003
+
+
+def test_coverage_index_ignores_stale_version(font_path, tmp_path):
+    font_dir = tmp_path / "fonts"
+    font_dir.mkdir()
+    _copy(font_path("NotoSansThai-Regular.ttf"), font_dir / "a.ttf", 1_000_000_000_000_000_000)
+    cache_path = tmp_path / "coverage.json"
+    cache_path.write_text(json.dumps({"version": -1, "fonts": {str(font_dir / "a.ttf"): {"ranges": []}}}))
+
+    index = CoverageIndex(str(font_dir), str(cache_path))
+    assert index.covers(str(font_dir / "a.ttf"), "ก")
+    assert index.stats()["fonts_built"] == 1
@@ -0,0 +1,77 @@
+import pytest
+
+from chat_bubbles import text_layout
+from chat_bubbles.text_layout import wrap_text
+
+
+class MonoFont:
+    """等宽测试字体：每个字素簇宽10像素，组合字符不占宽度"""
+
+    def getlength(self, text):
+        return 10 * sum(1 for char in text if not text_layout._is_mark(char))
+
+
+@pytest.fixture
+def font():
+    text_layout.clear_layout_cache()
+    yield MonoFont()
+    text_layout.clear_layout_cache()
+
+
+def test_latin_breaks_at_spaces(font):
+    assert wrap_text("hello world foo", font, 110) == ["hello world", "foo"]
+
+
+def test_explicit_newlines(font):
+    assert wrap_text("ab\n\ncd", font, 1000) == ["ab", "cd"]
+
+
+@pytest.mark.parametrize("text", ["", "   ", " \n\t \n", "\n\n"])
+def test_whitespace_only_input(font, text):
+    assert wrap_text(text, font, 100) == []
+
+
+def test_cjk_breaks_between_characters(font):
+    assert wrap_text("今天天气很好", font, 30) == ["今天天", "气很好"]
+
+
+def test_cjk_no_line_start_punctuation(font):
+    text = "今天天气很好，我们去公园散步。你觉得怎么样？好！"
+    lines = wrap_text(text, font, 30)
+    assert "".join(lines) == text
+    assert all(line[0] not in text_layout._NO_LINE_START for line in lines)
+
+
+def test_cjk_no_line_end_opening_bracket(font):
+    text = "他说「你好」然后（慢慢地）走了《书名》"
+    lines = wrap_text(text, font, 30)
+    assert "".join(lines) == text
+    assert all(line[-1] not in text_layout._NO_LINE_END for line in lines)
+
+
+def test_long_unbreakable_word(font):
+    assert wrap_text("a" * 25, font, 100) == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_long_word_between_short_words(font):
+    assert wrap_text("hi " + "x" * 12 + " yo", font, 100) == ["hi", "x" * 10, "xx yo"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("abc", ["a", "b", "c"]),
+    ("你好", ["你", "好"]),
+    ("éx", ["é", "x"]),
+])
+def test_width_smaller_than_one_glyph(font, text, expected):
+    # 每行至少放一个字素簇，组合字符不会与基字符分开
+    assert wrap_text(text, font, 5) == expected
+
+
+def test_lines_fit_real_font(font_path):
+    from PIL import ImageFont
+    real = ImageFont.truetype(font_path("NotoSans-Regular.ttf"), 24)
+    text = "The quick brown fox jumps over the lazy dog. Pack my box with five dozen liquor jugs."
+    lines = wrap_text(text, real, 200)
+    assert len(lines) > 1
+    assert " ".join(lines) == text
+    assert all(real.getlength(line) <= 200 for line in lines)
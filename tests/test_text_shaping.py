@@ -0,0 +1,92 @@
+import pytest
+
+from chat_bubbles.text_shaping import base_direction, reorder_indic, reorder_line, shape_arabic
+
+# 纯Python双向重排：(逻辑顺序文本, 段落是否从右到左, 期望的视觉顺序)
+REORDER_CASES = [
+    # 成对括号（UAX#9 N0）
+    ("عربي (abc) 123!", True, "!123 (abc) يبرع"),
+    ("عربي (123) عربي", True, "يبرع (123) يبرع"),
+    ("عربي [abc (def)] x", True, "x [abc (def)] يبرع"),
+    ("hello (world) 5", True, "hello (world) 5"),
+    ("abc (عربي) def", False, "abc (يبرع) def"),
+    ("a (b [c) d] e", False, "a (b [c) d] e"),
+    # 数字
+    ("سعر 25% اليوم", True, "مويلا %25 رعس"),
+    ("total ١٢٣ items", False, "total ١٢٣ items"),
+    ("ab 12 cd", True, "ab 12 cd"),
+    # 行尾空白恢复为段落层级（L1），从右到左的段落中位于最左侧
+    ("abc ", True, " abc"),
+]
+
+
+@pytest.mark.parametrize("text, rtl, expected", REORDER_CASES)
+def test_reorder_line(text, rtl, expected):
+    assert reorder_line(text, rtl) == expected
+
+
+def test_reorder_line_ltr_text_unchanged():
+    assert reorder_line("plain text, 123.", False) == "plain text, 123."
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("مرحبا", True),
+    ("hello مرحبا", False),
+    ("123 مرحبا", True),
+    ("", False),
+])
+def test_base_direction(text, expected):
+    assert bool(base_direction(text)) == expected
+
+
+@pytest.fixture
+def arabic_font(font_path):
+    from PIL import ImageFont
+    return ImageFont.truetype(font_path("NotoSansArabic-Regular.ttf"), 24)
+
+
+@pytest.mark.parametrize("text, expected", [
+    # 词首、词尾与独立形式，拉姆-阿利夫按前一个字母是否连接选择词尾或独立连字
+    ("سلام", "ﺳﻼﻡ"),
+    ("لا", "ﻻ"),
+    ("بلا", "ﺑﻼ"),
+    # 透明的元音符号不打断连接
+    ("بَب", "ﺑَﺐ"),
+    # 只向右连接的字母（د、ا）不与后一个字母连接
+    ("داد", "ﺩﺍﺩ"),
+    ("باب", "ﺑﺎﺏ"),
+])
+def test_shape_arabic(arabic_font, text, expected):
+    assert shape_arabic(text, arabic_font) == expected
+
+
+def test_shape_arabic_keeps_characters_missing_from_font(font_path):
+    from PIL import ImageFont
+    latin = ImageFont.truetype(font_path("NotoSans-Regular.ttf"), 24)
+    assert shape_arabic("سلام", latin) == "سلام"
+
+
+def test_reorder_indic_moves_pre_base_matra():
+    # कि：前置元音ि移到辅音之前；क्षि：移到整个辅音簇之前
+    assert reorder_indic("कि") == "िक"
+    assert reorder_indic("क्षि") == "िक्ष"
+
+
+def test_shape_lines_caches_raqm_line_breaks(arabic_font, monkeypatch):
+    from chat_bubbles import text_shaping
+    monkeypatch.setattr(text_shaping, "_raqm", True)
+    text_shaping.clear_shaping_cache()
+    text = "مرحبا بالعالم، كيف حالك اليوم؟"
+
+    lines, directions = text_shaping.shape_lines(text, arabic_font, 120)
+    assert text_shaping.shaping_stats()["run_misses"] == 1
+    # 有raqm时行保持逻辑顺序，由raqm在测量和绘制时整形
+    assert "".join(lines).replace(" ", "") == text.replace(" ", "")
+    assert all(directions)
+
+    assert text_shaping.shape_lines(text, arabic_font, 120) == (lines, directions)
+    assert text_shaping.shaping_stats()["run_hits"] == 1
+    # 宽度不同时重新断行
+    text_shaping.shape_lines(text, arabic_font, 240)
+    assert text_shaping.shaping_stats()["run_misses"] == 2
+    text_shaping.clear_shaping_cache()
@@ -0,0 +1,206 @@
+import threading
+import unicodedata
+
+# 每个字体缓存的片段宽度上限，超出后清空该字体的缓存
+MAX_SEGMENTS_PER_FONT = 8192
+
+# 行首禁则：这些标点不能出现在行首，会附着到前一个片段
+_NO_LINE_START = set("，。、；：？！）》」』】〕〉”’…—,.;:?!)]}%")
+# 行尾禁则：这些标点不能出现在行尾，会与后一个片段合并
+_NO_LINE_END = set("（《「『【〔〈“‘([{")
+
+_lock = threading.Lock()
+_advance_cache = {}
+_counters = {
+    "advance_calls": 0,
+    "advance_hits": 0,
+    "bbox_calls": 0,
+}
+
+
+def _font_key(font):
+    """字体缓存键：文件路径字体使用(路径, 字号, 索引)，其他字体使用对象id"""
+    path = getattr(font, "path", None)
+    if isinstance(path, str):
+        return (path, getattr(font, "size", None), getattr(font, "index", 0))
+    return ("id", id(font))
+
+
+def _is_wide(char):
+    """CJK表意文字、假名、全角符号等可以在任意两个字符之间断行"""
+    code = ord(char)
+    return (
+        0x1100 <= code <= 0x11FF or    # 谚文字母
+        0x2E80 <= code <= 0x9FFF or    # CJK部首、标点、假名、表意文字
+        0xAC00 <= code <= 0xD7AF or    # 谚文音节
+        0xF900 <= code <= 0xFAFF or    # CJK兼容表意文字
+        0xFF00 <= code <= 0xFFEF or    # 全角字符
+        0x20000 <= code <= 0x3FFFF      # CJK扩展区
+    )
+
+
+def _is_thai(char):
+    return 0x0E00 <= ord(char) <= 0x0E7F
+
+
+def _is_mark(char):
+    """组合字符（元音符号、声调等）必须与前一个字符保持在同一簇中"""
+    return unicodedata.category(char) in ("Mn", "Mc", "Me")
+
+
+def _clusters(text):
+    """将文本切分为字素簇（基字符加后续组合字符）"""
+    clusters = []
+    for char in text:
+        if clusters and (_is_mark(char) or char == "\u200d"):
+            clusters[-1] += char
+        else:
+            clusters.append(char)
+    return clusters
+
+
+def segment_text(text):
+    """
+    将一段文本切分为可断行的片段：
+    拉丁、西里尔、天城文等按空格分词（片段包含尾随空格）；
+    CJK与泰文在字素簇之间均可断行（泰文没有词典，按字素簇断行）；
+    行首/行尾禁则标点会与相邻片段合并。
+    """
+    segments = []
+    word = ""
+    for cluster in _clusters(text):
+        base = cluster[0]
+        if base.isspace():
+            # 空格之后是断行机会，空格留在片段末尾
+            if word or not segments:
+                segments.append(word + cluster)
+            else:
+                segments[-1] += cluster
+            word = ""
+        elif _is_wide(base) or _is_thai(base):
+            # 每个CJK/泰文字素簇单独成段
+            if word:
+                segments.append(word)
+                word = ""
+            segments.append(cluster)
+        else:
+            word += cluster
+    if word:
+        segments.append(word)
+
+    # 应用禁则：行首禁则标点并入前一片段，行尾禁则标点并入后一片段
+    merged = []
+    carry = ""
+    for seg in segments:
+        seg = carry + seg
+        carry = ""
+        if merged and seg[0] in _NO_LINE_START:
+            merged[-1] += seg
+        elif seg.rstrip() and seg.rstrip()[-1] in _NO_LINE_END and not seg[-1].isspace():
+            carry = seg
+        else:
+            merged.append(seg)
+    if carry:
+        merged.append(carry)
+    return merged
+
+
+def measure_advance(font, segment):
+    """返回片段的像素前进宽度，按(字体, 字号)缓存"""
+    key = _font_key(font)
+    with _lock:
+        widths = _advance_cache.get(key)
+        if widths is not None and segment in widths:
+            _counters["advance_hits"] += 1
+            return widths[segment]
+
+    width = font.getlength(segment)
+
+    with _lock:
+        _counters["advance_calls"] += 1
+        widths = _advance_cache.setdefault(key, {})
+        if len(widths) >= MAX_SEGMENTS_PER_FONT:
+            widths.clear()
+        widths[segment] = width
+    return width
+
+
+def _split_long(segment, font, max_width):
+    """把超出最大宽度的单个片段按字素簇拆开"""
+    pieces = []
+    piece = ""
+    width = 0
+    for cluster in _clusters(segment):
+        advance = measure_advance(font, cluster)
+        if piece and width + advance > max_width:
+            pieces.append(piece)
+            piece = ""
+            width = 0
+        piece += cluster
+        width += advance
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def wrap_text(text, font, max_width):
+    """
+    按实际像素宽度断行，返回行列表。
+    显式换行符会强制换行，空行会被忽略；行首空白会被去掉。
+    """
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        width = 0
+        for segment in segment_text(paragraph):
+            if not line:
+                segment = segment.lstrip()
+                if not segment:
+                    continue
+            stripped = segment.rstrip()
+            advance = measure_advance(font, segment)
+            fit = width + (measure_advance(font, stripped) if stripped != segment else advance)
+            if line and fit > max_width:
+                lines.append(line.rstrip())
+                line = ""
+                width = 0
+                segment = segment.lstrip()
+                if not segment:
+                    continue
+                stripped = segment.rstrip()
+                advance = measure_advance(font, segment)
+                fit = measure_advance(font, stripped) if stripped != segment else advance
+            if not line and fit > max_width:
+                pieces = _split_long(segment, font, max_width)
+                lines.extend(piece.rstrip() for piece in pieces[:-1])
+                segment = pieces[-1]
+                advance = measure_advance(font, segment)
+            line += segment
+            width += advance
+        if line.strip():
+            lines.append(line.rstrip())
+    return lines
+
+
+def measure_lines(lines, font):
+    """每行只调用一次getbbox，返回与lines一一对应的边界框列表"""
+    with _lock:
+        _counters["bbox_calls"] += len(lines)
+    return [font.getbbox(line) for line in lines]
+
+
+def layout_stats():
+    """返回片段宽度缓存的命中统计与getbbox调用次数"""
+    with _lock:
+        stats = dict(_counters)
+        stats["fonts_cached"] = len(_advance_cache)
+        stats["segments_cached"] = sum(len(widths) for widths in _advance_cache.values())
+    return stats
+
+
+def clear_layout_cache():
+    """清空片段宽度缓存并重置计数"""
+    with _lock:
+        _advance_cache.clear()
+        for name in _counters:
+            _counters[name] = 0
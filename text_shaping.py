@@ -0,0 +1,458 @@
+import threading
+import unicodedata
+from .text_layout import _font_key, wrap_text
+from .font_fallback import get_coverage_index
+from .instrumentation import count
+from .lazy_import import lazy_module
+
+features = lazy_module("PIL.features")
+
+# 节点上的布局方向：从右到左时气泡左右镜像（发送者在左侧），自动按语言配置中的direction决定
+LAYOUT_DIRECTIONS = ["从左到右", "从右到左", "自动"]
+
+# 每个字体缓存的整形结果上限，超出后清空该字体的缓存
+MAX_RUNS_PER_FONT = 4096
+
+_RTL_CLASSES = ("R", "AL")
+_STRONG_CLASSES = ("L", "R", "AL")
+# 中性字符（UAX#9 N1/N2）；显式嵌入与隔离控制符按中性字符处理
+_NEUTRAL_CLASSES = ("B", "S", "WS", "ON", "BN", "LRE", "RLE", "LRO", "RLO", "PDF", "LRI", "RLI", "FSI", "PDI")
+
+# 阿拉伯字母的表现形式：(独立, 词尾, 词首, 词中)，只向右连接的字母只有前两个
+_ARABIC_FORMS = {}
+for _char, _start, _forms in (
+        ("\u0622", 0xFE81, 2), ("\u0623", 0xFE83, 2), ("\u0624", 0xFE85, 2), ("\u0625", 0xFE87, 2),
+        ("\u0626", 0xFE89, 4), ("\u0627", 0xFE8D, 2), ("\u0628", 0xFE8F, 4), ("\u0629", 0xFE93, 2),
+        ("\u062A", 0xFE95, 4), ("\u062B", 0xFE99, 4), ("\u062C", 0xFE9D, 4), ("\u062D", 0xFEA1, 4),
+        ("\u062E", 0xFEA5, 4), ("\u062F", 0xFEA9, 2), ("\u0630", 0xFEAB, 2), ("\u0631", 0xFEAD, 2),
+        ("\u0632", 0xFEAF, 2), ("\u0633", 0xFEB1, 4), ("\u0634", 0xFEB5, 4), ("\u0635", 0xFEB9, 4),
+        ("\u0636", 0xFEBD, 4), ("\u0637", 0xFEC1, 4), ("\u0638", 0xFEC5, 4), ("\u0639", 0xFEC9, 4),
+        ("\u063A", 0xFECD, 4), ("\u0641", 0xFED1, 4), ("\u0642", 0xFED5, 4), ("\u0643", 0xFED9, 4),
+        ("\u0644", 0xFEDD, 4), ("\u0645", 0xFEE1, 4), ("\u0646", 0xFEE5, 4), ("\u0647", 0xFEE9, 4),
+        ("\u0648", 0xFEED, 2), ("\u0649", 0xFEEF, 2), ("\u064A", 0xFEF1, 4),
+        # 波斯文、乌尔都文常用字母
+        ("\u067E", 0xFB56, 4), ("\u0686", 0xFB7A, 4), ("\u0698", 0xFB8A, 2), ("\u06A9", 0xFB8E, 4),
+        ("\u06AF", 0xFB92, 4), ("\u06CC", 0xFBFC, 4)):
+    _ARABIC_FORMS[_char] = tuple(chr(_start + i) for i in range(_forms))
+
+# 拉姆与阿利夫的连字：(独立, 词尾)
+_LAM_ALEF = {
+    "\u0622": ("\uFEF5", "\uFEF6"),
+    "\u0623": ("\uFEF7", "\uFEF8"),
+    "\u0625": ("\uFEF9", "\uFEFA"),
+    "\u0627": ("\uFEFB", "\uFEFC"),
+}
+
+# 印度系文字中写在辅音之前的元音符号（前置元音）与对应文字的半音符（virama）
+_PRE_BASE_MATRAS = {
+    "\u093F": "\u094D",                                  # 天城文
+    "\u09BF": "\u09CD", "\u09C7": "\u09CD", "\u09C8": "\u09CD",  # 孟加拉文
+    "\u0A3F": "\u0A4D",                                  # 古木基文
+    "\u0ABF": "\u0ACD",                                  # 古吉拉特文
+    "\u0B47": "\u0B4D",                                  # 奥里亚文
+    "\u0BC6": "\u0BCD", "\u0BC7": "\u0BCD", "\u0BC8": "\u0BCD",  # 泰米尔文
+    "\u0D46": "\u0D4D", "\u0D47": "\u0D4D", "\u0D48": "\u0D4D",  # 马拉雅拉姆文
+}
+
+# 从右到左的片段中需要镜像的成对符号
+_MIRRORS = {}
+for _pair in ("()", "[]", "{}", "<>", "\u00AB\u00BB", "\u2039\u203A", "\u2264\u2265",
+              "\u3008\u3009", "\u300A\u300B", "\u300C\u300D", "\u300E\u300F", "\u3010\u3011", "\u3014\u3015"):
+    _MIRRORS[_pair[0]] = _pair[1]
+    _MIRRORS[_pair[1]] = _pair[0]
+
+# UAX#9 BD16中的成对括号：左括号 -> 右括号（取自BidiBrackets.txt的常用部分）
+_BRACKETS = {}
+for _pair in ("()", "[]", "{}", "\u2045\u2046", "\u207D\u207E", "\u208D\u208E", "\u2308\u2309", "\u230A\u230B",
+              "\u2329\u232A", "\u27E6\u27E7", "\u27E8\u27E9", "\u27EA\u27EB", "\u27EC\u27ED", "\u27EE\u27EF",
+              "\u3008\u3009", "\u300A\u300B", "\u300C\u300D", "\u300E\u300F", "\u3010\u3011", "\u3014\u3015",
+              "\u3016\u3017", "\u3018\u3019", "\u301A\u301B", "\uFE59\uFE5A", "\uFE5B\uFE5C", "\uFE5D\uFE5E",
+              "\uFF08\uFF09", "\uFF3B\uFF3D", "\uFF5B\uFF5D", "\uFF5F\uFF60", "\uFF62\uFF63"):
+    _BRACKETS[_pair[0]] = _pair[1]
+_CLOSING_BRACKETS = set(_BRACKETS.values())
+# 与左右尖括号规范等价的字符，配对时视为同一个括号
+_BRACKET_EQUIVALENTS = {"\u2329": "\u3008", "\u232A": "\u3009"}
+# BD16括号栈的深度上限
+_MAX_BRACKET_DEPTH = 63
+
+_lock = threading.Lock()
+_runs = {}
+_raqm = None
+_counters = {
+    "run_hits": 0,
+    "run_misses": 0,
+}
+
+
+def has_raqm():
+    """Pillow是否带有libraqm（复杂文字布局），有时整形与双向重排都交给raqm完成"""
+    global _raqm
+    if _raqm is None:
+        _raqm = bool(features.check_feature("raqm"))
+    return _raqm
+
+
+def base_direction(text):
+    """段落的基本方向（UAX#9 P2/P3）：第一个强方向字符为R/AL时从右到左，否则从左到右"""
+    for char in text:
+        bidi = unicodedata.bidirectional(char)
+        if bidi in _STRONG_CLASSES:
+            return bidi in _RTL_CLASSES
+    return False
+
+
+def _covers(font, char):
+    """字体（或回退字体链中的任一字体）是否包含该字符"""
+    if hasattr(font, "covers"):
+        return font.covers(char)
+    path = getattr(font, "path", None)
+    return isinstance(path, str) and get_coverage_index().covers(path, char)
+
+
+def _joining(char):
+    """阿拉伯字母的连接类型：D双向、R只向右、C连接符（tatweel/ZWJ）、T透明（组合符号）、U不连接"""
+    forms = _ARABIC_FORMS.get(char)
+    if forms is not None:
+        return "D" if len(forms) == 4 else "R"
+    if char in ("\u0640", "\u200D"):  # tatweel与零宽连接符
+        return "C"
+    if unicodedata.category(char) == "Mn":
+        return "T"
+    return "U"
+
+
+def shape_arabic(text, font):
+    """
+    按上下文把阿拉伯字母替换为独立/词首/词中/词尾表现形式，并合成拉姆-阿利夫连字，结果仍为逻辑顺序。
+    字体不包含某个表现形式时保留原字符。
+    """
+    types = [_joining(char) for char in text]
+    result = []
+    prev_joins = False  # 前一个非透明字符是否向左（逻辑顺序的后方）连接
+    i = 0
+    while i < len(text):
+        char, kind = text[i], types[i]
+        if kind == "T":
+            result.append(char)
+            i += 1
+            continue
+        if kind == "U":
+            result.append(char)
+            prev_joins = False
+            i += 1
+            continue
+        if kind == "C":
+            result.append(char)
+            prev_joins = True
+            i += 1
+            continue
+
+        if char == "\u0644" and i + 1 < len(text) and text[i + 1] in _LAM_ALEF:
+            ligature = _LAM_ALEF[text[i + 1]][1 if prev_joins else 0]
+            if _covers(font, ligature):
+                result.append(ligature)
+                prev_joins = False
+                i += 2
+                continue
+
+        next_joins = False
+        for j in range(i + 1, len(text)):
+            if types[j] != "T":
+                next_joins = kind == "D" and types[j] in ("D", "R", "C")
+                break
+        forms = _ARABIC_FORMS[char]
+        if prev_joins and next_joins:
+            form = forms[3]
+        elif next_joins:
+            form = forms[2]
+        elif prev_joins:
+            form = forms[1]
+        else:
+            form = forms[0]
+        result.append(form if _covers(font, form) else char)
+        prev_joins = kind == "D"
+        i += 1
+    return "".join(result)
+
+
+def _bracket_pairs(line, types):
+    """UAX#9 BD16：按左括号位置排序的成对括号位置列表，只考虑当前类型仍为ON的括号"""
+    pairs = []
+    stack = []
+    for i, char in enumerate(line):
+        if types[i] != "ON":
+            continue
+        if char in _BRACKETS:
+            if len(stack) == _MAX_BRACKET_DEPTH:
+                break
+            closing = _BRACKETS[char]
+            stack.append((_BRACKET_EQUIVALENTS.get(closing, closing), i))
+        elif char in _CLOSING_BRACKETS:
+            char = _BRACKET_EQUIVALENTS.get(char, char)
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth][0] == char:
+                    pairs.append((stack[depth][1], i))
+                    del stack[depth:]
+                    break
+    return sorted(pairs)
+
+
+def _resolve_brackets(line, types, original, sor):
+    """
+    UAX#9 N0：括号内有与段落方向相同的强类型时括号取段落方向；只有相反方向的强类型时，
+    左括号之前最近的强类型也是相反方向则取相反方向，否则取段落方向；括号内没有强类型时保持中性。
+    数字在这里按R计算，括号之后原本为组合字符的字符跟随括号的方向。
+    """
+    def strong(kind):
+        return "L" if kind == "L" else "R" if kind in ("R", "EN", "AN") else None
+
+    for start, end in _bracket_pairs(line, types):
+        inside = {strong(kind) for kind in types[start + 1:end]}
+        if sor in inside:
+            direction = sor
+        elif inside - {None}:
+            # 左括号之前最近的强类型（没有时为段落方向）
+            direction = next((strong(kind) for kind in reversed(types[:start]) if strong(kind)), sor)
+        else:
+            continue
+        for index in (start, end):
+            types[index] = direction
+            index += 1
+            while index < len(types) and original[index] == "NSM":
+                types[index] = direction
+                index += 1
+
+
+def _resolve_types(types, level, line=""):
+    """UAX#9 W1-W7与N0-N2：解析弱类型与中性字符，返回只含L/R/EN/AN的类型列表（line为对应的文本，用于括号配对）"""
+    sor = "R" if level % 2 else "L"
+    original = list(types)
+
+    # W1：组合字符取前一个字符的类型
+    prev = sor
+    for i, kind in enumerate(types):
+        if kind == "NSM":
+            types[i] = prev
+        else:
+            prev = kind
+
+    # W2：阿拉伯字母之后的欧洲数字视为阿拉伯数字；W3：AL改为R
+    last_strong = sor
+    for i, kind in enumerate(types):
+        if kind in _STRONG_CLASSES:
+            last_strong = kind
+        elif kind == "EN" and last_strong == "AL":
+            types[i] = "AN"
+    types[:] = ["R" if kind == "AL" else kind for kind in types]
+
+    # W4：两个数字之间的单个分隔符
+    for i in range(1, len(types) - 1):
+        before, kind, after = types[i - 1], types[i], types[i + 1]
+        if kind == "ES" and before == after == "EN":
+            types[i] = "EN"
+        elif kind == "CS" and before == after and before in ("EN", "AN"):
+            types[i] = before
+
+    # W5：与欧洲数字相邻的连续ET（货币、百分号等）归入数字
+    i = 0
+    while i < len(types):
+        if types[i] != "ET":
+            i += 1
+            continue
+        j = i
+        while j < len(types) and types[j] == "ET":
+            j += 1
+        if (i > 0 and types[i - 1] == "EN") or (j < len(types) and types[j] == "EN"):
+            types[i:j] = ["EN"] * (j - i)
+        i = j
+
+    # W6：其余分隔符与终止符视为中性；W7：前一个强类型为L时欧洲数字视为L
+    last_strong = sor
+    for i, kind in enumerate(types):
+        if kind in ("ES", "ET", "CS"):
+            types[i] = "ON"
+        elif kind in ("L", "R"):
+            last_strong = kind
+        elif kind == "EN" and last_strong == "L":
+            types[i] = "L"
+
+    # N0：成对括号
+    if line:
+        _resolve_brackets(line, types, original, sor)
+
+    # N1/N2：中性字符序列两侧方向相同时取该方向，否则取段落方向（数字按R计算）
+    i = 0
+    while i < len(types):
+        if types[i] not in _NEUTRAL_CLASSES:
+            i += 1
+            continue
+        j = i
+        while j < len(types) and types[j] in _NEUTRAL_CLASSES:
+            j += 1
+        before = sor if i == 0 else ("L" if types[i - 1] == "L" else "R")
+        after = sor if j == len(types) else ("L" if types[j] == "L" else "R")
+        types[i:j] = [before if before == after else sor] * (j - i)
+        i = j
+    return types
+
+
+def reorder_line(line, rtl):
+    """
+    将一行逻辑顺序的文本重排为从左到右绘制的视觉顺序（简化的UAX#9，不处理显式嵌入控制符）：
+    解析每个字符的嵌入层级后逐层反转，从右到左片段中的括号等成对符号镜像。
+    """
+    level = 1 if rtl else 0
+    types = _resolve_types([unicodedata.bidirectional(char) or "L" for char in line], level, line)
+
+    # I1/I2：确定每个字符的层级
+    levels = []
+    for kind in types:
+        if level % 2 == 0:
+            levels.append(level + (1 if kind == "R" else 2 if kind in ("EN", "AN") else 0))
+        else:
+            levels.append(level + (1 if kind in ("L", "EN", "AN") else 0))
+    # L1：行尾空白恢复为段落层级
+    for i in range(len(line) - 1, -1, -1):
+        if not line[i].isspace():
+            break
+        levels[i] = level
+
+    chars = [_MIRRORS.get(char, char) if lvl % 2 else char for char, lvl in zip(line, levels)]
+    if max(levels, default=0) == 0:
+        return "".join(chars)
+
+    # L2：从最高层级到最低的奇数层级，逐层反转连续片段（全部为偶数层级时不反转）
+    order = list(range(len(chars)))
+    lowest_odd = min(lvl | 1 for lvl in levels)
+    for target in range(max(levels), lowest_odd - 1, -1):
+        i = 0
+        while i < len(order):
+            if levels[order[i]] < target:
+                i += 1
+                continue
+            j = i
+            while j < len(order) and levels[order[j]] >= target:
+                j += 1
+            order[i:j] = order[i:j][::-1]
+            i = j
+
+    # 反转后组合字符位于基字符之前，需要移回基字符之后，FreeType才能正确定位
+    visual = [chars[index] for index in order]
+    result = []
+    marks = []
+    for index, char in zip(order, visual):
+        if levels[index] % 2 and unicodedata.category(char) in ("Mn", "Me"):
+            marks.append(char)
+            continue
+        result.append(char)
+        if marks:
+            result.extend(reversed(marks))
+            marks = []
+    result.extend(marks)
+    return "".join(result)
+
+
+def reorder_indic(line):
+    """把印度系文字的前置元音移到所属辅音簇之前（如天城文的ि），其他整形规则（如reph）需要raqm"""
+    if not any(char in _PRE_BASE_MATRAS for char in line):
+        return line
+    chars = list(line)
+    for i, char in enumerate(chars):
+        virama = _PRE_BASE_MATRAS.get(char)
+        if virama is None or i == 0:
+            continue
+        # 向前找到辅音簇的起点：辅音(+nukta)(+virama+辅音)*
+        start = i - 1
+        while start > 0 and unicodedata.category(chars[start]) == "Mn" and chars[start] != virama:
+            start -= 1
+        while start >= 2 and chars[start - 1] == virama and unicodedata.category(chars[start - 2]) == "Lo":
+            start -= 2
+        if unicodedata.category(chars[start]) != "Lo":
+            continue
+        chars[start + 1:i + 1] = chars[start:i]
+        chars[start] = char
+    return "".join(chars)
+
+
+def _cached(kind, text, font, rtl, build):
+    """按(文本, 字体, 字号, 方向)缓存整形结果"""
+    key = _font_key(font)
+    with _lock:
+        runs = _runs.get(key)
+        if runs is not None:
+            result = runs.get((kind, text, rtl))
+            if result is not None:
+                _counters["run_hits"] += 1
+                count("shaped_run_hits")
+                return result
+
+    result = build()
+
+    with _lock:
+        _counters["run_misses"] += 1
+        runs = _runs.setdefault(key, {})
+        if len(runs) >= MAX_RUNS_PER_FONT:
+            runs.clear()
+        runs[(kind, text, rtl)] = result
+    count("shaped_run_misses")
+    return result
+
+
+def _needs_shaping(text):
+    """文本中是否有需要阿拉伯字形替换、双向重排或前置元音重排的字符"""
+    for char in text:
+        code = ord(char)
+        if 0x0590 <= code <= 0x08FF or 0x0900 <= code <= 0x0DFF or 0xFB1D <= code <= 0xFEFF or 0x200E <= code <= 0x202E:
+            return True
+    return False
+
+
+def shape_lines(text, font, max_width):
+    """
+    断行并整形，返回(行列表, 每行是否从右到左)。
+    有raqm时整形与双向重排在测量和绘制时由raqm完成，这里只断行：raqm每次测量都会重新整形，
+    需要整形的段落的断行结果按(段落, 字体, 字号, 方向, 宽度)缓存，绘制时的整形仍由raqm完成；
+    否则先把阿拉伯字母替换为表现形式（逻辑顺序，断行测量的是连写后的宽度），断行后再把每行重排为视觉顺序。
+    """
+    lines = []
+    directions = []
+    for paragraph in text.split("\n"):
+        if not paragraph.strip():
+            continue
+        rtl = base_direction(paragraph)
+        needs_shaping = _needs_shaping(paragraph)
+        if has_raqm() and needs_shaping:
+            wrapped = _cached(("wrapped", max_width), paragraph, font, rtl,
+                              lambda: tuple(wrap_text(paragraph, font, max_width)))
+            lines.extend(wrapped)
+            directions.extend([rtl] * len(wrapped))
+            continue
+        if not needs_shaping:
+            wrapped = wrap_text(paragraph, font, max_width)
+            lines.extend(wrapped)
+            directions.extend([rtl] * len(wrapped))
+            continue
+
+        shaped = _cached("paragraph", paragraph, font, rtl, lambda: shape_arabic(paragraph, font))
+        for line in wrap_text(shaped, font, max_width):
+            lines.append(_cached("line", line, font, rtl, lambda: reorder_indic(reorder_line(line, rtl))))
+            directions.append(rtl)
+    return lines, directions
+
+
+def shaping_stats():
+    """返回整形结果缓存的命中统计"""
+    with _lock:
+        stats = dict(_counters)
+        stats["fonts_cached"] = len(_runs)
+        stats["runs_cached"] = sum(len(runs) for runs in _runs.values())
+        stats["raqm"] = has_raqm() if _raqm is not None else None
+    return stats
+
+
+def clear_shaping_cache():
+    """清空整形结果缓存并重置计数"""
+    with _lock:
+        _runs.clear()
+        for name in _counters:
+            _counters[name] = 0
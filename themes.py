@@ -0,0 +1,148 @@
+import os
+import json
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from .font_cache import FONT_DIR
+from .bubble_shapes import BUBBLE_STYLES, register_styles
+from .bubble_logging import log_warning
+from .lazy_import import lazy_module
+
+ImageColor = lazy_module("PIL.ImageColor")
+
+# 主题预设文件，与font_config.json放在同一目录
+THEMES_PATH = os.path.join(FONT_DIR, "themes.json")
+
+# 节点上表示不使用主题的选项
+NO_THEME = "无"
+
+# side为"右侧"或"左侧"；style为样式名称（自定义形状注册为"主题名/右侧"），颜色同时保存原始字符串与解析后的RGBA
+SideTheme = namedtuple("SideTheme", ["style", "bubble_color", "text_color", "bubble_rgba", "text_rgba"])
+Theme = namedtuple("Theme", ["name", "background", "background_rgba", "sides"])
+
+
+@lru_cache(maxsize=1024)
+def parse_color(value):
+    """将#RRGGBB、#RRGGBBAA等颜色字符串解析为RGBA元组，结果按字符串缓存；无法解析时抛出ValueError"""
+    rgb = ImageColor.getrgb(value)
+    return rgb + (255,) if len(rgb) == 3 else rgb
+
+
+def _shape_spec(shape, fallback_style):
+    """主题中的shape以base指定的内置样式为基础，覆盖其中的参数（列表转换为元组以便比较与缓存）"""
+    base = shape.get("base", fallback_style)
+    spec = dict(BUBBLE_STYLES.get(base, BUBBLE_STYLES["普通"]))
+    for key, value in shape.items():
+        if key == "base":
+            continue
+        if key == "points":
+            value = tuple(tuple(point) for point in value)
+        elif isinstance(value, list):
+            value = tuple(value)
+        spec[key] = value
+    return spec
+
+
+def _theme_styles(entry):
+    """主题中自定义的形状，返回{形状名称: 几何参数}"""
+    styles = {}
+    for side in ("右侧", "左侧"):
+        config = entry.get("sides", {}).get(side, {})
+        if "shape" in config:
+            styles[f"{entry['name']}/{side}"] = _shape_spec(config["shape"], config.get("style", "普通"))
+    return styles
+
+
+def _build_theme(entry):
+    """解析主题的调色板，颜色在这里一次性解析为RGBA"""
+    sides = {}
+    for side in ("右侧", "左侧"):
+        config = entry.get("sides", {}).get(side, {})
+        style = f"{entry['name']}/{side}" if "shape" in config else config.get("style", "普通")
+        bubble_color = config.get("bubble_color", "#FFFFFF")
+        text_color = config.get("text_color", "#000000")
+        sides[side] = SideTheme(style, bubble_color, text_color, parse_color(bubble_color), parse_color(text_color))
+    background = entry.get("background", "#FFFFFF")
+    return Theme(entry["name"], background, parse_color(background), sides)
+
+
+class ThemeCache:
+    """
+    进程级主题缓存：themes.json按文件mtime失效，重新加载时注册自定义形状；
+    调色板在第一次使用某个主题时解析并缓存，列出主题选项不需要导入PIL
+    """
+
+    def __init__(self, themes_path=THEMES_PATH):
+        self.themes_path = themes_path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._mtime = None
+        self._themes = {}
+
+    def get_entries(self):
+        """返回{主题名: 主题配置}，文件修改后自动重新加载；文件不存在或损坏时返回空字典"""
+        try:
+            mtime = os.stat(self.themes_path).st_mtime_ns
+        except OSError:
+            return {}
+
+        with self._lock:
+            if self._entries is not None and self._mtime == mtime:
+                return self._entries
+
+        styles = {}
+        try:
+            with open(self.themes_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            entries = {entry["name"]: entry for entry in config.get("themes", [])}
+            for entry in entries.values():
+                styles.update(_theme_styles(entry))
+        except Exception as e:
+            log_warning(f"无法加载主题文件: {e}")
+            return {}
+
+        register_styles(styles)
+        with self._lock:
+            self._entries = entries
+            self._mtime = mtime
+            self._themes = {}
+        return entries
+
+    def get_theme(self, name):
+        """返回指定名称的主题（Theme），不使用主题或主题不存在时返回None"""
+        if not name or name == NO_THEME:
+            return None
+        entry = self.get_entries().get(name)
+        if entry is None:
+            log_warning(f"主题不存在: {name}")
+            return None
+        with self._lock:
+            theme = self._themes.get(name)
+        if theme is None:
+            try:
+                theme = _build_theme(entry)
+            except (KeyError, ValueError) as e:
+                log_warning(f"主题 {name} 的颜色无法解析: {e}")
+                return None
+            with self._lock:
+                self._themes[name] = theme
+        return theme
+
+    def get_names(self):
+        """返回节点上的主题选项"""
+        return [NO_THEME] + list(self.get_entries())
+
+    def clear(self):
+        with self._lock:
+            self._entries = None
+            self._mtime = None
+            self._themes = {}
+
+
+# 全局共享的主题缓存实例
+_theme_cache = ThemeCache()
+
+
+def get_theme_cache():
+    """获取进程级共享的主题缓存"""
+    return _theme_cache
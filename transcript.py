@@ -0,0 +1,178 @@
+import os
+import io
+import csv
+import json
+from .bubble_logging import log_info, log_warning
+
+# 未在映射中指定字段名时，依次尝试的列名/键名（不区分大小写）
+DEFAULT_FIELDS = {
+    "speaker": ("speaker", "from", "sender", "author", "name", "user", "说话人", "发送者"),
+    "text": ("text", "message", "content", "body", "消息", "内容"),
+    "time": ("time", "date", "timestamp", "时间"),
+}
+
+# 说话人映射中可以为每个说话人设置的字段，与消息列表中的字段相同
+SPEAKER_KEYS = ("side", "style", "bubble_color", "text_color", "show_tail", "language", "font_size")
+
+_EXTENSION_FORMATS = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv", ".tsv": "csv"}
+
+DEFAULT_SCHEMA = '''{
+  "fields": {},
+  "speakers": {
+    "我": {"side": "右侧"},
+    "*": {"side": "左侧"}
+  }
+}'''
+
+
+def is_transcript_file(source):
+    """source是否为存在的聊天记录文件路径（而不是直接粘贴的内容）"""
+    return "\n" not in source and len(source) < 4096 and os.path.isfile(os.path.expanduser(source))
+
+
+def _detect_format(source, is_file):
+    """根据扩展名或内容判断格式：json、jsonl或csv"""
+    if is_file:
+        fmt = _EXTENSION_FORMATS.get(os.path.splitext(source)[1].lower())
+        if fmt is not None:
+            return fmt
+        with open(source, "r", encoding="utf-8-sig") as f:
+            head = f.read(4096)
+    else:
+        head = source[:4096]
+    head = head.lstrip()
+    if head.startswith("["):
+        return "json"
+    if head.startswith("{"):
+        # 每行一个对象时为JSON Lines，否则为单个JSON对象（例如{"messages": [...]}导出格式）
+        first_line = head.splitlines()[0].strip()
+        try:
+            json.loads(first_line)
+        except ValueError:
+            return "json"
+        return "jsonl"
+    return "csv"
+
+
+def _json_records(data):
+    """从JSON导出中取出消息列表：顶层数组，或对象中的messages/chats字段"""
+    if isinstance(data, dict):
+        for key in ("messages", "chats", "items", "消息"):
+            if isinstance(data.get(key), list):
+                return data[key]
+        return [data]
+    return data if isinstance(data, list) else []
+
+
+def iter_transcript(source):
+    """
+    逐条读取聊天记录，source为文件路径或文件内容。支持JSON数组、{"messages": [...]}形式的导出、
+    JSON Lines与CSV（第一行为列名，也支持制表符分隔）。JSON Lines与CSV逐行读取，不需要把整个文件载入内存。
+    每条记录为字典，纯字符串记录会转换为{"text": 字符串}。
+    """
+    source = (source or "").strip()
+    if not source:
+        return
+    is_file = is_transcript_file(source)
+    if is_file:
+        source = os.path.expanduser(source)
+    fmt = _detect_format(source, is_file)
+
+    stream = open(source, "r", encoding="utf-8-sig", newline="") if is_file else io.StringIO(source, newline="")
+    with stream:
+        if fmt == "json":
+            records = _json_records(json.load(stream))
+        elif fmt == "jsonl":
+            # 单行的{"messages": [...]}导出也会被识别为JSON Lines，因此每行同样展开messages字段
+            records = (record for line in stream if line.strip() for record in _json_records(json.loads(line)))
+        else:
+            sample = stream.read(4096)
+            stream.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",\t;")
+            except csv.Error:
+                dialect = csv.excel
+            records = csv.DictReader(stream, dialect=dialect)
+
+        for record in records:
+            if isinstance(record, str):
+                yield {"text": record}
+            elif isinstance(record, dict):
+                yield record
+
+
+def parse_schema(text):
+    """
+    解析说话人映射：{"fields": {"speaker": 列名, "text": 列名, "time": 列名}, "speakers": {说话人: 设置}}。
+    只提供说话人设置时可以省略外层的speakers。"*"为未列出的说话人使用的设置。
+    """
+    text = (text or "").strip()
+    if not text:
+        return {}, {}
+    try:
+        schema = json.loads(text)
+    except ValueError as e:
+        log_warning(f"说话人映射JSON解析失败: {e}，将使用默认字段")
+        return {}, {}
+    if not isinstance(schema, dict):
+        return {}, {}
+    if "fields" in schema or "speakers" in schema:
+        return dict(schema.get("fields") or {}), dict(schema.get("speakers") or {})
+    return {}, schema
+
+
+def _field(record, name, fields, lowered):
+    """按映射中的列名或默认候选列名取值"""
+    if name in fields:
+        return record.get(fields[name])
+    for candidate in DEFAULT_FIELDS[name]:
+        key = lowered.get(candidate)
+        if key is not None:
+            return record.get(key)
+    return None
+
+
+def _text_of(value):
+    """消息文本；部分导出格式（例如Telegram）将带格式的文本存为字符串与对象的列表"""
+    if isinstance(value, list):
+        return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in value
+                       if isinstance(part, (str, dict)))
+    return "" if value is None else str(value)
+
+
+def iter_messages(records, schema_text):
+    """
+    将聊天记录映射为消息字典（字段与消息列表相同），说话人对应的side/style/bubble_color等来自说话人映射，
+    记录中自带的同名字段优先。映射和记录都没有指定side时，第一个出现的说话人在右侧，其他说话人在左侧。
+    没有文本的记录（例如图片、系统消息）会被跳过。
+    """
+    fields, speakers = parse_schema(schema_text)
+    default = speakers.get("*", {})
+    first_speaker = None
+    skipped = 0
+    for record in records:
+        lowered = {str(key).strip().lower(): key for key in record}
+        text = _text_of(_field(record, "text", fields, lowered)).strip()
+        if not text:
+            skipped += 1
+            continue
+
+        speaker = _field(record, "speaker", fields, lowered)
+        speaker = "" if speaker is None else str(speaker).strip()
+        message = {"text": text, "speaker": speaker}
+        for key, value in speakers.get(speaker, default).items():
+            if key in SPEAKER_KEYS:
+                message[key] = value
+        # 记录中自带的字段（例如本节点的消息列表格式）优先于说话人映射
+        for key in SPEAKER_KEYS:
+            if record.get(key) not in (None, ""):
+                message[key] = record[key]
+        if first_speaker is None:
+            first_speaker = speaker
+        message.setdefault("side", "右侧" if speaker == first_speaker else "左侧")
+        timestamp = _field(record, "time", fields, lowered)
+        if timestamp not in (None, ""):
+            message["time"] = str(timestamp)
+        yield message
+    if skipped:
+        log_info(f"聊天记录中有 {skipped} 条没有文本的消息被跳过")